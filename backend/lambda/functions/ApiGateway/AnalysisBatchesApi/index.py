@@ -0,0 +1,279 @@
+import os
+import json
+import uuid
+import botocore
+import boto3
+import api_common
+import analysis_common
+import analysis_batch
+import analysis_preflight
+import run_statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+OMICS_WORKFLOW_RUN_ROLE_ARN = os.environ['OMICS_WORKFLOW_RUN_ROLE_ARN']
+
+# ワークフローの出力先 S3 バケットのデフォルト値を環境変数から取得
+OMICS_OUTPUT_BUCKET_URL = os.environ['OMICS_OUTPUT_BUCKET_URL']
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS = os.environ['DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS']
+DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES = os.environ['DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES']
+DYNAMODB_TABLE_NAME_RUN_STATISTICS = os.environ['DYNAMODB_TABLE_NAME_RUN_STATISTICS']
+
+# バッチを非同期に開始する Lambda 関数の名前を環境変数から取得
+ANALYSIS_BATCH_SUBMITTER_FUNCTION_NAME = os.environ['ANALYSIS_BATCH_SUBMITTER_FUNCTION_NAME']
+
+# AWS リージョンを環境変数から取得
+AWS_REGION = os.environ['AWS_REGION']
+
+# 1 つのバッチに含められるサンプルの最大数
+MAX_SAMPLE_COUNT = 1000
+
+# ステートマシンの実行状態を同時に取得する数
+DESCRIBE_CONCURRENCY = 16
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+# AWS サービスのクライアントを初期化
+sfn = boto3.client('stepfunctions')
+lambdaClient = boto3.client('lambda')
+
+
+# 複数のサンプルの解析をまとめて開始する API を実装した Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    # REST API に指定されたパスを取得
+    pathParams = event.get('pathParameters') or {}
+
+    try:
+        batchId = pathParams.get('batchId')
+        if batchId:
+            # パスにバッチ ID が含まれていたら、バッチの進捗を返す
+            return handle_get_batch(batchId)
+
+        # REST API に指定されたリクエストボディを取得
+        body = event.get('body')
+        if not body:
+            return {
+                'statusCode': 400,
+                'headers': api_common.CORS_HEADERS,
+            }
+
+        # Cognito オーソライザーによってデコードされた JSON Web Token の Claim 情報から、ユーザーの情報を取得する
+        requestContext = event['requestContext']
+        claims = requestContext['authorizer']['claims']
+        userId = claims['sub']
+        email = claims['email']
+        accountId = requestContext['accountId']
+
+        headers = event['headers']
+        requestBody = json.loads(body)
+
+        return handle_start_batch(userId, email, accountId, OMICS_WORKFLOW_RUN_ROLE_ARN, headers, requestBody)
+
+    except botocore.exceptions.ClientError as err:
+        statusCode = err.response['ResponseMetadata']['HTTPStatusCode']
+        code = err.response['Error']['Code']
+        message = err.response['Error']['Message']
+        logger.exception(f'{code}: {message}')
+
+        # AWS の API からエラーレスポンスが返されたら、その内容に準じたエラーコードとメッセージを返す
+        return {
+            'statusCode': statusCode,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+    except (botocore.exceptions.BotoCoreError, ValueError, KeyError) as err:
+        code = type(err).__name__
+        message = str(err)
+        logger.exception(f'{code}: {message}')
+
+        # その他のエラーが発生したら、エラーメッセージと共に 400 Bad Request を返す
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+
+# バッチを登録し、サンプルごとのステートマシンの実行を非同期に開始する
+def handle_start_batch(userId: str, email: str, accountId: str, role: str, headers: dict, requestBody: dict) -> dict:
+    workflowType = requestBody['workflowType']
+    workflowId = requestBody['workflowId']
+    samples = requestBody.get('samples') or []
+    if not samples:
+        raise ValueError('samples must not be empty')
+    if len(samples) > MAX_SAMPLE_COUNT:
+        raise ValueError(f'samples must not exceed {MAX_SAMPLE_COUNT} items')
+
+    # Omics のワークフロー情報は全てのサンプルで共通のため、1 回だけ取得する
+    workflow = analysis_common.resolve_workflow(workflowType, workflowId, accountId, AWS_REGION)
+
+    # リクエストボディから全てのサンプルで共通の実行パラメーターを取得する
+    # サンプルごとの `parameters`、`name`、`tags` は開始時に共通の値へ上書きする
+    roleArn = requestBody.get('roleArn') or role
+    outputUri = requestBody.get('outputUri') or f"{OMICS_OUTPUT_BUCKET_URL}/{userId}/"
+    startRun = analysis_common.build_start_run(workflowType, workflowId, workflow, roleArn, outputUri, requestBody)
+    # Omics の requestId はサンプルごとに決める
+    startRun.pop('RequestId', None)
+
+    # 実行グループは全てのサンプルで共通のため、サンプルの実行を開始する前に 1 回だけ確認する
+    runGroupProblem = analysis_preflight.check_run_group(startRun.get('RunGroupId'))
+    if runGroupProblem:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': 'PreflightValidationFailed',
+                'message': runGroupProblem['message'],
+                'problems': [runGroupProblem],
+            }, default=api_common.default_serializer),
+        }
+
+    # `storageCapacity` に 'auto' が指定されたら、同じワークフローの過去の実行から推奨するストレージ容量を全てのサンプルで使う
+    # サンプルごとに入力サイズを求めると時間がかかるため、過去の実行の必要量だけから推奨する
+    if str(startRun.get('StorageCapacity', '')).lower() == 'auto':
+        storageRecommendation = run_statistics.recommend_storage_capacity(
+            DYNAMODB_TABLE_NAME_RUN_STATISTICS, workflowType, workflowId)
+        startRun.pop('StorageCapacity')
+        if storageRecommendation.get('recommendedStorageCapacity'):
+            startRun['StorageCapacity'] = storageRecommendation['recommendedStorageCapacity']
+
+    visualizers = analysis_common.get_visualizers(
+        DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS,
+        workflowType,
+        workflowId,
+        analysis_common.get_visualizer_ids(requestBody),
+        roleArn,
+    )
+    config = analysis_common.build_execution_input(
+        userId,
+        startRun,
+        visualizers,
+        analysis_common.build_notification(email, headers),
+    )
+
+    # バッチを登録し、ステートマシンの実行の開始は別の Lambda 関数に任せる
+    batchId = str(uuid.uuid4())
+    analysis_batch.create_batch(
+        DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES,
+        batchId,
+        userId,
+        requestBody.get('name') or workflow['name'],
+        config,
+        samples,
+    )
+    lambdaClient.invoke(
+        FunctionName=ANALYSIS_BATCH_SUBMITTER_FUNCTION_NAME,
+        InvocationType='Event',
+        Payload=json.dumps({
+            'BatchId': batchId,
+        }),
+    )
+
+    return {
+        'statusCode': 202,
+        'headers': {
+            'Content-Type': 'application/json',
+            **api_common.CORS_HEADERS,
+        },
+        'body': json.dumps({
+            'batchId': batchId,
+            'total': len(samples),
+        }, default=api_common.default_serializer),
+    }
+
+
+# ステートマシンの実行状態を取得する (取得できなければ None を返す)
+def describe_execution_status(executionArn: str) -> str:
+    try:
+        return sfn.describe_execution(executionArn=executionArn)['status']
+    except botocore.exceptions.ClientError as err:
+        logger.warning(f'Failed to describe execution {executionArn}: {err}')
+        return None
+
+
+# バッチの進捗を返す
+def handle_get_batch(batchId: str) -> dict:
+    summary, items = analysis_batch.get_batch(DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES, batchId)
+    if not summary:
+        return {
+            'statusCode': 404,
+            'headers': api_common.CORS_HEADERS,
+        }
+
+    # 終了していない実行だけ状態を取得し、終了した実行の状態は次回以降のためにテーブルに記録する
+    runningItems = [
+        item for item in items
+        if item.get('executionArn') and item.get('executionStatus') not in analysis_batch.EXECUTION_FINISHED_STATUSES
+    ]
+    with ThreadPoolExecutor(max_workers=DESCRIBE_CONCURRENCY) as executor:
+        statuses = list(executor.map(describe_execution_status, [item['executionArn'] for item in runningItems]))
+    for item, status in zip(runningItems, statuses):
+        if not status:
+            continue
+        if status in analysis_batch.EXECUTION_FINISHED_STATUSES:
+            analysis_batch.update_item(
+                DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES, batchId, int(item['index']), executionStatus=status)
+        item['executionStatus'] = status
+
+    # 投入状態とステートマシンの実行状態ごとの件数を集計する
+    counts = {}
+    for item in items:
+        key = item.get('executionStatus') or item['status']
+        counts[key] = counts.get(key, 0) + 1
+
+    responseBody = {
+        'batchId': batchId,
+        'name': summary.get('name'),
+        'status': summary['status'],
+        'total': summary['total'],
+        'submittedCount': summary['submittedCount'],
+        'failedCount': summary['failedCount'],
+        'counts': counts,
+        'createdAt': summary.get('createdAt'),
+        'updatedAt': summary.get('updatedAt'),
+        'items': [
+            {
+                'index': item['index'],
+                **({'name': item['name']} if item.get('name') else {}),
+                'status': item['status'],
+                **({'executionArn': item['executionArn']} if item.get('executionArn') else {}),
+                **({'executionStatus': item['executionStatus']} if item.get('executionStatus') else {}),
+                **({'error': item['error']} if item.get('error') else {}),
+            }
+            for item in items
+        ],
+    }
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            **api_common.CORS_HEADERS,
+        },
+        'body': json.dumps(responseBody, default=api_common.default_serializer),
+    }
@@ -0,0 +1,100 @@
+import os
+import json
+import botocore
+import boto3
+import api_common
+import run_accounting
+import run_cache
+import run_statistics
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_CACHE = os.environ['DYNAMODB_TABLE_NAME_RUN_CACHE']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+# AWS サービスのクライアントを初期化
+omics = boto3.client('omics')
+
+
+# ワークフロー実行のリソースの使用量と費用の見積もりを返す API を実装した Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    # REST API に指定されたパスを取得
+    pathParams = event.get('pathParameters') or {}
+    runId = pathParams.get('runId')
+    if not runId:
+        # パスに実行 ID が含まれていなければ 404 Not Found とする
+        return {
+            'statusCode': 404,
+            'headers': api_common.CORS_HEADERS,
+        }
+
+    try:
+        return handle_get_run_accounting(runId)
+
+    except botocore.exceptions.ClientError as err:
+        statusCode = err.response['ResponseMetadata']['HTTPStatusCode']
+        code = err.response['Error']['Code']
+        message = err.response['Error']['Message']
+        logger.exception(f'{code}: {message}')
+
+        # AWS の API からエラーレスポンスが返されたら、その内容に準じたエラーコードとメッセージを返す
+        return {
+            'statusCode': statusCode,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+    except (botocore.exceptions.BotoCoreError, ValueError) as err:
+        code = type(err).__name__
+        message = str(err)
+        logger.exception(f'{code}: {message}')
+
+        # その他のエラーが発生したら、エラーメッセージと共に 400 Bad Request を返す
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+
+# ワークフロー実行の全てのタスクのリソースの使用量を集計して返す
+# 終了したワークフロー実行の集計結果は変わらないため、1 回だけ集計してキャッシュする
+def handle_get_run_accounting(runId: str) -> dict:
+    accounting = run_cache.get(DYNAMODB_TABLE_NAME_RUN_CACHE, runId, run_cache.ACCOUNTING)
+    cached = accounting is not None
+    if not cached:
+        run = omics.get_run(id=runId)
+        tasks = run_statistics.list_run_tasks(runId, maxCount=None)
+        accounting = run_accounting.compute_accounting(run, tasks)
+        if accounting['isFinal']:
+            run_cache.put(DYNAMODB_TABLE_NAME_RUN_CACHE, runId, run_cache.ACCOUNTING, accounting)
+    responseBody = {**accounting, 'cached': cached}
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            **api_common.CORS_HEADERS,
+        },
+        'body': json.dumps(responseBody, default=api_common.default_serializer),
+    }
@@ -1,11 +1,16 @@
+import os
 import json
 import botocore
 import boto3
 import api_common
+import run_task_states
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_TASK_STATES = os.environ['DYNAMODB_TABLE_NAME_RUN_TASK_STATES']
+
 # ログとトレースの機能を初期化
 logger = Logger()
 tracer = Tracer()
@@ -42,6 +47,9 @@ def handler(event: dict, context: LambdaContext) -> dict:
     try:
         taskId = pathParams.get('taskId')
         if not taskId:
+            if 'since' in queryParams:
+                # カーソルが指定されていたら、前回の取得以降に作成・変更されたタスクだけを返す
+                return handle_list_run_task_changes(runId, queryParams)
             # パスにタスク ID が含まれていなかったら、タスクの一覧を返す
             return handle_list_run_tasks(runId, queryParams)
         else:
@@ -118,6 +126,34 @@ def handle_list_run_tasks(runId: str, queryParams: dict) -> dict:
     }
 
 
+# カーソルより後に作成・変更されたタスクの一覧と、次に指定するカーソルを返す
+# カーソルが空文字列または 0 の場合は、全てのタスクを返す
+def handle_list_run_task_changes(runId: str, queryParams: dict) -> dict:
+    since = queryParams.get('since') or '0'
+    if not since.isdigit():
+        raise ValueError(f'since must be a cursor returned by the previous response: {since}')
+
+    committedSequence, isFinal = run_task_states.sync(DYNAMODB_TABLE_NAME_RUN_TASK_STATES, runId)
+    items = run_task_states.list_changes(DYNAMODB_TABLE_NAME_RUN_TASK_STATES, runId, int(since), committedSequence)
+
+    # タスク一覧を JSON 化して返す
+    # 保存を終えた連番までを返すため、次のカーソルより前の連番のタスクが後から保存されることはない
+    responseBody = {
+        'items': items,
+        'cursor': str(max(int(since), committedSequence)),
+        'isFinal': isFinal,
+    }
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            **api_common.CORS_HEADERS,
+        },
+        'body': json.dumps(responseBody, default=api_common.default_serializer),
+    }
+
+
 # 特定のタスクの詳細情報を返す
 def handle_get_run_task(runId: str, taskId: str, queryParams: dict) -> dict:
     # Omics のタスクの詳細情報を取得する
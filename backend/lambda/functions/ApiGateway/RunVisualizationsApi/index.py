@@ -10,6 +10,23 @@ from aws_lambda_powertools.utilities.typing import LambdaContext
 # DynamoDB のテーブル名を環境変数から取得
 DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS = os.environ['DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS']
 
+# 可視化の一覧の並べ替えに指定できる属性 (値が数値か文字列のいずれかに揃っているもの)
+SORTABLE_ATTRIBUTES = [
+    'visualizationId',
+    'type',
+    'modelName',
+    'rank',
+    'residueCount',
+    'meanPlddt',
+    'fractionPlddtVeryHigh',
+    'fractionPlddtConfident',
+    'fractionPlddtVeryLow',
+    'ptm',
+    'iptm',
+    'rankingConfidence',
+    'maxPae',
+]
+
 # ログとトレースの機能を初期化
 logger = Logger()
 tracer = Tracer()
@@ -94,26 +111,57 @@ def handler(event: dict, context: LambdaContext) -> dict:
 def handle_list_run_visualizations(runId: str, queryParams: dict) -> dict:
     maxResults = queryParams.get('maxResults')
     startingToken = queryParams.get('startingToken')
+    visualizationType = queryParams.get('type')
+    sortBy = queryParams.get('sortBy')
+    sortOrder = queryParams.get('sortOrder') or 'asc'
+    if sortOrder not in ['asc', 'desc']:
+        raise ValueError(f'Invalid sortOrder: {sortOrder}')
+    if sortBy and sortBy not in SORTABLE_ATTRIBUTES:
+        raise ValueError(f'Invalid sortBy: {sortBy}')
 
     # DynamoDB の RunVisualizations テーブルから、指定された runId の可視化の一覧を取得する
-    response = dynamodb.query(
-        TableName=DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS,
-        KeyConditionExpression='runId = :runId',
-        ExpressionAttributeValues=api_common.dict_to_dynamodb({
+    query = {
+        'TableName': DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS,
+        'KeyConditionExpression': 'runId = :runId',
+        'ExpressionAttributeValues': api_common.dict_to_dynamodb({
             ':runId': runId,
+            **({':type': visualizationType} if visualizationType else {}),
         }),
-        **({'Limit': maxResults} if maxResults else {}),
-        **({'ExclusiveStartKey': json.loads(startingToken)} if startingToken else {}),
-    )
+        **({
+            'FilterExpression': '#type = :type',
+            'ExpressionAttributeNames': {'#type': 'type'},
+        } if visualizationType else {}),
+    }
+
+    if sortBy:
+        # 属性で並べ替える場合は、全件を取得してから並べ替える (ページングは行わない)
+        items = []
+        paginator = dynamodb.get_paginator('query')
+        for page in paginator.paginate(**query):
+            items.extend(api_common.dict_from_dynamodb(item) for item in page.get('Items') or [])
+
+        # 並べ替えに使う属性を持たない可視化は末尾に並べる
+        sortable = [item for item in items if item.get(sortBy) is not None]
+        unsortable = [item for item in items if item.get(sortBy) is None]
+        responseBody = {
+            'items': sorted(sortable, key=lambda item: item[sortBy], reverse=sortOrder == 'desc') + unsortable,
+        }
 
-    items = response.get('Items')
-    lastEvaluatedKey = response.get('LastEvaluatedKey')
+    else:
+        response = dynamodb.query(
+            **query,
+            **({'Limit': int(maxResults)} if maxResults else {}),
+            **({'ExclusiveStartKey': json.loads(startingToken)} if startingToken else {}),
+        )
 
-    # DynamoDB から取得した情報を JSON 化して返す
-    responseBody = {
-        'items': [api_common.dict_from_dynamodb(item) for item in items] if items else [],
-        **({'nextToken': json.dumps(lastEvaluatedKey, default=api_common.default_serializer)} if lastEvaluatedKey else {}),
-    }
+        items = response.get('Items')
+        lastEvaluatedKey = response.get('LastEvaluatedKey')
+
+        # DynamoDB から取得した情報を JSON 化して返す
+        responseBody = {
+            'items': [api_common.dict_from_dynamodb(item) for item in items] if items else [],
+            **({'nextToken': json.dumps(lastEvaluatedKey, default=api_common.default_serializer)} if lastEvaluatedKey else {}),
+        }
 
     return {
         'statusCode': 200,
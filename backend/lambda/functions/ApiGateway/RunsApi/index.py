@@ -1,11 +1,48 @@
+import os
 import json
+import time
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, wait
 import botocore
 import boto3
 import api_common
+import run_cache
+import run_statistics
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_STATISTICS = os.environ['DYNAMODB_TABLE_NAME_RUN_STATISTICS']
+DYNAMODB_TABLE_NAME_RUN_CACHE = os.environ['DYNAMODB_TABLE_NAME_RUN_CACHE']
+
+# 進捗を見積もるワークフロー実行の status
+ACTIVE_STATUSES = ['PENDING', 'STARTING', 'RUNNING']
+
+# 終了したワークフロー実行の status (タスクの数が変わらないため、無期限にキャッシュする)
+TERMINAL_STATUSES = ['COMPLETED', 'FAILED', 'CANCELLED', 'DELETED']
+
+# タスクの数を数える際に、タスクの一覧を同時に取得するワークフロー実行の数
+# Omics の API のスロットリングを避けるため、ページ内の実行の数によらず上限を設ける
+TASK_COUNT_CONCURRENCY = 8
+# タスクの数を数えるのに使う時間の上限 (秒)
+# API Gateway のタイムアウトまでに一覧を返せるよう、時間内に数え終わらなかった実行は含めない (次回以降に数える)
+TASK_COUNT_TIMEOUT_SECONDS = 20
+# 1 つの実行について数えるタスクの最大数 (これを超える実行は数えない)
+TASK_COUNT_MAX_ITEMS = 10000
+
+# タスクの status ごとの集計先
+TASK_COUNT_KEYS = {
+    'PENDING': 'pending',
+    'STARTING': 'running',
+    'RUNNING': 'running',
+    'STOPPING': 'running',
+    'COMPLETED': 'completed',
+    'FAILED': 'failed',
+    'CANCELLED': 'cancelled',
+    'DELETED': 'cancelled',
+}
+
 # ログとトレースの機能を初期化
 logger = Logger()
 tracer = Tracer()
@@ -76,6 +113,7 @@ def handle_list_runs(queryParams: dict) -> dict:
     name = queryParams.get('name')
     runGroupId = queryParams.get('runGroupId')
     startingToken = queryParams.get('startingToken')
+    includeTaskCounts = queryParams.get('includeTaskCounts', '').lower() == 'true'
 
     # Omics のワークフロー実行の一覧を取得する
     response = omics.list_runs(
@@ -88,6 +126,13 @@ def handle_list_runs(queryParams: dict) -> dict:
     # ワークフロー実行の一覧を JSON 化して返す
     items = response.get('items')
     nextToken = response.get('nextToken')
+    if includeTaskCounts and items:
+        # ページ内の実行ごとに、状態ごとのタスクの数を付け加える
+        taskCounts = get_task_counts(items)
+        items = [
+            {**item, **({'taskCounts': taskCounts[item['id']]} if item['id'] in taskCounts else {})}
+            for item in items
+        ]
     responseBody = {
         'items': items or [],
         **({'nextToken': nextToken} if nextToken else {}),
@@ -160,6 +205,12 @@ def handle_get_run(runId: str, queryParams: dict) -> dict:
         **({'stopTime': stopTime} if stopTime else {}),
     }
 
+    # 実行中であれば、同じワークフローの過去の実行のタスクの記録から進捗と完了予定時刻を見積もる
+    if status in ACTIVE_STATUSES and workflowType and workflowId:
+        progress = estimate_run_progress(response)
+        if progress:
+            responseBody['progress'] = progress
+
     return {
         'statusCode': 200,
         'headers': {
@@ -168,3 +219,90 @@ def handle_get_run(runId: str, queryParams: dict) -> dict:
         },
         'body': json.dumps(responseBody, default=api_common.default_serializer),
     }
+
+
+# 実行中のワークフロー実行の進捗の割合と完了予定時刻を見積もる (過去の実行の記録がなければ None を返す)
+def estimate_run_progress(run: dict) -> dict:
+    profile = run_statistics.get_task_profile(DYNAMODB_TABLE_NAME_RUN_STATISTICS, run['workflowType'], run['workflowId'])
+    if not profile:
+        return None
+
+    now = datetime.now(timezone.utc)
+    startTime = run.get('startTime')
+    elapsedSeconds = (now - startTime).total_seconds() if startTime else 0
+    tasks = run_statistics.list_run_tasks(run['id']) if startTime else []
+
+    progress = run_statistics.estimate_progress(profile, tasks, elapsedSeconds)
+    if 'estimatedRemainingSeconds' in progress:
+        progress['estimatedCompletionTime'] = now + timedelta(seconds=progress['estimatedRemainingSeconds'])
+    return progress
+
+
+# タスクの一覧を状態ごとに数える
+def count_tasks(tasks: list) -> dict:
+    counts = {key: 0 for key in ['pending', 'running', 'completed', 'failed', 'cancelled']}
+    for task in tasks:
+        key = TASK_COUNT_KEYS.get(task.get('status'))
+        if key:
+            counts[key] += 1
+    counts['total'] = len(tasks)
+    return counts
+
+
+# ワークフロー実行ごとの状態ごとのタスクの数を {runId: taskCounts} で返す
+# 終了した実行はキャッシュを使い、それ以外の実行はタスクの一覧を並列に取得して数える
+# タスクの一覧を取得できなかった実行と、時間内に数え終わらなかった実行は含めない
+def get_task_counts(runs: list) -> dict:
+    terminalRunIds = [run['id'] for run in runs if run.get('status') in TERMINAL_STATUSES]
+    taskCounts = run_cache.get_many(DYNAMODB_TABLE_NAME_RUN_CACHE, terminalRunIds, run_cache.TASK_COUNTS)
+
+    # レスポンスを返した後もタスクの一覧の取得が続かないよう、各スレッドはページごとに期限を確認して打ち切る
+    deadline = time.monotonic() + TASK_COUNT_TIMEOUT_SECONDS
+
+    def count_run_tasks(run: dict):
+        # 開始していない実行にはタスクがない
+        if run.get('status') in ['PENDING', 'STARTING'] and not run.get('startTime'):
+            return count_tasks([])
+        try:
+            tasks = []
+            pages = omics.get_paginator('list_run_tasks').paginate(
+                id=run['id'],
+                PaginationConfig={'MaxItems': TASK_COUNT_MAX_ITEMS},
+            )
+            for page in pages:
+                if time.monotonic() > deadline:
+                    return None
+                tasks.extend(page.get('items', []))
+            # タスクの数が上限を超える実行は、正しく数えられないため含めない
+            if pages.resume_token:
+                return None
+            return count_tasks(tasks)
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as err:
+            # 一部の実行で取得できなくても、一覧の表示は妨げない
+            logger.warning(f'Failed to count tasks of run {run["id"]}: {err}')
+            return None
+
+    targetRuns = [run for run in runs if run['id'] not in taskCounts]
+    if targetRuns:
+        executor = ThreadPoolExecutor(max_workers=TASK_COUNT_CONCURRENCY)
+        futures = [executor.submit(count_run_tasks, run) for run in targetRuns]
+        wait(futures, timeout=TASK_COUNT_TIMEOUT_SECONDS)
+        # 時間内に開始できなかった実行は数えず、開始済みのスレッドは期限で打ち切られるまで待つ
+        executor.shutdown(wait=True, cancel_futures=True)
+
+        newTerminalCounts = {}
+        for run, future in zip(targetRuns, futures):
+            counts = future.result() if future.done() and not future.cancelled() else None
+            if counts is None:
+                continue
+            taskCounts[run['id']] = counts
+            if run.get('status') in TERMINAL_STATUSES:
+                newTerminalCounts[run['id']] = counts
+
+        for runId, counts in newTerminalCounts.items():
+            try:
+                run_cache.put(DYNAMODB_TABLE_NAME_RUN_CACHE, runId, run_cache.TASK_COUNTS, counts, expirationSeconds=None)
+            except botocore.exceptions.ClientError as err:
+                # キャッシュできなくても、次回に数え直せばよい
+                logger.warning(f'Failed to cache task counts of run {runId}: {err}')
+    return taskCounts
@@ -1,9 +1,13 @@
 import os
 import json
-import uuid
 import botocore
 import boto3
 import api_common
+import analysis_common
+import run_fingerprint
+import analysis_idempotency
+import analysis_preflight
+import run_statistics
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
@@ -18,6 +22,9 @@ STEPFUNCTIONS_STATE_MACHINE_ARN = os.environ['STEPFUNCTIONS_STATE_MACHINE_ARN']
 
 # DynamoDB のテーブル名を環境変数から取得
 DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS = os.environ['DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS']
+DYNAMODB_TABLE_NAME_RUN_FINGERPRINTS = os.environ['DYNAMODB_TABLE_NAME_RUN_FINGERPRINTS']
+DYNAMODB_TABLE_NAME_ANALYSIS_IDEMPOTENCY = os.environ['DYNAMODB_TABLE_NAME_ANALYSIS_IDEMPOTENCY']
+DYNAMODB_TABLE_NAME_RUN_STATISTICS = os.environ['DYNAMODB_TABLE_NAME_RUN_STATISTICS']
 
 # AWS リージョンを環境変数から取得
 AWS_REGION = os.environ['AWS_REGION']
@@ -30,9 +37,7 @@ logger = Logger()
 tracer = Tracer()
 
 # AWS サービスのクライアントを初期化
-omics = boto3.client('omics')
 sfn = boto3.client('stepfunctions')
-dynamodb = boto3.client('dynamodb')
 
 
 # ワークフローを実行する API を実装した Lambda 関数のハンドラ
@@ -61,7 +66,25 @@ def handler(event: dict, context: LambdaContext) -> dict:
     requestBody = json.loads(body)
 
     try:
-        return handle_start_analysis(userId, email, accountId, OMICS_WORKFLOW_RUN_ROLE_ARN, headers, requestBody)
+        return handle_idempotent_start_analysis(userId, email, accountId, OMICS_WORKFLOW_RUN_ROLE_ARN, headers, requestBody)
+
+    except (analysis_idempotency.RequestInProgressError, analysis_idempotency.RequestMismatchError) as err:
+        code = type(err).__name__
+        message = str(err)
+        logger.warning(f'{code}: {message}')
+
+        # 同じ冪等性キーのリクエストが処理中なら 409 Conflict、異なる内容のリクエストに使われていれば 422 Unprocessable Entity を返す
+        return {
+            'statusCode': 409 if isinstance(err, analysis_idempotency.RequestInProgressError) else 422,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
 
     except botocore.exceptions.ClientError as err:
         statusCode = err.response['ResponseMetadata']['HTTPStatusCode']
@@ -101,84 +124,168 @@ def handler(event: dict, context: LambdaContext) -> dict:
         }
 
 
+# 同じリクエストが再送されても解析が重複して開始されないよう、冪等性キーごとに最初のリクエストの結果を返す
+# 冪等性キーは `Idempotency-Key` ヘッダーで指定し、指定されなければリクエストボディから求める
+def handle_idempotent_start_analysis(userId: str, email: str, accountId: str, role: str, headers: dict,
+                                     requestBody: dict) -> dict:
+    requestHash = analysis_idempotency.hash_request(requestBody)
+    idempotencyKey = analysis_idempotency.get_idempotency_key(headers)
+    expirationSeconds = analysis_idempotency.EXPIRATION_SECONDS
+    if not idempotencyKey:
+        idempotencyKey = requestHash
+        expirationSeconds = analysis_idempotency.DERIVED_KEY_EXPIRATION_SECONDS
+
+    storedResponse, token = analysis_idempotency.begin(
+        DYNAMODB_TABLE_NAME_ANALYSIS_IDEMPOTENCY, userId, idempotencyKey, requestHash, expirationSeconds)
+    if storedResponse is not None:
+        # 既に開始した解析の情報を返す
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Idempotent-Replayed': 'true',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps(storedResponse, default=api_common.default_serializer),
+        }
+
+    try:
+        response = handle_start_analysis(userId, email, accountId, role, headers, requestBody, token)
+    except Exception:
+        # 解析を開始できなかったら、同じ冪等性キーで再送できるようにする
+        analysis_idempotency.cancel(DYNAMODB_TABLE_NAME_ANALYSIS_IDEMPOTENCY, userId, idempotencyKey)
+        raise
+
+    responseBody = json.loads(response['body'])
+    if 'arn' in responseBody:
+        analysis_idempotency.complete(
+            DYNAMODB_TABLE_NAME_ANALYSIS_IDEMPOTENCY, userId, idempotencyKey, responseBody['arn'], responseBody,
+            expirationSeconds)
+    else:
+        # 再利用できる実行を提示しただけで解析を開始していなければ、結果を保存しない
+        analysis_idempotency.cancel(DYNAMODB_TABLE_NAME_ANALYSIS_IDEMPOTENCY, userId, idempotencyKey)
+    return response
+
+
 # Step Functions ステートマシンを実行する
-def handle_start_analysis(userId: str, email: str, accountId: str, role: str, headers: dict, requestBody: dict) -> dict:
+# token は冪等性キーから求めた文字列で、ステートマシンの実行の名前と Omics の requestId に使う
+def handle_start_analysis(userId: str, email: str, accountId: str, role: str, headers: dict, requestBody: dict,
+                          token: str) -> dict:
     workflowType = requestBody['workflowType']
     workflowId = requestBody['workflowId']
 
     # Omics のワークフロー情報を取得する
-    response = omics.get_workflow(
-        type=workflowType,
-        id=workflowId,
-    )
-    workflowName = response.get('name')
-    parameterTemplate = response.get('parameterTemplate') or {}
-
-    # ワークフローの実行パラメーターのデフォルト値を設定
-    comprehensiveParameterDefaults = {
-        'ecr_registry': f'{accountId}.dkr.ecr.{AWS_REGION}.amazonaws.com/',
-    }
-    # パラメーターテンプレートに存在するパラメーターのみを残す
-    parameterDefaults = {
-        key: value
-        for key, value in comprehensiveParameterDefaults.items() if key in parameterTemplate and value is not None
-    }
-
-    # ワークフロー実行完了メールの内容に反映するため、リクエストヘッダーから Origin と Accept-Language を取得
-    origin = headers['origin']
-    acceptLanguage = headers['accept-language']
+    workflow = analysis_common.resolve_workflow(workflowType, workflowId, accountId, AWS_REGION)
 
     # リクエストボディから Omics ワークフローの実行パラメーターを取得する
     roleArn = requestBody.get('roleArn') or role
     outputUri = requestBody.get('outputUri') or f"{OMICS_OUTPUT_BUCKET_URL}/{userId}/"
-    parameters = requestBody.get('parameters')
-    name = requestBody.get('name')
-    priority = requestBody.get('priority')
-    storageCapacity = requestBody.get('storageCapacity')
-    requestId = requestBody.get('requestId') or str(uuid.uuid4())
-    runGroupId = requestBody.get('runGroupId')
-    logLevel = requestBody.get('logLevel')
     tags = requestBody.get('tags')
-    visualizerId = requestBody.get('visualizerId')
-    visualizer = getVisualizer(dynamodb, workflowType, workflowId, visualizerId, roleArn) if visualizerId else {}
+    startRun = analysis_common.build_start_run(workflowType, workflowId, workflow, roleArn, outputUri, {
+        **requestBody,
+        'requestId': requestBody.get('requestId') or token,
+    })
 
-    # Step Functions ステートマシンを実行する
-    response = sfn.start_execution(
-        stateMachineArn=STEPFUNCTIONS_STATE_MACHINE_ARN,
-        input=json.dumps({
-            'UserId': userId,
-            'OmicsStartRun': {
-                'WorkflowType': workflowType,
-                'WorkflowId': workflowId,
-                'WorkflowName': workflowName,
-                'RoleArn': roleArn,
-                'OutputUri': outputUri.rstrip('/'),
-                'Parameters': {
-                    **parameterDefaults,
-                    **(parameters or {}),
-                },
-                **({'Name': name} if name else {}),
-                **({'Priority': priority} if priority is not None else {}),
-                **({'StorageCapacity': storageCapacity} if storageCapacity is not None else {}),
-                **({'RequestId': requestId} if requestId else {}),
-                **({'RunGroupId': runGroupId} if runGroupId else {}),
-                **({'LogLevel': logLevel} if logLevel else {}),
-                **({'Tags': tags} if tags else {}),
+    # ワークフロー実行を開始する前に、実行パラメーターと入力ファイルを検証し、見つかった問題を全て返す
+    problems = analysis_preflight.validate(workflow['parameterTemplate'], startRun['Parameters'], startRun.get('RunGroupId'))
+    if requestBody.get('validateOnly'):
+        # `validateOnly` が指定されたら、検証の結果だけを返す
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
             },
-            **({'Visualizer': visualizer} if visualizer else {}),
-            'Notification': {
-                'Email': email,
-                'FrontendOrigin': origin,
-                'AcceptLanguage': acceptLanguage,
+            'body': json.dumps({
+                'valid': not analysis_preflight.has_errors(problems),
+                'problems': problems,
+            }, default=api_common.default_serializer),
+        }
+    if analysis_preflight.has_errors(problems):
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
             },
-        })
+            'body': json.dumps({
+                'code': 'PreflightValidationFailed',
+                'message': ' / '.join(
+                    problem['message'] for problem in problems if problem['severity'] == analysis_preflight.ERROR),
+                'problems': problems,
+            }, default=api_common.default_serializer),
+        }
+
+    # 可視化は `visualizerIds` で複数指定できる
+    visualizers = analysis_common.get_visualizers(
+        DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS,
+        workflowType,
+        workflowId,
+        analysis_common.get_visualizer_ids(requestBody),
+        roleArn,
     )
-    executionArn = response['executionArn']
+
+    # `storageCapacity` に 'auto' が指定されたら、同じワークフローの過去の実行から推奨するストレージ容量を使う
+    # 推奨できなければ指定を省き、Omics のデフォルトの容量で実行する
+    storageRecommendation = None
+    if str(startRun.get('StorageCapacity', '')).lower() == 'auto':
+        storageRecommendation = run_statistics.recommend_storage_capacity(
+            DYNAMODB_TABLE_NAME_RUN_STATISTICS, workflowType, workflowId,
+            run_statistics.measure_input_bytes(startRun['Parameters']))
+        startRun.pop('StorageCapacity')
+        if storageRecommendation.get('recommendedStorageCapacity'):
+            startRun['StorageCapacity'] = storageRecommendation['recommendedStorageCapacity']
+
+    # 同じワークフローを同じ入力で実行した完了済みの実行があれば、指定に応じて結果を再利用する (`reuse` を指定した場合のみ)
+    reuse = (requestBody.get('reuse') or run_fingerprint.REUSE_OFF).upper()
+    if reuse not in run_fingerprint.REUSE_MODES:
+        raise ValueError(f'reuse must be one of {run_fingerprint.REUSE_MODES}')
+    fingerprint = run_fingerprint.compute_fingerprint(workflowType, workflowId, workflow['digest'], startRun['Parameters'])
+    reusableRun = None
+    if reuse != run_fingerprint.REUSE_OFF:
+        reusableRun = run_fingerprint.find_reusable_run(DYNAMODB_TABLE_NAME_RUN_FINGERPRINTS, fingerprint)
+
+    if reusableRun and reuse == run_fingerprint.REUSE_OFFER:
+        # ワークフローは実行せず、再利用できる実行の情報を返す
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'reusableRun': reusableRun,
+            }, default=api_common.default_serializer),
+        }
+
+    notification = analysis_common.build_notification(email, headers)
+    if reusableRun:
+        # ワークフローを実行せず、完了済みの実行の結果に対して可視化と通知を行う
+        executionInput = analysis_common.build_reuse_execution_input(userId, reusableRun['runId'], visualizers, notification)
+    else:
+        executionInput = analysis_common.build_execution_input(userId, startRun, visualizers, notification, fingerprint)
+
+    # Step Functions ステートマシンを実行する
+    # 実行の名前を固定し、前回の処理が開始した実行があれば重複して開始しない
+    try:
+        response = sfn.start_execution(
+            stateMachineArn=STEPFUNCTIONS_STATE_MACHINE_ARN,
+            name=token,
+            input=json.dumps(executionInput)
+        )
+        executionArn = response['executionArn']
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ExecutionAlreadyExists':
+            raise
+        executionArn = STEPFUNCTIONS_STATE_MACHINE_ARN.replace(':stateMachine:', ':execution:', 1) + f':{token}'
 
     # 実行の情報を JSON 化して返す
     responseBody = {
         'arn': executionArn,
         'id': executionArn,
+        **({'reusedRunId': reusableRun['runId']} if reusableRun else {}),
+        **({'warnings': problems} if problems else {}),
+        **({'storageRecommendation': storageRecommendation} if storageRecommendation else {}),
         **({'tags': tags} if tags else {}),
     }
 
@@ -190,23 +297,3 @@ def handle_start_analysis(userId: str, email: str, accountId: str, role: str, he
         },
         'body': json.dumps(responseBody, default=api_common.default_serializer),
     }
-
-
-def getVisualizer(dynamodb, workflowType: str, workflowId: str, visualizerId: str, roleArn: str):
-    response = dynamodb.get_item(
-        TableName=DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS,
-        Key=api_common.dict_to_dynamodb({
-            'workflowId': f'{workflowType}_{workflowId}',
-            'visualizerId': visualizerId,
-        }),
-    )
-
-    # DynamoDB から取得した情報を JSON 化して返す
-    item = api_common.dict_from_dynamodb(response.get('Item'))
-
-    return {
-        'VisualizerId': visualizerId,
-        'Name': item.get('name'),
-        'StateMachineArn': item['stateMachineArn'],
-        'RoleArn': roleArn,
-    } if item else {}
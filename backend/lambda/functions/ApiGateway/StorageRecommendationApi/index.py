@@ -0,0 +1,91 @@
+import os
+import json
+import botocore
+import api_common
+import run_statistics
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_STATISTICS = os.environ['DYNAMODB_TABLE_NAME_RUN_STATISTICS']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+
+# 同じワークフローの過去の実行からストレージ容量を推奨する API を実装した Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    # REST API に指定されたパスを取得
+    pathParams = event.get('pathParameters') or {}
+    workflowType = pathParams.get('workflowType')
+    workflowId = pathParams.get('workflowId')
+    if not workflowType or not workflowId:
+        # パスにワークフローの種類と ID が含まれていなければ 404 Not Found とする
+        return {
+            'statusCode': 404,
+            'headers': api_common.CORS_HEADERS,
+        }
+
+    try:
+        # リクエストボディに実行パラメーターが指定されていれば、入力サイズに応じて推奨する
+        requestBody = json.loads(event.get('body') or '{}')
+        return handle_recommend_storage_capacity(workflowType, workflowId, requestBody.get('parameters') or {})
+
+    except botocore.exceptions.ClientError as err:
+        statusCode = err.response['ResponseMetadata']['HTTPStatusCode']
+        code = err.response['Error']['Code']
+        message = err.response['Error']['Message']
+        logger.exception(f'{code}: {message}')
+
+        # AWS の API からエラーレスポンスが返されたら、その内容に準じたエラーコードとメッセージを返す
+        return {
+            'statusCode': statusCode,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+    except (botocore.exceptions.BotoCoreError, ValueError) as err:
+        code = type(err).__name__
+        message = str(err)
+        logger.exception(f'{code}: {message}')
+
+        # その他のエラーが発生したら、エラーメッセージと共に 400 Bad Request を返す
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+
+# 実行パラメーターに含まれる S3 の入力ファイルの合計サイズを求め、ストレージ容量の推奨を返す
+def handle_recommend_storage_capacity(workflowType: str, workflowId: str, parameters: dict) -> dict:
+    inputBytes = run_statistics.measure_input_bytes(parameters)
+
+    responseBody = run_statistics.recommend_storage_capacity(
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS, workflowType, workflowId, inputBytes)
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            **api_common.CORS_HEADERS,
+        },
+        'body': json.dumps(responseBody, default=api_common.default_serializer),
+    }
@@ -0,0 +1,89 @@
+import os
+import json
+import botocore
+import api_common
+import run_cache
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_CACHE = os.environ['DYNAMODB_TABLE_NAME_RUN_CACHE']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+
+# ワークフロー実行のタスクのログから取り出した、ツールの処理量の指標を返す API を実装した Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    # REST API に指定されたパスを取得
+    pathParams = event.get('pathParameters') or {}
+    runId = pathParams.get('runId')
+    if not runId:
+        # パスに実行 ID が含まれていなければ 404 Not Found とする
+        return {
+            'statusCode': 404,
+            'headers': api_common.CORS_HEADERS,
+        }
+
+    try:
+        return handle_get_task_log_metrics(runId)
+
+    except botocore.exceptions.ClientError as err:
+        statusCode = err.response['ResponseMetadata']['HTTPStatusCode']
+        code = err.response['Error']['Code']
+        message = err.response['Error']['Message']
+        logger.exception(f'{code}: {message}')
+
+        # AWS の API からエラーレスポンスが返されたら、その内容に準じたエラーコードとメッセージを返す
+        return {
+            'statusCode': statusCode,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+    except (botocore.exceptions.BotoCoreError, ValueError) as err:
+        code = type(err).__name__
+        message = str(err)
+        logger.exception(f'{code}: {message}')
+
+        # その他のエラーが発生したら、エラーメッセージと共に 400 Bad Request を返す
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+
+# ワークフロー実行の完了したタスクのログから取り出した指標の一覧を返す
+# 指標はワークフロー実行が終了した後に、ステートマシンの MineTaskLogsTask で保存される
+def handle_get_task_log_metrics(runId: str) -> dict:
+    values = run_cache.list_by_type(DYNAMODB_TABLE_NAME_RUN_CACHE, runId, run_cache.TASK_LOG_METRICS)
+    items = sorted(values.values(), key=lambda item: (item.get('name') or '', item['taskId']))
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            **api_common.CORS_HEADERS,
+        },
+        'body': json.dumps({
+            'items': items,
+        }, default=api_common.default_serializer),
+    }
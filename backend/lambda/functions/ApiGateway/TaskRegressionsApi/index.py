@@ -0,0 +1,97 @@
+import os
+import json
+import botocore
+import api_common
+import task_regressions
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_STATISTICS = os.environ['DYNAMODB_TABLE_NAME_RUN_STATISTICS']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+
+# 同じワークフローの過去の実行と比べて、実行時間が大きく変わったタスクを返す API を実装した Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    # REST API に指定されたパスを取得
+    pathParams = event.get('pathParameters') or {}
+    workflowType = pathParams.get('workflowType')
+    workflowId = pathParams.get('workflowId')
+    if not workflowType or not workflowId:
+        # パスにワークフローの種類と ID が含まれていなければ 404 Not Found とする
+        return {
+            'statusCode': 404,
+            'headers': api_common.CORS_HEADERS,
+        }
+
+    # REST API に指定されたクエリ文字列を取得
+    queryParams = event.get('queryStringParameters') or {}
+
+    try:
+        # 実行 ID が指定されていなければ、最新の完了済みの実行を対象とする
+        return handle_detect_task_regressions(workflowType, workflowId, queryParams.get('runId'))
+
+    except botocore.exceptions.ClientError as err:
+        statusCode = err.response['ResponseMetadata']['HTTPStatusCode']
+        code = err.response['Error']['Code']
+        message = err.response['Error']['Message']
+        logger.exception(f'{code}: {message}')
+
+        # AWS の API からエラーレスポンスが返されたら、その内容に準じたエラーコードとメッセージを返す
+        return {
+            'statusCode': statusCode,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+    except (botocore.exceptions.BotoCoreError, ValueError) as err:
+        code = type(err).__name__
+        message = str(err)
+        logger.exception(f'{code}: {message}')
+
+        # その他のエラーが発生したら、エラーメッセージと共に 400 Bad Request を返す
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+
+# ワークフローの完了済みの実行について、基準の実行と比べて実行時間が大きく変わったタスクを返す
+def handle_detect_task_regressions(workflowType: str, workflowId: str, runId: str) -> dict:
+    responseBody = task_regressions.detect_task_regressions(
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS, workflowType, workflowId, runId)
+    if responseBody is None:
+        # 対象の実行の統計情報が記録されていなければ 404 Not Found とする
+        return {
+            'statusCode': 404,
+            'headers': api_common.CORS_HEADERS,
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            **api_common.CORS_HEADERS,
+        },
+        'body': json.dumps(responseBody, default=api_common.default_serializer),
+    }
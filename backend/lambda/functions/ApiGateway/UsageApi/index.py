@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import botocore
+import api_common
+import usage_rollups
+from datetime import datetime, timezone
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_USAGE_ROLLUPS = os.environ['DYNAMODB_TABLE_NAME_USAGE_ROLLUPS']
+
+# 期間を指定しなかった場合に返す月数
+DEFAULT_MONTH_COUNT = 12
+
+# 集計の単位の種類ごとに、全てを一覧できる groupBy の値
+GROUP_BY_SCOPES = {
+    'user': usage_rollups.USER,
+    'workflow': usage_rollups.WORKFLOW,
+}
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+
+# ユーザーごと・ワークフローごとの月単位のリソースの使用量を返す API を実装した Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    # REST API に指定されたクエリーパラメーターを取得
+    queryParams = event.get('queryStringParameters') or {}
+
+    try:
+        return handle_get_usage(queryParams)
+
+    except botocore.exceptions.ClientError as err:
+        statusCode = err.response['ResponseMetadata']['HTTPStatusCode']
+        code = err.response['Error']['Code']
+        message = err.response['Error']['Message']
+        logger.exception(f'{code}: {message}')
+
+        # AWS の API からエラーレスポンスが返されたら、その内容に準じたエラーコードとメッセージを返す
+        return {
+            'statusCode': statusCode,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+    except (botocore.exceptions.BotoCoreError, ValueError) as err:
+        code = type(err).__name__
+        message = str(err)
+        logger.exception(f'{code}: {message}')
+
+        # その他のエラーが発生したら、エラーメッセージと共に 400 Bad Request を返す
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                **api_common.CORS_HEADERS,
+            },
+            'body': json.dumps({
+                'code': code,
+                'message': message,
+            }, default=api_common.default_serializer),
+        }
+
+
+# 期間 (YYYY-MM) の形式を確認する
+def validate_period(name: str, period: str) -> str:
+    if not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', period):
+        raise ValueError(f'{name} must be in YYYY-MM format: {period}')
+    return period
+
+
+# 指定された月の n か月前の月 (YYYY-MM) を返す
+def months_before(period: str, months: int) -> str:
+    year, month = map(int, period.split('-'))
+    index = year * 12 + (month - 1) - months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+# クエリーパラメーターに応じて集計値を返す
+#   groupBy=user|workflow と period を指定した場合、その月の全てのユーザーまたは全てのワークフローの集計値
+#   userId、または workflowType と workflowId を指定した場合、そのユーザーまたはワークフローの from から to までの月ごとの集計値
+#   いずれも指定しなかった場合、アカウント全体の from から to までの月ごとの集計値
+def handle_get_usage(queryParams: dict) -> dict:
+    currentPeriod = datetime.now(timezone.utc).strftime('%Y-%m')
+    groupBy = queryParams.get('groupBy')
+    userId = queryParams.get('userId')
+    workflowType = queryParams.get('workflowType')
+    workflowId = queryParams.get('workflowId')
+
+    if groupBy:
+        if groupBy not in GROUP_BY_SCOPES:
+            raise ValueError(f"groupBy must be one of {', '.join(GROUP_BY_SCOPES.keys())}: {groupBy}")
+        period = validate_period('period', queryParams.get('period') or currentPeriod)
+        items = usage_rollups.list_usage_by_period(DYNAMODB_TABLE_NAME_USAGE_ROLLUPS, GROUP_BY_SCOPES[groupBy], period)
+        items.sort(key=lambda item: item['totalCost'], reverse=True)
+    else:
+        toPeriod = validate_period('to', queryParams.get('to') or currentPeriod)
+        fromPeriod = validate_period('from', queryParams.get('from') or months_before(toPeriod, DEFAULT_MONTH_COUNT - 1))
+        if fromPeriod > toPeriod:
+            raise ValueError(f'from must not be after to: {fromPeriod} > {toPeriod}')
+
+        if userId:
+            scope, scopeId = usage_rollups.USER, userId
+        elif workflowType or workflowId:
+            if not workflowType or not workflowId:
+                raise ValueError('Both workflowType and workflowId must be specified')
+            scope, scopeId = usage_rollups.WORKFLOW, usage_rollups.get_workflow_scope_id(workflowType, workflowId)
+        else:
+            scope, scopeId = usage_rollups.ACCOUNT, 'ALL'
+        items = usage_rollups.list_usage(DYNAMODB_TABLE_NAME_USAGE_ROLLUPS, scope, scopeId, fromPeriod, toPeriod)
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            **api_common.CORS_HEADERS,
+        },
+        'body': json.dumps({
+            'items': items,
+        }, default=api_common.default_serializer),
+    }
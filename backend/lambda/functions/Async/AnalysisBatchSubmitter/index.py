@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import botocore
+import boto3
+import analysis_batch
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# Step Functions ステートマシンの ARN を環境変数から取得
+STEPFUNCTIONS_STATE_MACHINE_ARN = os.environ['STEPFUNCTIONS_STATE_MACHINE_ARN']
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES = os.environ['DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES']
+
+# クォータ超過などで開始できなかった場合に再試行する回数
+MAX_ATTEMPTS = 5
+
+# Lambda 関数の残り時間がこれより短くなったら、残りのサンプルは自身を呼び出し直して続ける (ミリ秒)
+CONTINUATION_THRESHOLD_MILLIS = 60 * 1000
+
+# 再試行するエラーコード
+RETRYABLE_ERROR_CODES = ['ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+# AWS サービスのクライアントを初期化
+sfn = boto3.client('stepfunctions')
+lambdaClient = boto3.client('lambda')
+
+
+# サンプルごとのステートマシンの入力を作成する
+def build_execution_input(config: dict, batchId: str, item: dict) -> dict:
+    startRun = config['OmicsStartRun']
+    tags = json.loads(item['tags']) if item.get('tags') else {}
+    name = item.get('name') or (f"{startRun['Name']}-{item['index']}" if startRun.get('Name') else None)
+    return {
+        **config,
+        'OmicsStartRun': {
+            **startRun,
+            'Parameters': {
+                **startRun['Parameters'],
+                **json.loads(item['parameters']),
+            },
+            **({'Name': name} if name else {}),
+            # 再実行しても同じワークフロー実行が重複して開始されないよう、requestId はサンプルごとに固定する
+            'RequestId': f"{batchId}-{item['index']}",
+            'Tags': {
+                **(startRun.get('Tags') or {}),
+                **tags,
+                'BatchId': batchId,
+            },
+        },
+    }
+
+
+# サンプルのステートマシンの実行を開始し、実行の ARN を返す
+# 開始した実行は待ち行列に登録され、Omics の StartRun は振り分け処理が速度を制限しながら呼び出す
+def start_execution(config: dict, batchId: str, item: dict) -> str:
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = sfn.start_execution(
+                stateMachineArn=STEPFUNCTIONS_STATE_MACHINE_ARN,
+                # 実行の名前をサンプルごとに固定し、同じサンプルが 2 回開始されないようにする
+                name=f"{batchId}-{item['index']}",
+                input=json.dumps(build_execution_input(config, batchId, item)),
+            )
+            return response['executionArn']
+
+        except botocore.exceptions.ClientError as err:
+            code = err.response['Error']['Code']
+            if code == 'ExecutionAlreadyExists':
+                # 前回の呼び出しで既に開始されていれば、実行の名前から ARN を求める
+                executionArn = STEPFUNCTIONS_STATE_MACHINE_ARN.replace(':stateMachine:', ':execution:', 1)
+                return f"{executionArn}:{batchId}-{item['index']}"
+            if code not in RETRYABLE_ERROR_CODES or attempt == MAX_ATTEMPTS - 1:
+                raise
+
+            # クォータを超えたら、間隔を空けて再試行する
+            time.sleep(min(2 ** attempt, 30))
+
+
+# バッチに含まれるサンプルごとのステートマシンの実行を開始する Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    batchId = event['BatchId']
+
+    summary, items = analysis_batch.get_batch(DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES, batchId)
+    if not summary:
+        logger.warning(f'Batch {batchId} does not exist')
+        return {
+            'BatchId': batchId,
+        }
+
+    config = json.loads(summary['config'])
+
+    for item in items:
+        if item['status'] != analysis_batch.ITEM_PENDING:
+            continue
+
+        # Lambda 関数の実行時間の上限に近づいたら、自身を呼び出し直して残りのサンプルを開始する
+        if context.get_remaining_time_in_millis() < CONTINUATION_THRESHOLD_MILLIS:
+            lambdaClient.invoke(
+                FunctionName=context.function_name,
+                InvocationType='Event',
+                Payload=json.dumps({
+                    'BatchId': batchId,
+                }),
+            )
+            logger.info(f'Continue submitting batch {batchId} in another invocation')
+            return {
+                'BatchId': batchId,
+                'Continued': True,
+            }
+
+        try:
+            executionArn = start_execution(config, batchId, item)
+            analysis_batch.update_item(
+                DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES, batchId, item['index'],
+                status=analysis_batch.ITEM_SUBMITTED,
+                executionArn=executionArn,
+            )
+            item['status'] = analysis_batch.ITEM_SUBMITTED
+
+        except botocore.exceptions.ClientError as err:
+            logger.exception(f"Failed to start sample {item['index']} of batch {batchId}")
+            analysis_batch.update_item(
+                DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES, batchId, item['index'],
+                status=analysis_batch.ITEM_FAILED,
+                error=f"{err.response['Error']['Code']}: {err.response['Error']['Message']}",
+            )
+            item['status'] = analysis_batch.ITEM_FAILED
+
+    # 全てのサンプルを処理したら、バッチの状態を更新する
+    submittedCount = sum(1 for item in items if item['status'] == analysis_batch.ITEM_SUBMITTED)
+    failedCount = sum(1 for item in items if item['status'] == analysis_batch.ITEM_FAILED)
+    if failedCount == 0:
+        status = analysis_batch.BATCH_SUBMITTED
+    elif submittedCount == 0:
+        status = analysis_batch.BATCH_FAILED
+    else:
+        status = analysis_batch.BATCH_PARTIALLY_SUBMITTED
+    analysis_batch.update_summary(DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES, batchId, status, submittedCount, failedCount)
+
+    return {
+        'BatchId': batchId,
+        'Status': status,
+        'SubmittedCount': submittedCount,
+        'FailedCount': failedCount,
+    }
@@ -0,0 +1,44 @@
+import os
+import time
+import analysis_queue
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE = os.environ['DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE']
+
+# 実行グループを指定しない解析を同時に実行できる数 (0 の場合は制限しない)
+DEFAULT_MAX_RUNS = int(os.environ.get('DEFAULT_MAX_RUNS', '0'))
+
+# 解析を再開する速度 (1 秒あたりの回数) と、まとめて再開できる回数
+# 再開した解析はすぐに Omics の StartRun を呼び出すため、StartRun のクォータに合わせる
+START_RATE = float(os.environ.get('START_RATE', analysis_queue.DEFAULT_START_RATE))
+START_BURST = float(os.environ.get('START_BURST', analysis_queue.DEFAULT_START_BURST))
+
+# Lambda 関数の残り時間がこれより短くなったら、残りの解析は次回の振り分けで再開する (ミリ秒)
+DEADLINE_MARGIN_MILLIS = 10 * 1000
+
+# 振り分け処理は 1 つずつ実行されるため、呼び出しをまたいで同じトークンバケットを使い、連続した呼び出しでも速度を超えないようにする
+startRunBucket = analysis_queue.TokenBucket(START_RATE, START_BURST)
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+
+# 待ち行列に登録された解析を、実行グループの空きに応じて再開する Lambda 関数のハンドラ
+# 解析の登録・終了時に非同期に呼び出されるほか、取りこぼしに備えて定期的に呼び出される
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    deadline = time.time() + (context.get_remaining_time_in_millis() - DEADLINE_MARGIN_MILLIS) / 1000
+    dispatchedCount = analysis_queue.dispatch(
+        DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE, DEFAULT_MAX_RUNS, bucket=startRunBucket, deadline=deadline)
+    if dispatchedCount:
+        logger.info(f'Dispatched {dispatchedCount} analyses')
+
+    return {
+        'DispatchedCount': dispatchedCount,
+    }
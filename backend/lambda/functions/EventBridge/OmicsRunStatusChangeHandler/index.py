@@ -0,0 +1,40 @@
+import os
+import run_callback
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS = os.environ['DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+
+# Omics の "Run Status Change" イベントを受け取り、ワークフロー実行の完了を待っているステートマシンを再開する Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    detail = event['detail']
+    status = detail['status']
+    # 実行 ID がなければ、実行の ARN (arn:aws:omics:{region}:{account}:run/{runId}) から取得する
+    runId = detail.get('runId') or detail['arn'].split('/')[-1]
+
+    # 終了していない実行のイベントは無視する
+    if not run_callback.is_finished(status):
+        return {
+            'RunId': runId,
+            'Status': status,
+            'Resumed': False,
+        }
+
+    resumed = run_callback.resume_run(DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS, runId, status)
+    logger.info(f'Run {runId} finished with {status} (resumed: {resumed})')
+
+    return {
+        'RunId': runId,
+        'Status': status,
+        'Resumed': resumed,
+    }
@@ -0,0 +1,88 @@
+import os
+import boto3
+import botocore
+import run_callback
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS = os.environ['DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+# AWS サービスのクライアントを初期化
+omics = boto3.client('omics')
+
+
+# 終了していない全てのワークフロー実行の status を、実行 ID をキーとする辞書で返す
+# status ごとに list_runs を呼び出すため、API の呼び出し回数は実行の数ではなくページ数に比例する
+def list_active_runs() -> dict:
+    runs = {}
+    paginator = omics.get_paginator('list_runs')
+    for status in run_callback.ACTIVE_STATUSES:
+        for page in paginator.paginate(status=status):
+            for item in page.get('items', []):
+                runs[item['id']] = item['status']
+    return runs
+
+
+# 一覧に含まれなくなったワークフロー実行の status を取得する (削除済みであれば DELETED とみなす)
+def get_run_status(runId: str) -> str:
+    try:
+        return omics.get_run(id=runId)['status']
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] == 'ResourceNotFoundException':
+            return 'DELETED'
+        raise
+
+
+# 完了を待っている全てのワークフロー実行の状態を定期的に一括で確認し、終了した実行のステートマシンだけを再開する Lambda 関数のハンドラ
+# 実行状態の変更イベントを取りこぼした場合でも、ステートマシンごとに実行状態を確認することなく早く再開できる
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    waitingRuns = run_callback.list_task_tokens(DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS)
+    if not waitingRuns:
+        return {
+            'WaitingRunCount': 0,
+            'ChangedRunCount': 0,
+            'ResumedRunCount': 0,
+        }
+
+    activeRuns = list_active_runs()
+
+    changedRunCount = 0
+    resumedRunCount = 0
+    for waitingRun in waitingRuns:
+        runId = waitingRun['runId']
+        lastStatus = waitingRun['lastStatus']
+
+        # 終了していない実行は、status が変わった場合だけ記録する
+        status = activeRuns.get(runId)
+        if status is not None:
+            if status != lastStatus:
+                changedRunCount += 1
+                run_callback.update_last_status(DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS, runId, status)
+            continue
+
+        # 一覧に含まれない実行は終了した可能性があるため、個別に status を確認する
+        changedRunCount += 1
+        status = get_run_status(runId)
+        if not run_callback.is_finished(status):
+            # 一覧を取得した後に status が変わった実行は次回に確認する
+            run_callback.update_last_status(DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS, runId, status)
+            continue
+
+        if run_callback.resume_run(DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS, runId, status):
+            resumedRunCount += 1
+            logger.info(f'Run {runId} finished with {status}')
+
+    return {
+        'WaitingRunCount': len(waitingRuns),
+        'ChangedRunCount': changedRunCount,
+        'ResumedRunCount': resumedRunCount,
+    }
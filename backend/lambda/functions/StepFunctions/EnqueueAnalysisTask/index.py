@@ -0,0 +1,53 @@
+import os
+import botocore
+import analysis_queue
+import run_statistics
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE = os.environ['DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE']
+DYNAMODB_TABLE_NAME_RUN_STATISTICS = os.environ['DYNAMODB_TABLE_NAME_RUN_STATISTICS']
+
+# 振り分け処理を行う Lambda 関数の名前を環境変数から取得
+ANALYSIS_QUEUE_DISPATCHER_FUNCTION_NAME = os.environ['ANALYSIS_QUEUE_DISPATCHER_FUNCTION_NAME']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+
+# 解析を待ち行列に登録する Step Functions タスクを実装した Lambda 関数のハンドラ
+# ステートマシンからは `WAIT_FOR_TASK_TOKEN` で呼び出され、実行グループに空きができたときに振り分け処理によって再開される
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    taskToken = event['TaskToken']
+    analysisId = event['AnalysisId']
+    userId = event['UserId']
+    runParams = event['Parameters']
+    runGroupId = runParams.get('RunGroupId')
+    priority = runParams.get('Priority')
+
+    # 実行グループの vCPU 数と GPU 数の空きを判定するため、同じワークフローの過去の実行から使用量を見積もる
+    estimatedResources = None
+    if runGroupId:
+        try:
+            estimatedResources = run_statistics.estimate_run_resources(
+                DYNAMODB_TABLE_NAME_RUN_STATISTICS, runParams.get('WorkflowType') or 'PRIVATE', runParams['WorkflowId'])
+        except botocore.exceptions.ClientError as err:
+            # 見積もりがなくても、実行グループの空きがあれば開始できる
+            logger.warning(f'Failed to estimate resources of workflow {runParams["WorkflowId"]}: {err}')
+
+    analysis_queue.enqueue(DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE, runGroupId, analysisId, userId, priority, taskToken,
+                           estimatedResources)
+
+    # 空きがあればすぐに開始できるよう、振り分け処理を呼び出す
+    analysis_queue.trigger_dispatch(ANALYSIS_QUEUE_DISPATCHER_FUNCTION_NAME)
+
+    return {
+        'AnalysisId': analysisId,
+        'RunGroupKey': analysis_queue.get_run_group_key(runGroupId),
+    }
@@ -1,8 +1,12 @@
+import os
 import boto3
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+import run_callback
+import run_polling
+
 # ログとトレースの機能を初期化
 logger = Logger()
 tracer = Tracer()
@@ -10,6 +14,9 @@ tracer = Tracer()
 # AWS サービスのクライアントを初期化
 omics = boto3.client('omics')
 
+# 次に実行状態を確認するまでの待ち時間の上限 (秒)
+MAX_WAIT_SECONDS = int(os.environ.get('MAX_WAIT_SECONDS', run_polling.MAX_WAIT_SECONDS))
+
 
 # Omics ワークフローの実行状態を取得する Step Functions タスクを実装した Lambda 関数のハンドラ
 # CloudWatch Logs と X-Ray によるログとトレースを有効化
@@ -18,6 +25,8 @@ omics = boto3.client('omics')
 def handler(event: dict, context: LambdaContext) -> dict:
     analysisId = event['AnalysisId']
     omicsRun = event['OmicsRun']
+    # 完了を待つ間の繰り返しでは、ステートのサイズを抑えるため実行状態だけを返す
+    statusOnly = event.get('StatusOnly', False)
 
     # Step Functions ステートマシンから渡されたパラメーターから runId と status を取得する
     runId = omicsRun['RunId']
@@ -46,10 +55,20 @@ def handler(event: dict, context: LambdaContext) -> dict:
     stopTime = response.get('stopTime')
 
     # status に応じて「エラー」および「完了」のフラグを設定し、ワークフロー実行の状態データと共に返す
-    isError = status in ['DELETED', 'CANCELLED', 'FAILED']
-    isFinished = status in ['COMPLETED'] or isError
+    isError = run_callback.is_error(status)
+    isFinished = run_callback.is_finished(status)
 
-    return {
+    # 実行状態、経過時間、同じワークフローの過去の実行時間から、次に実行状態を確認するまでの待ち時間を求める
+    nextWaitSeconds = None
+    if not isFinished:
+        nextWaitSeconds = run_polling.get_next_wait_seconds(
+            status,
+            run_polling.get_elapsed_seconds(response),
+            run_polling.get_expected_duration(workflowId) if status == 'RUNNING' else None,
+            MAX_WAIT_SECONDS,
+        )
+
+    result = {
         'AnalysisId': analysisId,
         'RunId': runId,
         'RoleArn': roleArn,
@@ -57,6 +76,13 @@ def handler(event: dict, context: LambdaContext) -> dict:
         'StatusMessage': statusMessage,
         'IsFinished': isFinished,
         'IsError': isError,
+        'NextWaitSeconds': nextWaitSeconds,
+    }
+    if statusOnly:
+        return result
+
+    return {
+        **result,
         'WorkflowType': workflowType,
         'WorkflowId': workflowId,
         'OutputUri': outputUri,
@@ -0,0 +1,79 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import run_cache
+import run_statistics
+import task_log_metrics
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_CACHE = os.environ['DYNAMODB_TABLE_NAME_RUN_CACHE']
+
+# タスクのログを同時に読む数
+# GetLogEvents の秒間の呼び出し数の上限を超えないよう、少なめにする
+MINING_CONCURRENCY = 4
+
+# Lambda 関数のタイムアウトまでに残す時間 (秒)
+# この時間を切ったら新しいタスクのログを読み始めず、読み終えた分を保存して続きをステートマシンに任せる
+TIME_MARGIN_SECONDS = 120
+
+# 指標をまとめて保存する件数
+SAVE_BATCH_SIZE = 25
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+# ログから指標を取り出すパターン
+patterns = task_log_metrics.load_patterns()
+
+
+# 終了したワークフロー実行の完了したタスクのログから、ツールの処理量の指標を取り出して保存する Step Functions タスクを実装した Lambda 関数のハンドラ
+# 既に指標を保存したタスクのログは読まないため、タイムアウトまでに読み切れなかった場合は、もう一度呼び出すと続きから読む
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    runId = event['OmicsRun']['RunId']
+    deadline = time.time() + context.get_remaining_time_in_millis() / 1000 - TIME_MARGIN_SECONDS
+
+    tasks = [task for task in run_statistics.list_run_tasks(runId, maxCount=None) if task.get('status') == 'COMPLETED']
+    minedKeys = run_cache.list_by_type(DYNAMODB_TABLE_NAME_RUN_CACHE, runId, run_cache.TASK_LOG_METRICS, keysOnly=True)
+    pendingTasks = [
+        task for task in tasks
+        if run_cache.get_task_cache_key(run_cache.TASK_LOG_METRICS, task['taskId']) not in minedKeys
+    ]
+
+    # 期限を過ぎていれば読み始めない (None を返す)
+    def mine(task: dict) -> dict:
+        if time.time() > deadline:
+            return None
+        return task_log_metrics.mine_task_log(runId, task, patterns)
+
+    minedCount = 0
+    values = {}
+    with ThreadPoolExecutor(max_workers=MINING_CONCURRENCY) as executor:
+        futures = [executor.submit(mine, task) for task in pendingTasks]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                continue
+            values[run_cache.get_task_cache_key(run_cache.TASK_LOG_METRICS, result['taskId'])] = result
+            minedCount += 1
+            # 途中でエラーになっても読み終えた分を使えるよう、少しずつ保存する
+            if len(values) >= SAVE_BATCH_SIZE:
+                run_cache.put_many(DYNAMODB_TABLE_NAME_RUN_CACHE, runId, values)
+                values = {}
+    if values:
+        run_cache.put_many(DYNAMODB_TABLE_NAME_RUN_CACHE, runId, values)
+
+    remainingCount = len(pendingTasks) - minedCount
+    return {
+        'RunId': runId,
+        'TaskCount': len(tasks),
+        'MinedTaskCount': minedCount,
+        'RemainingTaskCount': remainingCount,
+        'IsComplete': remainingCount == 0,
+    }
@@ -1,11 +1,19 @@
+import os
 import json
 import botocore
 import boto3
 import email.mime.text
+import task_regressions
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_STATISTICS = os.environ['DYNAMODB_TABLE_NAME_RUN_STATISTICS']
+
+# 通知するタスクの最大数
+MAX_NOTIFIED_REGRESSION_COUNT = 10
+
 # ログとトレースの機能を初期化
 logger = Logger()
 tracer = Tracer()
@@ -14,6 +22,31 @@ tracer = Tracer()
 ses = boto3.client('ses')
 
 
+# 同じワークフローの過去の実行と比べて実行時間が大きく変わったタスクを、本文に追加する文章にする (なければ空文字列を返す)
+# 通知は補助的な情報のため、検出に失敗してもメールは送信する
+def describe_task_regressions(omicsRun: dict, language: str) -> str:
+    try:
+        result = task_regressions.detect_task_regressions(
+            DYNAMODB_TABLE_NAME_RUN_STATISTICS, omicsRun.get('WorkflowType') or 'PRIVATE', omicsRun['WorkflowId'],
+            omicsRun['RunId'])
+    except Exception as err:
+        logger.exception(f'{type(err).__name__}: {err}')
+        return ''
+    if not result or not result['regressions']:
+        return ''
+
+    lines = []
+    for regression in result['regressions'][:MAX_NOTIFIED_REGRESSION_COUNT]:
+        ratio = f" (x{regression['ratio']})" if 'ratio' in regression else ''
+        lines.append(
+            f"- {regression['name']}: {regression['baselineMedianSeconds']:.0f}s -> {regression['meanSeconds']:.0f}s{ratio}")
+    if language == 'ja':
+        title = f"過去 {result['baselineRunCount']} 回の実行と比べて実行時間が大きく変わったタスク:"
+    else:
+        title = f"Tasks whose duration changed significantly compared with the previous {result['baselineRunCount']} runs:"
+    return '\n'.join([title, *lines, ''])
+
+
 # Omics ワークフローの完了を通知する Step Functions タスクを実装した Lambda 関数のハンドラ
 # CloudWatch Logs と X-Ray によるログとトレースを有効化
 @tracer.capture_lambda_handler
@@ -55,6 +88,9 @@ def handler(event: dict, context: LambdaContext) -> dict:
 View details: {linkToDetailsPage}
 Parameters: {json.dumps(parameters, indent=2)}
 """
+        regressions = describe_task_regressions(omicsRun, language)
+        if regressions:
+            body = f'{body}\n{regressions}'
 
     else:
         if language == 'ja':
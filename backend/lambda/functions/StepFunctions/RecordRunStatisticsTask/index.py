@@ -0,0 +1,66 @@
+import os
+import boto3
+import run_accounting
+import run_cache
+import run_statistics
+import usage_rollups
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_STATISTICS = os.environ['DYNAMODB_TABLE_NAME_RUN_STATISTICS']
+DYNAMODB_TABLE_NAME_RUN_CACHE = os.environ['DYNAMODB_TABLE_NAME_RUN_CACHE']
+DYNAMODB_TABLE_NAME_USAGE_ROLLUPS = os.environ['DYNAMODB_TABLE_NAME_USAGE_ROLLUPS']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+# AWS サービスのクライアントを初期化
+omics = boto3.client('omics')
+
+
+# 終了したワークフロー実行の入力サイズ・出力サイズ・ストレージの最大使用量・タスクの実行時間を記録する Step Functions タスクを実装した Lambda 関数のハンドラ
+# 記録した統計情報は、同じワークフローを実行するときのストレージ容量の推奨と進捗の見積もり、使用する vCPU 数の見積もりに使う
+# また、実行のリソースの使用量を、解析を開始したユーザーとワークフローの月ごとの集計値に加算する
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    runId = event['OmicsRun']['RunId']
+    userId = event.get('UserId') or 'UNKNOWN'
+    run = omics.get_run(id=runId)
+
+    # 実行パラメーターに含まれる S3 の入力ファイルの合計サイズ
+    inputBytes = run_statistics.measure_input_bytes(run.get('parameters'))
+
+    # 実行の出力先に書き込まれたファイルの合計サイズ
+    outputUri = run.get('runOutputUri') or f"{run['outputUri'].rstrip('/')}/{runId}/"
+    outputBytes = run_statistics.measure_s3_bytes([outputUri])
+
+    peakStorageGiB = run_statistics.get_peak_storage_gib(runId)
+
+    # タスク名ごとのタスクの数と実行時間 (実行中のワークフロー実行の進捗の見積もりに使う)
+    tasks = run_statistics.list_run_tasks(runId, maxCount=None)
+    taskSummary = run_statistics.summarize_tasks(tasks)
+
+    # 同時に使用した vCPU 数と GPU 数の最大値 (実行グループの空きに応じた解析の開始に使う)
+    peakResources = run_statistics.get_peak_resources(tasks)
+
+    item = run_statistics.record_run_statistics(
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS, run, inputBytes, outputBytes, peakStorageGiB, taskSummary, peakResources)
+
+    # 終了した実行の使用量は変わらないため、使用量の API のためにキャッシュしてから集計値に加算する
+    accounting = run_accounting.compute_accounting(run, tasks)
+    if accounting['isFinal']:
+        run_cache.put(DYNAMODB_TABLE_NAME_RUN_CACHE, runId, run_cache.ACCOUNTING, accounting)
+    recorded = usage_rollups.record_run_usage(DYNAMODB_TABLE_NAME_USAGE_ROLLUPS, userId, run, accounting)
+
+    return {
+        'RunId': runId,
+        'InputBytes': item['inputBytes'],
+        'OutputBytes': item['outputBytes'],
+        **({'PeakStorageGiB': item['peakStorageGiB']} if item.get('peakStorageGiB') is not None else {}),
+        'UsageRecorded': recorded,
+    }
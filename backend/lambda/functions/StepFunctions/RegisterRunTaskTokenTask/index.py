@@ -0,0 +1,40 @@
+import os
+import boto3
+import run_callback
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS = os.environ['DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+# AWS サービスのクライアントを初期化
+omics = boto3.client('omics')
+
+
+# Omics ワークフロー実行の完了を待つタスクトークンを登録する Step Functions タスクを実装した Lambda 関数のハンドラ
+# ステートマシンからは `WAIT_FOR_TASK_TOKEN` で呼び出され、実行状態の変更イベントによって再開される
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    taskToken = event['TaskToken']
+    analysisId = event['AnalysisId']
+    runId = event['OmicsRun']['RunId']
+
+    run_callback.register_task_token(DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS, runId, taskToken, analysisId)
+
+    # 登録前にワークフロー実行が終了していた場合はイベントを取りこぼすため、登録後に実行状態を確認する
+    status = omics.get_run(id=runId)['status']
+    if run_callback.is_finished(status):
+        resumed = run_callback.resume_run(DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS, runId, status)
+        logger.info(f'Run {runId} has already finished with {status} (resumed: {resumed})')
+
+    return {
+        'RunId': runId,
+        'Status': status,
+    }
@@ -0,0 +1,34 @@
+import os
+import analysis_queue
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE = os.environ['DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE']
+
+# 振り分け処理を行う Lambda 関数の名前を環境変数から取得
+ANALYSIS_QUEUE_DISPATCHER_FUNCTION_NAME = os.environ['ANALYSIS_QUEUE_DISPATCHER_FUNCTION_NAME']
+
+# ログとトレースの機能を初期化
+logger = Logger()
+tracer = Tracer()
+
+
+# ワークフロー実行が終了した (または開始できなかった) 解析を待ち行列から削除する Step Functions タスクを実装した Lambda 関数のハンドラ
+# CloudWatch Logs と X-Ray によるログとトレースを有効化
+@tracer.capture_lambda_handler
+@logger.inject_lambda_context(log_event=True)
+def handler(event: dict, context: LambdaContext) -> dict:
+    analysisId = event['AnalysisId']
+    runGroupId = event['Parameters'].get('RunGroupId')
+
+    analysis_queue.release(DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE, runGroupId, analysisId)
+
+    # 空いた実行グループで待機中の解析を開始するため、振り分け処理を呼び出す
+    analysis_queue.trigger_dispatch(ANALYSIS_QUEUE_DISPATCHER_FUNCTION_NAME)
+
+    return {
+        'AnalysisId': analysisId,
+        'RunGroupKey': analysis_queue.get_run_group_key(runGroupId),
+    }
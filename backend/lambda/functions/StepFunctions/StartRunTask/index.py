@@ -1,8 +1,12 @@
 import boto3
+import botocore
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+import run_callback
+import run_polling
+
 # ログとトレースの機能を初期化
 logger = Logger()
 tracer = Tracer()
@@ -10,6 +14,15 @@ tracer = Tracer()
 # AWS サービスのクライアントを初期化
 omics = boto3.client('omics')
 
+# 実行グループやアカウントのクォータを超えたことを表すエラーコード
+QUOTA_ERROR_CODES = ['ServiceQuotaExceededException', 'ThrottlingException']
+
+
+# クォータを超えてワークフローを開始できなかったことを表す例外
+# ステートマシンはこの例外の名前で StartRun を再試行する
+class RunQuotaExceededError(Exception):
+    pass
+
 
 # Omics ワークフローを実行する Step Functions タスクを実装した Lambda 関数のハンドラ
 # CloudWatch Logs と X-Ray によるログとトレースを有効化
@@ -34,27 +47,32 @@ def handler(event: dict, context: LambdaContext) -> dict:
     tags = runParams.get('Tags')
 
     # ワークフローを実行する
-    response = omics.start_run(
-        workflowType=workflowType,
-        workflowId=workflowId,
-        roleArn=roleArn,
-        outputUri=outputUri,
-        parameters=parameters,
-        **({'name': name} if name else {}),
-        **({'priority': priority} if priority is not None else {}),
-        **({'storageCapacity': storageCapacity} if storageCapacity is not None else {}),
-        **({'requestId': requestId} if requestId else {}),
-        **({'runGroupId': runGroupId} if runGroupId else {}),
-        **({'logLevel': logLevel} if logLevel else {}),
-        **({'tags': tags} if tags else {}),
-    )
+    try:
+        response = omics.start_run(
+            workflowType=workflowType,
+            workflowId=workflowId,
+            roleArn=roleArn,
+            outputUri=outputUri,
+            parameters=parameters,
+            **({'name': name} if name else {}),
+            **({'priority': priority} if priority is not None else {}),
+            **({'storageCapacity': storageCapacity} if storageCapacity is not None else {}),
+            **({'requestId': requestId} if requestId else {}),
+            **({'runGroupId': runGroupId} if runGroupId else {}),
+            **({'logLevel': logLevel} if logLevel else {}),
+            **({'tags': tags} if tags else {}),
+        )
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] in QUOTA_ERROR_CODES:
+            raise RunQuotaExceededError(err.response['Error']['Message']) from err
+        raise
 
     runId = response['id']
     status = response['status']
 
     # status に応じて「エラー」および「完了」のフラグを設定し、ワークフロー実行の状態データと共に返す
-    isError = status in ['DELETED', 'CANCELLED', 'FAILED']
-    isFinished = status in ['COMPLETED'] or isError
+    isError = run_callback.is_error(status)
+    isFinished = run_callback.is_finished(status)
 
     return {
         'AnalysisId': analysisId,
@@ -64,4 +82,6 @@ def handler(event: dict, context: LambdaContext) -> dict:
         'StatusMessage': None,
         'IsFinished': isFinished,
         'IsError': isError,
+        # 開始直後は起動中のため、短い間隔で実行状態を確認する
+        'NextWaitSeconds': run_polling.get_next_wait_seconds(status),
     }
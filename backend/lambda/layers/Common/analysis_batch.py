@@ -0,0 +1,152 @@
+import json
+import time
+from datetime import datetime, timezone
+import boto3
+import dynamodb_common
+
+# 複数のサンプルの解析をまとめて開始するバッチを管理するライブラリ
+#
+# AnalysisBatches テーブルの項目
+#   batchId, itemId='#'      バッチの概要 (userId, name, status, total, submittedCount, failedCount,
+#                            config (ステートマシンの入力の共通部分を JSON 化した文字列), createdAt, updatedAt)
+#   batchId, itemId='item#N' サンプルごとの項目 (index, name, parameters, tags, status, executionArn,
+#                            executionStatus, error)
+
+# バッチの概要を表す項目の itemId
+SUMMARY_ITEM_ID = '#'
+
+# バッチの状態
+BATCH_SUBMITTING = 'SUBMITTING'
+BATCH_SUBMITTED = 'SUBMITTED'
+BATCH_PARTIALLY_SUBMITTED = 'PARTIALLY_SUBMITTED'
+BATCH_FAILED = 'FAILED'
+
+# サンプルごとの項目の状態
+ITEM_PENDING = 'PENDING'
+ITEM_SUBMITTED = 'SUBMITTED'
+ITEM_FAILED = 'FAILED'
+
+# ステートマシンの実行が終了したことを表す status
+EXECUTION_FINISHED_STATUSES = ['SUCCEEDED', 'FAILED', 'TIMED_OUT', 'ABORTED']
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+
+# サンプルごとの項目の itemId を返す (インデックスの順に並ぶようにゼロ埋めする)
+def get_item_id(index: int) -> str:
+    return f'item#{index:05d}'
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# バッチの概要とサンプルごとの項目を登録する
+def create_batch(tableName: str, batchId: str, userId: str, name: str, config: dict, samples: list):
+    now = _now()
+    items = [
+        {
+            'batchId': batchId,
+            'itemId': SUMMARY_ITEM_ID,
+            'userId': userId,
+            'name': name,
+            'status': BATCH_SUBMITTING,
+            'total': len(samples),
+            'submittedCount': 0,
+            'failedCount': 0,
+            'config': json.dumps(config),
+            'createdAt': now,
+            'updatedAt': now,
+        },
+        *[
+            {
+                'batchId': batchId,
+                'itemId': get_item_id(index),
+                'index': index,
+                'name': sample.get('name'),
+                'parameters': json.dumps(sample.get('parameters') or {}),
+                'tags': json.dumps(sample['tags']) if sample.get('tags') else None,
+                'status': ITEM_PENDING,
+            }
+            for index, sample in enumerate(samples)
+        ],
+    ]
+
+    # 25 件ずつまとめて書き込み、処理されなかった項目は再試行する
+    for offset in range(0, len(items), 25):
+        requestItems = {
+            tableName: [{'PutRequest': {'Item': dynamodb_common.to_dynamodb(item)}} for item in items[offset:offset + 25]],
+        }
+        for attempt in range(8):
+            response = dynamodb.batch_write_item(RequestItems=requestItems)
+            requestItems = response.get('UnprocessedItems') or {}
+            if not requestItems:
+                break
+            time.sleep(min(2 ** attempt * 0.05, 2))
+        if requestItems:
+            raise RuntimeError(f'Failed to write batch items of {batchId}')
+
+
+# バッチの概要とサンプルごとの項目を取得する (バッチが存在しなければ None を返す)
+def get_batch(tableName: str, batchId: str) -> tuple:
+    summary = None
+    items = []
+    paginator = dynamodb.get_paginator('query')
+    for page in paginator.paginate(
+        TableName=tableName,
+        KeyConditionExpression='batchId = :batchId',
+        ExpressionAttributeValues={
+            ':batchId': {
+                'S': batchId,
+            },
+        },
+        ConsistentRead=True,
+    ):
+        for item in page.get('Items', []):
+            item = dynamodb_common.from_dynamodb(item)
+            if item['itemId'] == SUMMARY_ITEM_ID:
+                summary = item
+            else:
+                items.append(item)
+
+    if summary is None:
+        return None, []
+    return summary, items
+
+
+# サンプルごとの項目の状態を更新する
+def update_item(tableName: str, batchId: str, index: int, **attributes):
+    names = {f'#{key}': key for key in attributes}
+    values = {f':{key}': dynamodb_common.serialize(value) for key, value in attributes.items()}
+    dynamodb.update_item(
+        TableName=tableName,
+        Key=dynamodb_common.to_dynamodb({
+            'batchId': batchId,
+            'itemId': get_item_id(index),
+        }),
+        UpdateExpression='SET ' + ', '.join(f'#{key} = :{key}' for key in attributes),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+
+# バッチの概要の状態と件数を更新する
+def update_summary(tableName: str, batchId: str, status: str, submittedCount: int, failedCount: int):
+    attributes = {
+        'status': status,
+        'submittedCount': submittedCount,
+        'failedCount': failedCount,
+        'updatedAt': _now(),
+    }
+    dynamodb.update_item(
+        TableName=tableName,
+        Key=dynamodb_common.to_dynamodb({
+            'batchId': batchId,
+            'itemId': SUMMARY_ITEM_ID,
+        }),
+        UpdateExpression='SET ' + ', '.join(f'#{key} = :{key}' for key in attributes),
+        ExpressionAttributeNames={f'#{key}': key for key in attributes},
+        ExpressionAttributeValues={
+            f':{key}': dynamodb_common.serialize(value) for key, value in attributes.items()
+        },
+    )
@@ -0,0 +1,158 @@
+import time
+import uuid
+import boto3
+import dynamodb_common
+
+# 解析 (ワークフロー実行とその後の可視化・通知を行うステートマシンの実行) を開始する処理を集めたライブラリ
+# 単一の解析を開始する API と、複数のサンプルの解析をまとめて開始する API で共通利用する
+
+# AWS サービスのクライアントを初期化
+omics = boto3.client('omics')
+dynamodb = boto3.client('dynamodb')
+
+# Omics のワークフロー情報をキャッシュする期間 (秒)
+# ワークフローは作成後に変更されないため、Lambda 関数の実行環境が再利用される間は get_workflow の呼び出しを省略する
+WORKFLOW_CACHE_SECONDS = 15 * 60
+
+# ワークフローの種類と ID ごとの Omics のワークフロー情報のキャッシュ
+workflowCache = {}
+
+
+# Omics のワークフロー情報を取得し、名前・パラメーターテンプレート・パラメーターのデフォルト値を返す
+def resolve_workflow(workflowType: str, workflowId: str, accountId: str, region: str) -> dict:
+    now = time.time()
+    cached = workflowCache.get((workflowType, workflowId))
+    if cached and cached['expiresAt'] > now:
+        response = cached['response']
+    else:
+        response = omics.get_workflow(
+            type=workflowType,
+            id=workflowId,
+        )
+        workflowCache[(workflowType, workflowId)] = {
+            'expiresAt': now + WORKFLOW_CACHE_SECONDS,
+            'response': response,
+        }
+    parameterTemplate = response.get('parameterTemplate') or {}
+
+    # ワークフローの実行パラメーターのデフォルト値を設定
+    comprehensiveParameterDefaults = {
+        'ecr_registry': f'{accountId}.dkr.ecr.{region}.amazonaws.com/',
+    }
+    # パラメーターテンプレートに存在するパラメーターのみを残す
+    parameterDefaults = {
+        key: value
+        for key, value in comprehensiveParameterDefaults.items() if key in parameterTemplate and value is not None
+    }
+
+    return {
+        'name': response.get('name'),
+        'digest': response.get('digest'),
+        'parameterTemplate': parameterTemplate,
+        'parameterDefaults': parameterDefaults,
+    }
+
+
+# リクエストボディから可視化の ID の一覧を取得する (従来の `visualizerId` も引き続き受け付ける)
+def get_visualizer_ids(requestBody: dict) -> list:
+    visualizerIds = list(requestBody.get('visualizerIds') or [])
+    visualizerId = requestBody.get('visualizerId')
+    if visualizerId and visualizerId not in visualizerIds:
+        visualizerIds.insert(0, visualizerId)
+    return list(dict.fromkeys(visualizerIds))
+
+
+# ワークフローに登録された可視化の情報を取得し、ステートマシンの入力 `Visualizers` の形式で返す
+def get_visualizers(tableName: str, workflowType: str, workflowId: str, visualizerIds: list, roleArn: str) -> list:
+    visualizers = []
+    for visualizerId in visualizerIds:
+        response = dynamodb.get_item(
+            TableName=tableName,
+            Key={
+                'workflowId': {
+                    'S': f'{workflowType}_{workflowId}',
+                },
+                'visualizerId': {
+                    'S': visualizerId,
+                },
+            },
+        )
+        item = response.get('Item')
+        if not item:
+            continue
+
+        item = dynamodb_common.from_dynamodb(item)
+        visualizers.append({
+            'VisualizerId': visualizerId,
+            'Name': item.get('name'),
+            'StateMachineArn': item['stateMachineArn'],
+            'RoleArn': roleArn,
+        })
+    return visualizers
+
+
+# リクエストボディからワークフローの実行パラメーター (ステートマシンの入力 `OmicsStartRun`) を作成する
+def build_start_run(workflowType: str, workflowId: str, workflow: dict, roleArn: str, outputUri: str,
+                    requestBody: dict) -> dict:
+    parameters = requestBody.get('parameters')
+    name = requestBody.get('name')
+    priority = requestBody.get('priority')
+    storageCapacity = requestBody.get('storageCapacity')
+    requestId = requestBody.get('requestId') or str(uuid.uuid4())
+    runGroupId = requestBody.get('runGroupId')
+    logLevel = requestBody.get('logLevel')
+    tags = requestBody.get('tags')
+
+    return {
+        'WorkflowType': workflowType,
+        'WorkflowId': workflowId,
+        'WorkflowName': workflow['name'],
+        'RoleArn': roleArn,
+        'OutputUri': outputUri.rstrip('/'),
+        'Parameters': {
+            **workflow['parameterDefaults'],
+            **(parameters or {}),
+        },
+        **({'Name': name} if name else {}),
+        **({'Priority': priority} if priority is not None else {}),
+        **({'StorageCapacity': storageCapacity} if storageCapacity is not None else {}),
+        **({'RequestId': requestId} if requestId else {}),
+        **({'RunGroupId': runGroupId} if runGroupId else {}),
+        **({'LogLevel': logLevel} if logLevel else {}),
+        **({'Tags': tags} if tags else {}),
+    }
+
+
+# ワークフロー実行完了メールの内容に反映するため、リクエストヘッダーから通知の設定 (ステートマシンの入力 `Notification`) を作成する
+def build_notification(email: str, headers: dict) -> dict:
+    return {
+        'Email': email,
+        'FrontendOrigin': headers['origin'],
+        'AcceptLanguage': headers['accept-language'],
+    }
+
+
+# Step Functions ステートマシンの入力を作成する
+# fingerprint を指定すると、ワークフロー実行が完了したときに結果を再利用できるよう登録する
+def build_execution_input(userId: str, startRun: dict, visualizers: list, notification: dict,
+                          fingerprint: str = None) -> dict:
+    return {
+        'UserId': userId,
+        'OmicsStartRun': startRun,
+        **({'Visualizers': visualizers} if visualizers else {}),
+        'Notification': notification,
+        **({'Fingerprint': fingerprint} if fingerprint else {}),
+    }
+
+
+# 完了済みのワークフロー実行の結果を再利用する Step Functions ステートマシンの入力を作成する
+# ワークフローは実行せず、既存の実行の出力に対して可視化と通知を行う
+def build_reuse_execution_input(userId: str, runId: str, visualizers: list, notification: dict) -> dict:
+    return {
+        'UserId': userId,
+        'OmicsRun': {
+            'RunId': runId,
+        },
+        **({'Visualizers': visualizers} if visualizers else {}),
+        'Notification': notification,
+    }
@@ -0,0 +1,179 @@
+import json
+import time
+import hashlib
+import boto3
+import botocore
+import dynamodb_common
+
+# 解析の開始を冪等にするためのライブラリ
+#
+# API Gateway のタイムアウトなどでクライアントが同じリクエストを再送しても、ステートマシンの実行と Omics のワークフロー実行が
+# 重複して開始されないよう、冪等性キーごとに最初のリクエストの結果を AnalysisIdempotency テーブルに保存し、再送されたリクエストには保存した結果を返す
+#
+# AnalysisIdempotency テーブルの項目
+#   idempotencyKey  ユーザー ID と冪等性キーを連結した値
+#   status          IN_PROGRESS: 処理中, COMPLETED: 完了
+#   requestHash     リクエストボディのハッシュ値 (同じ冪等性キーで異なるリクエストが送られたことを検出する)
+#   executionArn    開始したステートマシンの実行の ARN
+#   response        最初のリクエストに返したレスポンスボディ
+#   createdAt       項目を作成した時刻
+#   lockedUntil     処理中の項目を、処理が異常終了したとみなして引き継げるようになる時刻
+#   expiresAt       項目を自動削除する時刻 (TTL)
+
+# 冪等性キーを指定するリクエストヘッダー
+IDEMPOTENCY_KEY_HEADER = 'idempotency-key'
+
+# 項目の状態
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+# 完了した項目を保持する期間 (秒)
+EXPIRATION_SECONDS = 24 * 60 * 60
+# 冪等性キーが指定されず、リクエストボディから求めた場合に保持する期間 (秒)
+# 同じ内容の解析を意図して再度開始できるよう、再送とみなす期間を短くする
+DERIVED_KEY_EXPIRATION_SECONDS = 10 * 60
+
+# 処理中の項目を引き継げるようになるまでの時間 (秒)
+# API の Lambda 関数のタイムアウトより長くする
+LOCK_SECONDS = 60
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+
+# 同じ冪等性キーのリクエストが処理中であることを表すエラー
+class RequestInProgressError(Exception):
+    pass
+
+
+# 同じ冪等性キーで異なる内容のリクエストが送られたことを表すエラー
+class RequestMismatchError(Exception):
+    pass
+
+
+# リクエストボディのハッシュ値を求める
+def hash_request(requestBody: dict) -> str:
+    canonical = json.dumps(requestBody, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+# リクエストヘッダーに指定された冪等性キーを返す (指定されていなければ None を返す)
+def get_idempotency_key(headers: dict) -> str:
+    for name, value in (headers or {}).items():
+        if name.lower() == IDEMPOTENCY_KEY_HEADER and value and value.strip():
+            return value.strip()
+    return None
+
+
+# 冪等性キーと項目の作成時刻から、ステートマシンの実行の名前や Omics の requestId に使う一定の文字列を求める
+# 処理中のまま放置された項目を引き継いだ場合も同じ文字列になり、前回の処理が開始した実行と重複しない
+def _derive_token(key: str, createdAt: int) -> str:
+    return f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:48]}-{createdAt}"
+
+
+# リクエストの処理を開始する
+# 最初のリクエストであれば (None, 実行の名前に使う文字列) を返し、同じリクエストが既に完了していれば (保存したレスポンスボディ, None) を返す
+def begin(tableName: str, userId: str, idempotencyKey: str, requestHash: str,
+          expirationSeconds: int = EXPIRATION_SECONDS) -> tuple:
+    now = int(time.time())
+    key = f'{userId}#{idempotencyKey}'
+    try:
+        # 項目がない場合と、TTL で削除されるのを待っている場合のみ書き込める
+        dynamodb.put_item(
+            TableName=tableName,
+            Item=dynamodb_common.to_dynamodb({
+                'idempotencyKey': key,
+                'status': IN_PROGRESS,
+                'requestHash': requestHash,
+                'createdAt': now,
+                'lockedUntil': now + LOCK_SECONDS,
+                'expiresAt': now + expirationSeconds,
+            }),
+            ConditionExpression='attribute_not_exists(idempotencyKey) OR expiresAt < :now',
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':now': now,
+            }),
+            ReturnValuesOnConditionCheckFailure='ALL_OLD',
+        )
+        return None, _derive_token(key, now)
+
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        item = dynamodb_common.from_dynamodb(err.response.get('Item') or {})
+
+    if item.get('requestHash') != requestHash:
+        raise RequestMismatchError(f'Idempotency key {idempotencyKey} was used for a different request')
+    if item.get('status') == COMPLETED:
+        return json.loads(item['response']), None
+    if item.get('lockedUntil', 0) >= now:
+        raise RequestInProgressError(f'A request with idempotency key {idempotencyKey} is in progress')
+
+    # 処理中のまま放置されている項目は、作成時刻を変えずに引き継ぐ
+    try:
+        dynamodb.update_item(
+            TableName=tableName,
+            Key=dynamodb_common.to_dynamodb({
+                'idempotencyKey': key,
+            }),
+            UpdateExpression='SET lockedUntil = :lockedUntil',
+            ConditionExpression='#status = :inProgress AND lockedUntil < :now',
+            ExpressionAttributeNames={
+                '#status': 'status',
+            },
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':lockedUntil': now + LOCK_SECONDS,
+                ':inProgress': IN_PROGRESS,
+                ':now': now,
+            }),
+        )
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        raise RequestInProgressError(f'A request with idempotency key {idempotencyKey} is in progress')
+    return None, _derive_token(key, int(item['createdAt']))
+
+
+# リクエストの処理が完了したら、開始したステートマシンの実行とレスポンスボディを保存する
+def complete(tableName: str, userId: str, idempotencyKey: str, executionArn: str, response: dict,
+             expirationSeconds: int = EXPIRATION_SECONDS):
+    now = int(time.time())
+    dynamodb.update_item(
+        TableName=tableName,
+        Key=dynamodb_common.to_dynamodb({
+            'idempotencyKey': f'{userId}#{idempotencyKey}',
+        }),
+        UpdateExpression='SET #status = :completed, executionArn = :executionArn, #response = :response, '
+                         'expiresAt = :expiresAt REMOVE lockedUntil',
+        ExpressionAttributeNames={
+            '#status': 'status',
+            '#response': 'response',
+        },
+        ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+            ':completed': COMPLETED,
+            ':executionArn': executionArn,
+            ':response': json.dumps(response),
+            ':expiresAt': now + expirationSeconds,
+        }),
+    )
+
+
+# ステートマシンの実行を開始しなかった場合やエラーが発生した場合に、同じキーで再送できるよう項目を削除する
+def cancel(tableName: str, userId: str, idempotencyKey: str):
+    try:
+        dynamodb.delete_item(
+            TableName=tableName,
+            Key=dynamodb_common.to_dynamodb({
+                'idempotencyKey': f'{userId}#{idempotencyKey}',
+            }),
+            ConditionExpression='#status = :inProgress',
+            ExpressionAttributeNames={
+                '#status': 'status',
+            },
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':inProgress': IN_PROGRESS,
+            }),
+        )
+    except botocore.exceptions.ClientError as err:
+        # 既に完了していれば削除しない
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
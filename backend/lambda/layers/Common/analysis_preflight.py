@@ -0,0 +1,146 @@
+import boto3
+import botocore
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+# ワークフロー実行を開始する前に、実行パラメーターと入力ファイルを検証するライブラリ
+# ワークフロー実行はストレージの確保などに時間がかかり、パラメーターの誤りで失敗するまで 10 分以上かかることがあるため、
+# 開始する前に検出できる問題を全て洗い出して返す
+#
+# 問題は次の形式の dict で表す
+#   parameter  問題のあるパラメーターの名前
+#   code       問題の種類 (MISSING_PARAMETER, UNKNOWN_PARAMETER, INVALID_S3_URI, S3_OBJECT_NOT_FOUND, S3_ACCESS_DENIED,
+#              TOO_MANY_S3_URIS, RUN_GROUP_NOT_FOUND)
+#   severity   ERROR: ワークフロー実行が失敗する問題, WARNING: 失敗する可能性がある問題
+#   message    問題の内容
+#   uri        問題のある S3 URI (S3 の問題の場合のみ)
+
+ERROR = 'ERROR'
+WARNING = 'WARNING'
+
+# S3 の URI を同時に確認する数と、1 回の検証で確認する最大数
+S3_CHECK_CONCURRENCY = 16
+MAX_S3_CHECK_COUNT = 500
+
+# AWS サービスのクライアントを初期化
+s3 = boto3.client('s3')
+omics = boto3.client('omics')
+
+
+def _problem(parameter: str, code: str, severity: str, message: str, uri: str = None) -> dict:
+    return {
+        'parameter': parameter,
+        'code': code,
+        'severity': severity,
+        'message': message,
+        **({'uri': uri} if uri else {}),
+    }
+
+
+# パラメーターの値に含まれる S3 の URI を、パラメーター名と共に列挙する
+def find_s3_uris(name: str, value) -> list:
+    if isinstance(value, str):
+        return [(name, value.strip())] if value.strip().startswith('s3://') else []
+    elif isinstance(value, dict):
+        return [uri for key, item in value.items() for uri in find_s3_uris(f'{name}.{key}', item)]
+    elif isinstance(value, (list, tuple)):
+        return [uri for index, item in enumerate(value) for uri in find_s3_uris(f'{name}[{index}]', item)]
+    return []
+
+
+# パラメーターテンプレートと照らし合わせて、必須のパラメーターの不足と、テンプレートにないパラメーターを検出する
+def validate_parameters(parameterTemplate: dict, parameters: dict) -> list:
+    problems = []
+    for name, definition in (parameterTemplate or {}).items():
+        optional = (definition or {}).get('optional', False)
+        value = (parameters or {}).get(name)
+        if not optional and (value is None or value == ''):
+            problems.append(_problem(name, 'MISSING_PARAMETER', ERROR, f'Required parameter {name} is not specified'))
+
+    for name in (parameters or {}).keys():
+        if name not in (parameterTemplate or {}):
+            problems.append(_problem(name, 'UNKNOWN_PARAMETER', ERROR, f'Parameter {name} is not defined by the workflow'))
+    return problems
+
+
+# S3 の URI が指すオブジェクト、またはプレフィックス (フォルダー) が存在するかを確認する
+def check_s3_uri(parameter: str, uri: str) -> dict:
+    parsed = urlparse(uri)
+    bucket = parsed.netloc
+    key = parsed.path.lstrip('/')
+    if not bucket:
+        return _problem(parameter, 'INVALID_S3_URI', ERROR, f'{uri} is not a valid S3 URI', uri)
+
+    try:
+        if key and not key.endswith('/'):
+            try:
+                s3.head_object(Bucket=bucket, Key=key)
+                return None
+            except botocore.exceptions.ClientError as err:
+                if err.response['Error']['Code'] not in ['404', 'NoSuchKey']:
+                    raise
+
+        # オブジェクトがなければ、同じプレフィックスを持つオブジェクトがあるかを確認する (ワイルドカードを含む場合も前方一致で確認する)
+        prefix = key.split('*', 1)[0]
+        response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1)
+        if response.get('KeyCount', 0) > 0:
+            return None
+        return _problem(parameter, 'S3_OBJECT_NOT_FOUND', ERROR, f'{uri} does not exist', uri)
+
+    except botocore.exceptions.ClientError as err:
+        code = err.response['Error']['Code']
+        if code == 'NoSuchBucket':
+            return _problem(parameter, 'S3_OBJECT_NOT_FOUND', ERROR, f'Bucket {bucket} of {uri} does not exist', uri)
+        # API からは参照できなくても、ワークフロー実行のロールからは参照できる場合があるため、警告にとどめる
+        if code in ['403', 'AccessDenied']:
+            return _problem(parameter, 'S3_ACCESS_DENIED', WARNING, f'{uri} could not be accessed for validation', uri)
+        raise
+
+
+# 実行グループが存在するかを確認する
+# 存在しない実行グループを指定した解析は、待ち行列で空きを判定できずに待ち続けるため、開始する前に検出する
+def check_run_group(runGroupId: str) -> dict:
+    if not runGroupId:
+        return None
+
+    try:
+        omics.get_run_group(id=runGroupId)
+        return None
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] in ['ResourceNotFoundException', 'ValidationException']:
+            return _problem('runGroupId', 'RUN_GROUP_NOT_FOUND', ERROR, f'Run group {runGroupId} does not exist')
+        raise
+
+
+# 実行パラメーターと、パラメーターに含まれる S3 の URI と、実行グループを検証し、見つかった問題を全て返す
+# S3 の URI は重複を除いてから並列に確認する
+def validate(parameterTemplate: dict, parameters: dict, runGroupId: str = None) -> list:
+    problems = validate_parameters(parameterTemplate, parameters)
+    runGroupProblem = check_run_group(runGroupId)
+    if runGroupProblem:
+        problems.append(runGroupProblem)
+
+    # 同じ URI を複数のパラメーターで指定していても、確認は 1 回だけ行う
+    parameterNames = {}
+    for key, value in (parameters or {}).items():
+        for name, uri in find_s3_uris(key, value):
+            parameterNames.setdefault(uri, []).append(name)
+    s3Uris = list(parameterNames.keys())
+    if len(s3Uris) > MAX_S3_CHECK_COUNT:
+        problems.append(_problem(
+            None, 'TOO_MANY_S3_URIS', WARNING,
+            f'Only the first {MAX_S3_CHECK_COUNT} of {len(s3Uris)} S3 URIs were validated'))
+        s3Uris = s3Uris[:MAX_S3_CHECK_COUNT]
+
+    if s3Uris:
+        with ThreadPoolExecutor(max_workers=S3_CHECK_CONCURRENCY) as executor:
+            results = list(executor.map(lambda uri: check_s3_uri(parameterNames[uri][0], uri), s3Uris))
+        for uri, problem in zip(s3Uris, results):
+            if problem:
+                problems.extend({**problem, 'parameter': name} for name in parameterNames[uri])
+    return problems
+
+
+# ワークフロー実行が失敗する問題があるかを返す
+def has_errors(problems: list) -> bool:
+    return any(problem['severity'] == ERROR for problem in problems)
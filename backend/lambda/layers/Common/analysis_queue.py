@@ -0,0 +1,422 @@
+import json
+import time
+import threading
+from datetime import datetime, timezone
+import boto3
+import botocore
+import dynamodb_common
+from aws_lambda_powertools import Logger
+
+# 解析を Omics の実行グループの空き状況に応じて開始するための待ち行列を管理するライブラリ
+#
+# ステートマシンはワークフローを実行する前にタスクトークンと共に待ち行列へ登録して待機し、
+# 振り分け処理 (dispatch) が実行グループの空きに応じて、ユーザーごとの公平性と優先度の順にステートマシンを再開する
+#
+# AnalysisQueue テーブルの項目
+#   runGroupKey  実行グループの ID (実行グループを指定しない場合は DEFAULT_RUN_GROUP_KEY)
+#   analysisId   ステートマシンの実行 ID
+#   userId, priority, enqueuedAt, taskToken
+#   estimatedCpus, estimatedGpus  同じワークフローの過去の実行から見積もった、同時に使用する vCPU 数と GPU 数 (記録がなければない)
+#   status       QUEUED: 待機中, DISPATCHED: 再開済み (ワークフロー実行の終了時に削除する)
+#   dispatchedAt, checkedAt, expiresAt
+
+# 実行グループを指定しない解析の runGroupKey
+DEFAULT_RUN_GROUP_KEY = '-'
+
+# 待ち行列の項目の状態
+QUEUED = 'QUEUED'
+DISPATCHED = 'DISPATCHED'
+
+# 解析を再開する速度 (1 秒あたりの回数) と、まとめて再開できる回数の既定値
+# 再開した解析はすぐに Omics の StartRun を呼び出すため、StartRun のクォータに合わせる
+DEFAULT_START_RATE = 1
+DEFAULT_START_BURST = 5
+
+# 再開済みの項目を保持する期間 (秒)
+# ステートマシンが異常終了して削除されなかった項目は TTL で自動的に削除する
+DISPATCHED_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# 再開済みの項目について、ステートマシンの実行が続いているかを確認する間隔 (秒) と、1 回の振り分けで確認する最大数
+CHECK_INTERVAL_SECONDS = 15 * 60
+MAX_CHECK_COUNT = 50
+
+# 実行グループが存在しない (削除された) ことを示す Omics のエラーコード
+RUN_GROUP_NOT_FOUND_ERROR_CODES = ['ResourceNotFoundException', 'ValidationException']
+
+# 終了していないワークフロー実行の status
+ACTIVE_RUN_STATUSES = ['PENDING', 'STARTING', 'RUNNING', 'STOPPING']
+
+# 実行グループの vCPU 数と GPU 数を使用している (または使用を待っている) タスクの status
+ACTIVE_TASK_STATUSES = ['PENDING', 'STARTING', 'RUNNING', 'STOPPING']
+
+# ログの機能を初期化
+logger = Logger()
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+omics = boto3.client('omics')
+sfn = boto3.client('stepfunctions')
+lambdaClient = boto3.client('lambda')
+
+# 一定の速度で呼び出しを許可するトークンバケット
+# Omics の StartRun などの API のクォータを超えないよう、呼び出し前に acquire() で待機する
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        # 1 秒あたりに補充するトークンの数と、貯めておけるトークンの最大数
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updatedAt = time.monotonic()
+        self.lock = threading.Lock()
+
+    # トークンを 1 つ取得できるまで待機する
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updatedAt) * self.rate)
+                self.updatedAt = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                waitSeconds = (1 - self.tokens) / self.rate
+            time.sleep(waitSeconds)
+
+
+# 実行グループの ID から runGroupKey を返す
+def get_run_group_key(runGroupId: str) -> str:
+    return runGroupId or DEFAULT_RUN_GROUP_KEY
+
+
+# 解析を待ち行列に登録する
+# estimatedResources には、同時に使用する vCPU 数と GPU 数の見積もり ({'cpus', 'gpus'}) を指定する
+def enqueue(tableName: str, runGroupId: str, analysisId: str, userId: str, priority: int, taskToken: str,
+            estimatedResources: dict = None):
+    dynamodb.put_item(
+        TableName=tableName,
+        Item=dynamodb_common.to_dynamodb({
+            'runGroupKey': get_run_group_key(runGroupId),
+            'analysisId': analysisId,
+            'userId': userId,
+            'priority': int(priority or 0),
+            'enqueuedAt': datetime.now(timezone.utc).isoformat(),
+            'taskToken': taskToken,
+            'status': QUEUED,
+            'estimatedCpus': (estimatedResources or {}).get('cpus'),
+            'estimatedGpus': (estimatedResources or {}).get('gpus'),
+        }),
+    )
+
+
+# ワークフロー実行が終了した解析を待ち行列から削除する
+def release(tableName: str, runGroupId: str, analysisId: str):
+    dynamodb.delete_item(
+        TableName=tableName,
+        Key=dynamodb_common.to_dynamodb({
+            'runGroupKey': get_run_group_key(runGroupId),
+            'analysisId': analysisId,
+        }),
+    )
+
+
+# 振り分け処理を行う Lambda 関数を非同期に呼び出す
+def trigger_dispatch(functionName: str):
+    lambdaClient.invoke(
+        FunctionName=functionName,
+        InvocationType='Event',
+        Payload=json.dumps({}),
+    )
+
+
+# 待ち行列の全ての項目を取得する
+def list_items(tableName: str) -> list:
+    items = []
+    paginator = dynamodb.get_paginator('scan')
+    for page in paginator.paginate(TableName=tableName):
+        items.extend(dynamodb_common.from_dynamodb(item) for item in page.get('Items', []))
+    return items
+
+
+# 実行グループで同時に実行できるワークフロー実行の数、vCPU 数、GPU 数を返す (制限がなければ None にする)
+def get_run_group_limits(runGroupKey: str, defaultMaxRuns: int) -> dict:
+    if runGroupKey == DEFAULT_RUN_GROUP_KEY:
+        return {
+            'maxRuns': defaultMaxRuns or None,
+            'maxCpus': None,
+            'maxGpus': None,
+        }
+    runGroup = omics.get_run_group(id=runGroupKey)
+    return {
+        'maxRuns': runGroup.get('maxRuns'),
+        'maxCpus': runGroup.get('maxCpus'),
+        'maxGpus': runGroup.get('maxGpus'),
+    }
+
+
+def _list_active_run_ids(runGroupId: str = None) -> set:
+    runIds = set()
+    paginator = omics.get_paginator('list_runs')
+    for status in ACTIVE_RUN_STATUSES:
+        for page in paginator.paginate(
+            status=status,
+            **({'runGroupId': runGroupId} if runGroupId else {}),
+        ):
+            runIds.update(item['id'] for item in page.get('items', []))
+    return runIds
+
+
+# 実行グループで実行中のワークフロー実行の ID を返す (このアプリケーション以外から開始された実行も含める)
+# 実行グループを指定しない解析では、いずれかの実行グループに属する実行を除く
+def list_active_run_ids(runGroupKey: str) -> set:
+    if runGroupKey != DEFAULT_RUN_GROUP_KEY:
+        return _list_active_run_ids(runGroupKey)
+
+    # ListRuns の結果には実行グループの ID が含まれないため、実行グループごとの実行を取得して除く
+    runIds = _list_active_run_ids()
+    if runIds:
+        paginator = omics.get_paginator('list_run_groups')
+        for page in paginator.paginate():
+            for runGroup in page.get('items', []):
+                runIds -= _list_active_run_ids(runGroup['id'])
+    return runIds
+
+
+# 実行中のワークフロー実行のタスクが使用している vCPU 数と GPU 数の合計を返す
+def measure_used_resources(runIds: set) -> dict:
+    cpus = gpus = 0
+    paginator = omics.get_paginator('list_run_tasks')
+    for runId in runIds:
+        try:
+            for page in paginator.paginate(id=runId):
+                for task in page.get('items', []):
+                    if task.get('status') in ACTIVE_TASK_STATUSES:
+                        cpus += task.get('cpus') or 0
+                        gpus += task.get('gpus') or 0
+        except botocore.exceptions.ClientError as err:
+            # 一覧の取得後に削除された実行は数えない
+            if err.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+    return {
+        'cpus': cpus,
+        'gpus': gpus,
+    }
+
+
+# 見積もりの vCPU 数 (GPU 数) の解析を開始できる空きがあるかを返す
+# 見積もりがない解析と、見積もりが上限を超える解析は、使用中の数が上限未満であれば開始する (待ち続けないように)
+def has_capacity(limit: int, used: int, required: int) -> bool:
+    if not limit:
+        return True
+    if used >= limit:
+        return False
+    return not required or required > limit or used + required <= limit
+
+
+# 待機中の解析から、再開する解析を選ぶ
+# 実行中の解析が少ないユーザーを優先し (公平性)、同じユーザーの中では優先度の高い順、登録の古い順に選ぶ
+def select_items(queuedItems: list, userActiveCounts: dict, available: int) -> list:
+    candidates = sorted(queuedItems, key=lambda item: (-item.get('priority', 0), item['enqueuedAt']))
+    userActiveCounts = dict(userActiveCounts)
+    selected = []
+    while candidates and len(selected) < available:
+        item = min(candidates, key=lambda item: userActiveCounts.get(item['userId'], 0))
+        candidates.remove(item)
+        selected.append(item)
+        userActiveCounts[item['userId']] = userActiveCounts.get(item['userId'], 0) + 1
+    return selected
+
+
+# 待機中の解析を再開済みにし、ステートマシンの実行を再開する
+def dispatch_item(tableName: str, item: dict) -> bool:
+    now = int(time.time())
+    try:
+        dynamodb.update_item(
+            TableName=tableName,
+            Key=dynamodb_common.to_dynamodb({
+                'runGroupKey': item['runGroupKey'],
+                'analysisId': item['analysisId'],
+            }),
+            UpdateExpression='SET #status = :dispatched, dispatchedAt = :now, checkedAt = :now, expiresAt = :expiresAt',
+            ConditionExpression='#status = :queued',
+            ExpressionAttributeNames={
+                '#status': 'status',
+            },
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':dispatched': DISPATCHED,
+                ':queued': QUEUED,
+                ':now': now,
+                ':expiresAt': now + DISPATCHED_TTL_SECONDS,
+            }),
+        )
+    except botocore.exceptions.ClientError as err:
+        # 他の振り分け処理が既に再開した
+        if err.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+    try:
+        sfn.send_task_success(
+            taskToken=item['taskToken'],
+            output=json.dumps({
+                'RunGroupKey': item['runGroupKey'],
+            }),
+        )
+        return True
+    except botocore.exceptions.ClientError as err:
+        # ステートマシンの実行が既に終了していれば、待ち行列から削除する
+        if err.response['Error']['Code'] in ['TaskTimedOut', 'TaskDoesNotExist', 'InvalidToken']:
+            release(tableName, item['runGroupKey'], item['analysisId'])
+            return False
+
+        # 一時的なエラーなどで再開できなかった場合は、次回の振り分けで再開できるよう待機中に戻す
+        requeue_item(tableName, item)
+        raise
+
+
+# 再開済みにした項目を待機中に戻す
+def requeue_item(tableName: str, item: dict):
+    try:
+        dynamodb.update_item(
+            TableName=tableName,
+            Key=dynamodb_common.to_dynamodb({
+                'runGroupKey': item['runGroupKey'],
+                'analysisId': item['analysisId'],
+            }),
+            UpdateExpression='SET #status = :queued REMOVE dispatchedAt, checkedAt, expiresAt',
+            ConditionExpression='#status = :dispatched',
+            ExpressionAttributeNames={
+                '#status': 'status',
+            },
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':queued': QUEUED,
+                ':dispatched': DISPATCHED,
+            }),
+        )
+    except botocore.exceptions.ClientError as err:
+        # 既に削除されている
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+# 再開できない待機中の解析を失敗としてステートマシンに返し、待ち行列から削除する
+def fail_items(tableName: str, items: list, error: str, cause: str):
+    for item in items:
+        try:
+            sfn.send_task_failure(
+                taskToken=item['taskToken'],
+                error=error,
+                cause=cause,
+            )
+        except botocore.exceptions.ClientError as err:
+            # ステートマシンの実行が既に終了していれば、削除だけを行う
+            if err.response['Error']['Code'] not in ['TaskTimedOut', 'TaskDoesNotExist', 'InvalidToken']:
+                raise
+        release(tableName, item['runGroupKey'], item['analysisId'])
+
+
+# 再開済みのまま残っている項目のうち、ステートマシンの実行が終了しているものを削除する
+def cleanup_dispatched_items(tableName: str, dispatchedItems: list) -> list:
+    now = int(time.time())
+    staleItems = [item for item in dispatchedItems if item.get('checkedAt', 0) + CHECK_INTERVAL_SECONDS < now]
+    remainingItems = [item for item in dispatchedItems if item not in staleItems]
+    for item in staleItems[:MAX_CHECK_COUNT]:
+        try:
+            status = sfn.describe_execution(executionArn=item['analysisId'])['status']
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] != 'ExecutionDoesNotExist':
+                raise
+            status = None
+
+        if status != 'RUNNING':
+            release(tableName, item['runGroupKey'], item['analysisId'])
+            continue
+
+        dynamodb.update_item(
+            TableName=tableName,
+            Key=dynamodb_common.to_dynamodb({
+                'runGroupKey': item['runGroupKey'],
+                'analysisId': item['analysisId'],
+            }),
+            UpdateExpression='SET checkedAt = :now',
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':now': now,
+            }),
+        )
+        remainingItems.append(item)
+    return remainingItems + staleItems[MAX_CHECK_COUNT:]
+
+
+# 実行グループごとの空きに応じて、待機中の解析を再開する
+# bucket を指定した場合は、StartRun のクォータを超えないよう再開する速度を制限する
+# deadline (time.time() の値) を過ぎたら、残りの解析は次回の振り分けで再開する
+# 再開した解析の数を返す
+def dispatch(tableName: str, defaultMaxRuns: int = 0, bucket: TokenBucket = None, deadline: float = None) -> int:
+    items = list_items(tableName)
+    queuedItems = [item for item in items if item['status'] == QUEUED]
+    dispatchedItems = cleanup_dispatched_items(tableName, [item for item in items if item['status'] == DISPATCHED])
+    if not queuedItems:
+        return 0
+
+    # ユーザーごとの実行中の解析の数 (全ての実行グループで合計する)
+    userActiveCounts = {}
+    for item in dispatchedItems:
+        userActiveCounts[item['userId']] = userActiveCounts.get(item['userId'], 0) + 1
+
+    dispatchedCount = 0
+    runGroupKeys = sorted(set(item['runGroupKey'] for item in queuedItems))
+    for runGroupKey in runGroupKeys:
+        groupQueuedItems = [item for item in queuedItems if item['runGroupKey'] == runGroupKey]
+        groupDispatchedItems = [item for item in dispatchedItems if item['runGroupKey'] == runGroupKey]
+
+        # 実行グループの情報を取得できなくても、他の実行グループの振り分けは続ける
+        try:
+            limits = get_run_group_limits(runGroupKey, defaultMaxRuns)
+            activeRunIds = list_active_run_ids(runGroupKey) if any(limits.values()) else set()
+            used = measure_used_resources(activeRunIds) if limits['maxCpus'] or limits['maxGpus'] else None
+        except botocore.exceptions.ClientError as err:
+            code = err.response['Error']['Code']
+            message = err.response['Error']['Message']
+            if runGroupKey != DEFAULT_RUN_GROUP_KEY and code in RUN_GROUP_NOT_FOUND_ERROR_CODES:
+                # 実行グループが存在しなければ、空きができることはないため、待機中の解析を失敗とする
+                logger.warning(f'Run group {runGroupKey} does not exist: {code}: {message}')
+                fail_items(tableName, groupQueuedItems, 'RunGroupNotFound', f'Run group {runGroupKey} does not exist')
+            else:
+                # 一時的なエラーであれば、次回の振り分けで再開する
+                logger.warning(f'Failed to get capacity of run group {runGroupKey}: {code}: {message}')
+            continue
+
+        if limits['maxRuns'] is None:
+            available = len(groupQueuedItems)
+        else:
+            # 開始直後でまだ一覧に現れない実行も数えるため、再開済みの項目の数と比べて大きい方を使う
+            available = limits['maxRuns'] - max(len(groupDispatchedItems), len(activeRunIds))
+        if available <= 0:
+            continue
+
+        # vCPU 数と GPU 数も同様に、再開済みの項目の見積もりの合計と比べて大きい方を使う
+        usedCpus = usedGpus = 0
+        if used:
+            usedCpus = max(used['cpus'], sum(item.get('estimatedCpus') or 0 for item in groupDispatchedItems))
+            usedGpus = max(used['gpus'], sum(item.get('estimatedGpus') or 0 for item in groupDispatchedItems))
+
+        for item in select_items(groupQueuedItems, userActiveCounts, available):
+            # 公平性の順序を保つため、先頭の解析を開始できなければ、後ろの解析も開始しない
+            if not has_capacity(limits['maxCpus'], usedCpus, item.get('estimatedCpus')) or \
+                    not has_capacity(limits['maxGpus'], usedGpus, item.get('estimatedGpus')):
+                break
+            if deadline and time.time() > deadline:
+                return dispatchedCount
+            if bucket:
+                bucket.acquire()
+            if dispatch_item(tableName, item):
+                dispatchedCount += 1
+                userActiveCounts[item['userId']] = userActiveCounts.get(item['userId'], 0) + 1
+                if item.get('estimatedCpus') is None:
+                    # 見積もりがない解析は使用量が分からないため、この振り分けでは以降の解析を開始しない
+                    usedCpus = max(usedCpus, limits['maxCpus'] or 0)
+                    usedGpus = max(usedGpus, limits['maxGpus'] or 0)
+                else:
+                    usedCpus += item['estimatedCpus']
+                    usedGpus += item.get('estimatedGpus') or 0
+
+    return dispatchedCount
@@ -1,8 +1,6 @@
 import os
-import collections.abc as collections_abc
 from datetime import date, datetime, timezone
-from decimal import Decimal
-from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+import dynamodb_common
 
 # 複数の Lambda 関数で共通利用するヘルパー関数を集めたライブラリ
 
@@ -14,7 +12,7 @@ CORS_ALLOW_ORIGIN = os.environ['CORS_ALLOW_ORIGIN']
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': CORS_ALLOW_ORIGIN,
     'Access-Control-Allow-Methods': 'OPTIONS,GET,PUT,POST,DELETE,PATCH,HEAD',
-    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,Idempotency-Key',
 }
 
 
@@ -48,53 +46,15 @@ def datetime_from_timestamp(obj):
     return datetime.fromtimestamp(obj, timezone.utc) if obj else None
 
 
-# 値を DynamoDB に格納できる型に変換する
-def value_to_dynamodb(obj):
-    if isinstance(obj, float):
-        return Decimal(obj)
-    elif isinstance(obj, collections_abc.Set):
-        return set(map(value_to_dynamodb, obj))
-    elif isinstance(obj, collections_abc.Mapping):
-        return { key: value_to_dynamodb(value) for key, value in obj.items() }
-    elif isinstance(obj, tuple):
-        return tuple( value_to_dynamodb(value) for value in obj )
-    elif isinstance(obj, list):
-        return [ value_to_dynamodb(value) for value in obj ]
-    else:
-        return obj
-
-
-_serializer = TypeSerializer()
-
 # `dict` の内容を DynamoDB に変換できる形式に変換する
+# (値の変換は dynamodb_common と共通。値が None の属性は NULL 型として含める)
 def dict_to_dynamodb(obj):
     return {
-        key: _serializer.serialize(value_to_dynamodb(value))
+        key: dynamodb_common.serialize(value)
         for key, value in obj.items()
     } if obj else {}
 
 
-# DynamoDB から取得した値を一般的な型に変換する
-def value_from_dynamodb(obj):
-    if isinstance(obj, Decimal):
-        return int(obj) if obj % 1 == 0 else float(obj)
-    elif isinstance(obj, collections_abc.Set):
-        return set(map(value_from_dynamodb, obj))
-    elif isinstance(obj, collections_abc.Mapping):
-        return { key: value_from_dynamodb(value) for key, value in obj.items() }
-    elif isinstance(obj, tuple):
-        return tuple( value_from_dynamodb(value) for value in obj )
-    elif isinstance(obj, list):
-        return [ value_from_dynamodb(value) for value in obj ]
-    else:
-        return obj
-
-
-_deserializer = TypeDeserializer()
-
 # DynamoDB から取得したレコードを一般的な `dict` 形式に変換する
 def dict_from_dynamodb(obj):
-    return {
-        key: value_from_dynamodb(_deserializer.deserialize(value))
-        for key, value in obj.items()
-    } if obj else {}
+    return dynamodb_common.from_dynamodb(obj) if obj else {}
@@ -0,0 +1,57 @@
+import collections.abc as collections_abc
+from decimal import Decimal
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+# DynamoDB の低レベル API (boto3.client('dynamodb')) で読み書きする値を変換するヘルパー関数を集めたライブラリ
+# 環境変数に依存しないため、REST API 以外の Lambda 関数からも利用できる
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+# 値を DynamoDB に格納できる型に変換する
+# float は DynamoDB の数値の精度 (38 桁) を超えないよう、文字列表現を経由して Decimal に変換する
+def value_to_dynamodb(obj):
+    if isinstance(obj, float):
+        return Decimal(str(obj))
+    elif isinstance(obj, collections_abc.Set):
+        return set(map(value_to_dynamodb, obj))
+    elif isinstance(obj, collections_abc.Mapping):
+        return { key: value_to_dynamodb(value) for key, value in obj.items() }
+    elif isinstance(obj, tuple):
+        return tuple( value_to_dynamodb(value) for value in obj )
+    elif isinstance(obj, list):
+        return [ value_to_dynamodb(value) for value in obj ]
+    else:
+        return obj
+
+
+# DynamoDB から取得した値を一般的な型に変換する
+def value_from_dynamodb(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    elif isinstance(obj, collections_abc.Set):
+        return set(map(value_from_dynamodb, obj))
+    elif isinstance(obj, collections_abc.Mapping):
+        return { key: value_from_dynamodb(value) for key, value in obj.items() }
+    elif isinstance(obj, tuple):
+        return tuple( value_from_dynamodb(value) for value in obj )
+    elif isinstance(obj, list):
+        return [ value_from_dynamodb(value) for value in obj ]
+    else:
+        return obj
+
+
+# 値を DynamoDB の属性値の形式 ({'S': ...} など) に変換する
+def serialize(value) -> dict:
+    return _serializer.serialize(value_to_dynamodb(value))
+
+
+# `dict` の内容を DynamoDB の項目の形式に変換する (値が None の属性は含めない)
+def to_dynamodb(item: dict) -> dict:
+    return {key: serialize(value) for key, value in item.items() if value is not None}
+
+
+# DynamoDB から取得した項目を一般的な `dict` 形式に変換する
+def from_dynamodb(item: dict) -> dict:
+    return {key: value_from_dynamodb(_deserializer.deserialize(value)) for key, value in item.items()}
@@ -0,0 +1,145 @@
+import os
+from datetime import datetime, timezone
+
+# ワークフロー実行のタスクが使用したリソースを集計し、費用を見積もるライブラリ
+#
+# タスクごとに vCPU 数・メモリ (GiB)・GPU 数と実行時間を掛け合わせ、実行全体の CPU 時間・メモリ時間・GPU 時間を求める
+# 費用はリソースの単価から見積もった目安で、実際の請求額 (インスタンスタイプの単位での課金など) とは一致しない
+
+# 終了したワークフロー実行の status
+TERMINAL_STATUSES = ['COMPLETED', 'FAILED', 'CANCELLED', 'DELETED']
+
+# リソースの単価 (USD) のデフォルト値
+# vCPU 時間・メモリ時間・GPU 時間あたりの単価は Omics のインスタンスの料金から、ストレージの単価は静的ストレージの料金から求めた目安
+DEFAULT_PRICES = {
+    'vcpuHour': 0.0446,
+    'memoryGiBHour': 0.0032,
+    'gpuHour': 0.43,
+    'storageGiBHour': 0.0001918,
+}
+
+# リソースの単価を変更する環境変数
+PRICE_ENVIRONMENT_VARIABLES = {
+    'vcpuHour': 'PRICE_PER_VCPU_HOUR',
+    'memoryGiBHour': 'PRICE_PER_MEMORY_GIB_HOUR',
+    'gpuHour': 'PRICE_PER_GPU_HOUR',
+    'storageGiBHour': 'PRICE_PER_STORAGE_GIB_HOUR',
+}
+
+# 費用の大きい順に返すタスクの数
+TOP_TASK_COUNT = 10
+
+
+# リソースの単価を返す (環境変数で指定されていればその値を使う)
+def get_prices() -> dict:
+    return {
+        key: float(os.environ[name]) if os.environ.get(name) else DEFAULT_PRICES[key]
+        for key, name in PRICE_ENVIRONMENT_VARIABLES.items()
+    }
+
+
+def _hours(startTime: datetime, stopTime: datetime) -> float:
+    return max((stopTime - startTime).total_seconds(), 0) / 3600
+
+
+# タスクが実行されていなかった時間 (時間) を求める
+# 実行の開始から終了までの間で、どのタスクも実行されていない区間の合計を返す
+def get_idle_hours(runStartTime: datetime, runStopTime: datetime, intervals: list) -> float:
+    idleSeconds = 0
+    cursor = runStartTime
+    for startTime, stopTime in sorted(intervals):
+        if startTime > cursor:
+            idleSeconds += (min(startTime, runStopTime) - cursor).total_seconds()
+        cursor = max(cursor, stopTime)
+        if cursor >= runStopTime:
+            break
+    if cursor < runStopTime:
+        idleSeconds += (runStopTime - cursor).total_seconds()
+    return max(idleSeconds, 0) / 3600
+
+
+# ワークフロー実行とタスクの一覧から、リソースの使用量と費用の見積もりを集計する
+def compute_accounting(run: dict, tasks: list, prices: dict = None) -> dict:
+    prices = prices or get_prices()
+    now = datetime.now(timezone.utc)
+
+    taskItems = []
+    intervals = []
+    for task in tasks:
+        startTime = task.get('startTime')
+        if not startTime:
+            continue
+        stopTime = task.get('stopTime') or now
+        hours = _hours(startTime, stopTime)
+        cpus = task.get('cpus') or 0
+        memory = task.get('memory') or 0
+        gpus = task.get('gpus') or 0
+        cost = (
+            cpus * hours * prices['vcpuHour']
+            + memory * hours * prices['memoryGiBHour']
+            + gpus * hours * prices['gpuHour']
+        )
+        intervals.append((startTime, stopTime))
+        taskItems.append({
+            'taskId': task.get('taskId'),
+            'name': task.get('name'),
+            'status': task.get('status'),
+            **({'instanceType': task['instanceType']} if task.get('instanceType') else {}),
+            'cpus': cpus,
+            'memory': memory,
+            'gpus': gpus,
+            'hours': hours,
+            'cpuHours': cpus * hours,
+            'memoryGiBHours': memory * hours,
+            'gpuHours': gpus * hours,
+            'estimatedCost': cost,
+        })
+
+    # ストレージは実行の開始から終了まで確保される
+    runStartTime = run.get('startTime')
+    runStopTime = run.get('stopTime') or now
+    storageCapacity = run.get('storageCapacity') or 0
+    runHours = _hours(runStartTime, runStopTime) if runStartTime else 0
+    idleHours = get_idle_hours(runStartTime, runStopTime, intervals) if runStartTime else 0
+
+    computeCost = sum(item['estimatedCost'] for item in taskItems)
+    storageCost = storageCapacity * runHours * prices['storageGiBHour']
+    topTasks = sorted(taskItems, key=lambda item: item['estimatedCost'], reverse=True)[:TOP_TASK_COUNT]
+
+    return {
+        'runId': run['id'],
+        'status': run.get('status'),
+        'isFinal': run.get('status') in TERMINAL_STATUSES,
+        'computedAt': now.isoformat(),
+        'taskCount': len(tasks),
+        'runHours': round(runHours, 4),
+        'cpuHours': round(sum(item['cpuHours'] for item in taskItems), 4),
+        'memoryGiBHours': round(sum(item['memoryGiBHours'] for item in taskItems), 4),
+        'gpuHours': round(sum(item['gpuHours'] for item in taskItems), 4),
+        'storage': {
+            'storageType': run.get('storageType'),
+            'capacityGiB': storageCapacity,
+            'gibHours': round(storageCapacity * runHours, 4),
+            'idleHours': round(idleHours, 4),
+            'idleGiBHours': round(storageCapacity * idleHours, 4),
+            'estimatedIdleCost': round(storageCapacity * idleHours * prices['storageGiBHour'], 4),
+        },
+        'estimatedCost': {
+            'compute': round(computeCost, 4),
+            'storage': round(storageCost, 4),
+            'total': round(computeCost + storageCost, 4),
+            'currency': 'USD',
+            'prices': prices,
+        },
+        'topTasks': [
+            {
+                **item,
+                'hours': round(item['hours'], 4),
+                'cpuHours': round(item['cpuHours'], 4),
+                'memoryGiBHours': round(item['memoryGiBHours'], 4),
+                'gpuHours': round(item['gpuHours'], 4),
+                'estimatedCost': round(item['estimatedCost'], 4),
+            }
+            for item in topTasks
+        ],
+    }
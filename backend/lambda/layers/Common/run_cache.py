@@ -0,0 +1,145 @@
+import json
+import time
+import boto3
+import dynamodb_common
+
+# ワークフロー実行ごとに求めた集計結果をキャッシュするライブラリ
+# 終了したワークフロー実行の集計結果は変わらないため、1 回だけ求めて RunCache テーブルに保存する
+#
+# RunCache テーブルの項目
+#   runId      ワークフロー実行の ID
+#   cacheKey   集計の種類 (ACCOUNTING など)。タスクごとの集計結果は {集計の種類}#{タスク ID}
+#   value      集計結果の JSON
+#   createdAt  保存した時刻
+#   expiresAt  項目を自動削除する時刻 (TTL)。無期限にキャッシュする項目にはない
+
+# 集計の種類
+ACCOUNTING = 'ACCOUNTING'
+TASK_LOG_METRICS = 'TASK_LOG_METRICS'
+TASK_COUNTS = 'TASK_COUNTS'
+
+# 終了したワークフロー実行の集計結果を保持する期間 (秒)
+# None を指定した場合は無期限にキャッシュする
+TERMINAL_EXPIRATION_SECONDS = 90 * 24 * 60 * 60
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+
+# タスクごとの集計結果の cacheKey を返す
+def get_task_cache_key(cacheType: str, taskId: str) -> str:
+    return f'{cacheType}#{taskId}'
+
+
+# キャッシュした集計結果を返す (なければ None を返す)
+def get(tableName: str, runId: str, cacheKey: str):
+    response = dynamodb.get_item(
+        TableName=tableName,
+        Key=dynamodb_common.to_dynamodb({
+            'runId': runId,
+            'cacheKey': cacheKey,
+        }),
+    )
+    item = response.get('Item')
+    if not item:
+        return None
+
+    item = dynamodb_common.from_dynamodb(item)
+    # TTL による削除は遅れることがあるため、期限を過ぎた項目は使わない
+    if item.get('expiresAt') and item['expiresAt'] < time.time():
+        return None
+    return json.loads(item['value'])
+
+
+# 複数のワークフロー実行について、キャッシュした集計結果を {runId: value} で返す (なければ含めない)
+def get_many(tableName: str, runIds: list, cacheKey: str) -> dict:
+    now = time.time()
+    values = {}
+    runIds = list(dict.fromkeys(runIds))
+    # BatchGetItem は 1 回に 100 件まで読み込める
+    for index in range(0, len(runIds), 100):
+        unprocessed = {
+            tableName: {
+                'Keys': [dynamodb_common.to_dynamodb({'runId': runId, 'cacheKey': cacheKey}) for runId in runIds[index:index + 100]],
+            },
+        }
+        for attempt in range(5):
+            response = dynamodb.batch_get_item(RequestItems=unprocessed)
+            for item in response.get('Responses', {}).get(tableName, []):
+                item = dynamodb_common.from_dynamodb(item)
+                if item.get('expiresAt') and item['expiresAt'] < now:
+                    continue
+                values[item['runId']] = json.loads(item['value'])
+            unprocessed = response.get('UnprocessedKeys')
+            if not unprocessed:
+                break
+            time.sleep(0.1 * 2 ** attempt)
+        # 読み込めなかった項目はキャッシュがないものとして扱う
+    return values
+
+
+# 集計結果をキャッシュする
+def put(tableName: str, runId: str, cacheKey: str, value, expirationSeconds: int = TERMINAL_EXPIRATION_SECONDS):
+    now = int(time.time())
+    dynamodb.put_item(
+        TableName=tableName,
+        Item=dynamodb_common.to_dynamodb({
+            'runId': runId,
+            'cacheKey': cacheKey,
+            'value': json.dumps(value),
+            'createdAt': now,
+            'expiresAt': now + expirationSeconds if expirationSeconds else None,
+        }),
+    )
+
+
+# 集計結果をまとめてキャッシュする ({cacheKey: value})
+def put_many(tableName: str, runId: str, values: dict, expirationSeconds: int = TERMINAL_EXPIRATION_SECONDS):
+    now = int(time.time())
+    requests = [
+        {
+            'PutRequest': {
+                'Item': dynamodb_common.to_dynamodb({
+                    'runId': runId,
+                    'cacheKey': cacheKey,
+                    'value': json.dumps(value),
+                    'createdAt': now,
+                    'expiresAt': now + expirationSeconds if expirationSeconds else None,
+                }),
+            },
+        }
+        for cacheKey, value in values.items()
+    ]
+    # BatchWriteItem は 1 回に 25 件まで書き込める
+    for index in range(0, len(requests), 25):
+        unprocessed = {tableName: requests[index:index + 25]}
+        for attempt in range(5):
+            response = dynamodb.batch_write_item(RequestItems=unprocessed)
+            unprocessed = response.get('UnprocessedItems')
+            if not unprocessed:
+                break
+            time.sleep(0.1 * 2 ** attempt)
+        else:
+            raise RuntimeError(f'Failed to write {len(unprocessed[tableName])} items to {tableName}')
+
+
+# 集計の種類が同じタスクごとの集計結果を、{cacheKey: value} で返す
+# keysOnly を指定した場合は、値を読まずに cacheKey だけを返す ({cacheKey: None})
+def list_by_type(tableName: str, runId: str, cacheType: str, keysOnly: bool = False) -> dict:
+    now = time.time()
+    values = {}
+    paginator = dynamodb.get_paginator('query')
+    for page in paginator.paginate(
+        TableName=tableName,
+        KeyConditionExpression='runId = :runId AND begins_with(cacheKey, :prefix)',
+        ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+            ':runId': runId,
+            ':prefix': f'{cacheType}#',
+        }),
+        **({'ProjectionExpression': 'cacheKey, expiresAt'} if keysOnly else {}),
+    ):
+        for item in page.get('Items', []):
+            item = dynamodb_common.from_dynamodb(item)
+            if item.get('expiresAt') and item['expiresAt'] < now:
+                continue
+            values[item['cacheKey']] = None if keysOnly else json.loads(item['value'])
+    return values
@@ -0,0 +1,148 @@
+import json
+import time
+import boto3
+import botocore
+from aws_lambda_powertools import Logger
+
+# Omics ワークフロー実行の完了を待っている Step Functions のタスクトークンを管理するライブラリ
+# ステートマシンがタスクトークンを実行 ID と共に登録し、実行状態の変更イベントを受け取った Lambda 関数が
+# 実行 ID からタスクトークンを取り出してステートマシンの実行を再開する
+
+# ワークフロー実行が終了したことを表す status
+FINISHED_STATUSES = ['COMPLETED', 'DELETED', 'CANCELLED', 'FAILED']
+
+# ワークフロー実行が失敗したことを表す status
+ERROR_STATUSES = ['DELETED', 'CANCELLED', 'FAILED']
+
+# ワークフロー実行が終了していないことを表す status
+ACTIVE_STATUSES = ['PENDING', 'STARTING', 'RUNNING', 'STOPPING']
+
+# 登録したタスクトークンを保持する期間 (秒)
+# ステートマシンは一定時間ごとにタスクトークンを登録し直すため、古い項目は TTL で自動的に削除する
+TASK_TOKEN_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# ログの機能を初期化
+logger = Logger()
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+sfn = boto3.client('stepfunctions')
+
+
+# ワークフロー実行が終了したかどうかを返す
+def is_finished(status: str) -> bool:
+    return status in FINISHED_STATUSES
+
+
+# ワークフロー実行が失敗したかどうかを返す
+def is_error(status: str) -> bool:
+    return status in ERROR_STATUSES
+
+
+# ワークフロー実行の完了を待つタスクトークンを登録する (同じ実行 ID の古いタスクトークンは上書きする)
+def register_task_token(tableName: str, runId: str, taskToken: str, analysisId: str):
+    dynamodb.put_item(
+        TableName=tableName,
+        Item={
+            'runId': {
+                'S': runId,
+            },
+            'taskToken': {
+                'S': taskToken,
+            },
+            'analysisId': {
+                'S': analysisId,
+            },
+            'registeredAt': {
+                'N': str(int(time.time())),
+            },
+            'expiresAt': {
+                'N': str(int(time.time()) + TASK_TOKEN_TTL_SECONDS),
+            },
+        },
+    )
+
+
+# 登録されている全てのタスクトークンを返す (ワークフロー実行の状態を一括で確認するために利用する)
+def list_task_tokens(tableName: str) -> list:
+    items = []
+    paginator = dynamodb.get_paginator('scan')
+    for page in paginator.paginate(
+        TableName=tableName,
+        ProjectionExpression='runId, analysisId, lastStatus',
+    ):
+        for item in page.get('Items', []):
+            items.append({
+                'runId': item['runId']['S'],
+                'analysisId': item['analysisId']['S'],
+                'lastStatus': item['lastStatus']['S'] if 'lastStatus' in item else None,
+            })
+    return items
+
+
+# 最後に確認したワークフロー実行の status を記録する (タスクトークンが削除済みであれば何もしない)
+def update_last_status(tableName: str, runId: str, status: str):
+    try:
+        dynamodb.update_item(
+            TableName=tableName,
+            Key={
+                'runId': {
+                    'S': runId,
+                },
+            },
+            UpdateExpression='SET lastStatus = :status',
+            ConditionExpression='attribute_exists(runId)',
+            ExpressionAttributeValues={
+                ':status': {
+                    'S': status,
+                },
+            },
+        )
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+# 実行 ID に対応するタスクトークンを取り出して削除する (登録されていなければ None を返す)
+# 削除と取得を 1 回の操作で行うため、複数の Lambda 関数が同時に呼び出しても再開は 1 回だけになる
+def pop_task_token(tableName: str, runId: str) -> dict:
+    response = dynamodb.delete_item(
+        TableName=tableName,
+        Key={
+            'runId': {
+                'S': runId,
+            },
+        },
+        ReturnValues='ALL_OLD',
+    )
+    item = response.get('Attributes')
+    return {
+        'runId': item['runId']['S'],
+        'taskToken': item['taskToken']['S'],
+        'analysisId': item['analysisId']['S'],
+    } if item else None
+
+
+# 実行 ID に対応するタスクトークンがあれば、ステートマシンの実行を再開する
+# 再開した場合は True を返す
+def resume_run(tableName: str, runId: str, status: str) -> bool:
+    item = pop_task_token(tableName, runId)
+    if not item:
+        return False
+
+    try:
+        sfn.send_task_success(
+            taskToken=item['taskToken'],
+            output=json.dumps({
+                'RunId': runId,
+                'Status': status,
+            }),
+        )
+        return True
+
+    except botocore.exceptions.ClientError as err:
+        # タイムアウトなどでタスクが既に終了していれば、ステートマシン側で実行状態を確認するため無視する
+        if err.response['Error']['Code'] in ['TaskTimedOut', 'TaskDoesNotExist', 'InvalidToken']:
+            logger.warning(f"Skip: task for run {runId} is no longer waiting: {err.response['Error']['Code']}")
+            return False
+        raise
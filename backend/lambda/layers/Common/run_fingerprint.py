@@ -0,0 +1,92 @@
+import json
+import hashlib
+import boto3
+import botocore
+
+# 同じワークフローを同じ入力で実行したかどうかを判定するための指紋 (fingerprint) を扱うライブラリ
+# 完了したワークフロー実行を指紋と共に RunFingerprints テーブルに登録しておき、同じ指紋の解析が開始されたときに結果を再利用する
+
+# 指紋の計算方法のバージョン (計算方法を変えたら上げて、古い指紋と一致しないようにする)
+FINGERPRINT_VERSION = 1
+
+# 解析の開始時に結果を再利用するかどうかの指定
+# OFF: 再利用しない, OFFER: 再利用できる実行があれば開始せずに返す, REUSE: 再利用できる実行があれば再利用する
+REUSE_OFF = 'OFF'
+REUSE_OFFER = 'OFFER'
+REUSE_REUSE = 'REUSE'
+REUSE_MODES = [REUSE_OFF, REUSE_OFFER, REUSE_REUSE]
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+omics = boto3.client('omics')
+
+
+# パラメーターの値を、表記の揺れによって指紋が変わらないように正規化する
+def normalize_value(value):
+    if isinstance(value, dict):
+        return {
+            str(key): normalize_value(item) for key, item in sorted(value.items()) if item is not None
+        }
+    elif isinstance(value, (list, tuple)):
+        return [normalize_value(item) for item in value]
+    elif isinstance(value, str):
+        value = value.strip()
+        # S3 のプレフィックスは末尾の / の有無を区別しない
+        return value.rstrip('/') if value.startswith('s3://') else value
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+# ワークフローの種類・ID・ダイジェストと正規化したパラメーターから指紋を求める
+def compute_fingerprint(workflowType: str, workflowId: str, digest: str, parameters: dict) -> str:
+    canonical = json.dumps({
+        'version': FINGERPRINT_VERSION,
+        'workflowType': workflowType,
+        'workflowId': workflowId,
+        'digest': digest or '',
+        'parameters': normalize_value(parameters or {}),
+    }, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+# 指紋が一致する完了済みのワークフロー実行を返す (なければ None を返す)
+# 実行が削除されていたり完了状態でなくなっていたりすれば、登録を削除して None を返す
+def find_reusable_run(tableName: str, fingerprint: str) -> dict:
+    response = dynamodb.get_item(
+        TableName=tableName,
+        Key={
+            'fingerprint': {
+                'S': fingerprint,
+            },
+        },
+    )
+    item = response.get('Item')
+    if not item:
+        return None
+
+    runId = item['runId']['S']
+    try:
+        run = omics.get_run(id=runId)
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ResourceNotFoundException':
+            raise
+        run = None
+
+    if not run or run['status'] != 'COMPLETED':
+        dynamodb.delete_item(
+            TableName=tableName,
+            Key={
+                'fingerprint': {
+                    'S': fingerprint,
+                },
+            },
+        )
+        return None
+
+    return {
+        'runId': runId,
+        'name': run.get('name'),
+        'outputUri': run.get('outputUri'),
+        'stopTime': run.get('stopTime'),
+    }
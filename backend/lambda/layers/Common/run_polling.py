@@ -0,0 +1,106 @@
+import time
+import statistics
+from datetime import datetime, timezone
+import boto3
+from aws_lambda_powertools import Logger
+
+# Omics ワークフロー実行の状態を次に確認するまでの待ち時間を求めるライブラリ
+# 実行状態、経過時間、同じワークフローの過去の実行時間から、完了を早く検知できて無駄な確認が少ない待ち時間を返す
+
+# 待ち時間の下限と上限 (秒)
+MIN_WAIT_SECONDS = 60
+MAX_WAIT_SECONDS = 60 * 60
+
+# 起動中・停止中の実行はすぐに状態が変わるため、短い間隔で確認する
+SHORT_WAIT_STATUSES = ['PENDING', 'STARTING', 'STOPPING']
+
+# 過去の実行時間が不明な場合は、経過時間に対してこの割合だけ待つ (経過時間に応じて間隔を広げる)
+ELAPSED_WAIT_RATIO = 0.25
+
+# 過去の実行時間から求めた残り時間に対して、この割合だけ待つ (完了予定に近づくほど間隔を狭める)
+REMAINING_WAIT_RATIO = 0.5
+
+# 過去の実行時間を求めるために参照する完了済みの実行の数と、求めた値をキャッシュする期間 (秒)
+HISTORY_RUN_COUNT = 200
+HISTORY_CACHE_SECONDS = 15 * 60
+
+# ログの機能を初期化
+logger = Logger()
+
+# AWS サービスのクライアントを初期化
+omics = boto3.client('omics')
+
+# ワークフロー ID ごとの過去の実行時間 (秒) のキャッシュ
+# Lambda 関数の実行環境が再利用される間は list_runs の呼び出しを省略する
+historyCache = {
+    'expiresAt': 0,
+    'durations': {},
+}
+
+
+# 完了済みの実行から、ワークフロー ID ごとの実行時間の中央値 (秒) を求める
+def get_historical_durations() -> dict:
+    now = time.time()
+    if historyCache['expiresAt'] > now:
+        return historyCache['durations']
+
+    samples = {}
+    paginator = omics.get_paginator('list_runs')
+    count = 0
+    for page in paginator.paginate(status='COMPLETED', PaginationConfig={'MaxItems': HISTORY_RUN_COUNT}):
+        for item in page.get('items', []):
+            count += 1
+            startTime = item.get('startTime')
+            stopTime = item.get('stopTime')
+            workflowId = item.get('workflowId')
+            if workflowId and startTime and stopTime:
+                samples.setdefault(workflowId, []).append((stopTime - startTime).total_seconds())
+        if count >= HISTORY_RUN_COUNT:
+            break
+
+    historyCache['durations'] = {
+        workflowId: statistics.median(durations) for workflowId, durations in samples.items()
+    }
+    historyCache['expiresAt'] = now + HISTORY_CACHE_SECONDS
+    return historyCache['durations']
+
+
+# 同じワークフローの過去の実行時間 (秒) を返す (不明な場合は None)
+def get_expected_duration(workflowId: str) -> float:
+    if not workflowId:
+        return None
+    try:
+        return get_historical_durations().get(workflowId)
+    except Exception as err:
+        # 過去の実行時間は目安のため、取得できなくても状態の確認は続ける
+        logger.warning(f'Failed to get historical durations: {err}')
+        return None
+
+
+# 次に実行状態を確認するまでの待ち時間 (秒) を求める
+#   status          ワークフロー実行の状態
+#   elapsedSeconds  実行を開始してからの経過時間 (開始前は作成からの経過時間)
+#   expectedSeconds 同じワークフローの過去の実行時間 (不明な場合は None)
+#   maxWaitSeconds  待ち時間の上限
+def get_next_wait_seconds(status: str, elapsedSeconds: float = 0, expectedSeconds: float = None,
+                          maxWaitSeconds: int = MAX_WAIT_SECONDS) -> int:
+    maxWaitSeconds = max(MIN_WAIT_SECONDS, maxWaitSeconds)
+    if status in SHORT_WAIT_STATUSES:
+        return MIN_WAIT_SECONDS
+
+    elapsedSeconds = max(0, elapsedSeconds or 0)
+    if expectedSeconds and expectedSeconds > elapsedSeconds:
+        waitSeconds = (expectedSeconds - elapsedSeconds) * REMAINING_WAIT_RATIO
+    else:
+        # 過去の実行時間が不明、または既に超えている場合は経過時間に応じて間隔を広げる
+        waitSeconds = elapsedSeconds * ELAPSED_WAIT_RATIO
+
+    return int(min(maxWaitSeconds, max(MIN_WAIT_SECONDS, waitSeconds)))
+
+
+# get_run の結果から経過時間を求める
+def get_elapsed_seconds(run: dict) -> float:
+    since = run.get('startTime') or run.get('creationTime')
+    if not since:
+        return 0
+    return (datetime.now(timezone.utc) - since).total_seconds()
@@ -0,0 +1,443 @@
+import re
+import json
+import math
+import time
+import statistics
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import botocore
+import dynamodb_common
+import analysis_preflight
+
+# 終了したワークフロー実行の統計情報を記録し、同じワークフローの過去の実行からストレージ容量を推奨するライブラリ
+#
+# RunStatistics テーブルの項目
+#   workflowKey     ワークフローの種類と ID を連結した値 ({workflowType}_{workflowId})
+#   runKey          実行の終了時刻と ID を連結した値 ({stopTime}#{runId}、終了時刻の順に並べるため)
+#   runId, status, startTime, stopTime, durationSeconds
+#   workflowVersionName  実行したワークフローのバージョン (指定された場合のみ)
+#   storageType, storageCapacity   実行で確保したストレージ
+#   inputBytes      実行パラメーターに指定された S3 の入力ファイルの合計サイズ
+#   outputBytes     実行の出力先に書き込まれたファイルの合計サイズ
+#   peakStorageGiB  実行中に使用したストレージの最大量 (実行のマニフェストログから取得できた場合のみ)
+#   taskSummary     タスク名ごとのタスクの数と合計実行時間 (秒) の JSON ({"name": {"count": 1, "totalSeconds": 60}})
+
+GIB = 1024 ** 3
+
+# Omics のワークフロー実行のストレージ容量 (GiB) の最小値、増分、最大値
+MIN_STORAGE_CAPACITY = 1200
+STORAGE_CAPACITY_INCREMENT = 1200
+MAX_STORAGE_CAPACITY = 9600
+
+# 推定した必要量に対する余裕の割合
+SAFETY_MARGIN = 1.2
+
+# 最大使用量が取得できない場合に、入力と出力の合計サイズに掛けて中間ファイルを含めた必要量とみなす割合
+INTERMEDIATE_FACTOR = 2.0
+
+# 推奨に使う完了済みの実行の数と、入力サイズあたりの必要量の分布から採用するパーセンタイル
+RECOMMENDATION_RUN_COUNT = 50
+RECOMMENDATION_PERCENTILE = 90
+
+# 進捗の見積もりに使う完了済みの実行の数と、見積もりのモデルをキャッシュする期間 (秒)
+PROFILE_RUN_COUNT = 20
+PROFILE_CACHE_SECONDS = 15 * 60
+
+# 1 回の見積もりで取得するタスクの最大数
+MAX_TASK_COUNT = 5000
+
+# 実行中のタスクについて、過去の実行時間に対する経過時間の割合をこれ以上は進んだとみなさない
+MAX_RUNNING_TASK_PROGRESS = 0.95
+
+# 進捗の割合の上限 (終了するまでは 100% としない)
+MAX_PROGRESS = 0.99
+
+# S3 のサイズを同時に確認する数と、1 つのプレフィックスについて一覧を取得する最大ページ数
+S3_MEASURE_CONCURRENCY = 16
+MAX_LIST_PAGES = 20
+
+# 実行のマニフェストログが出力されるロググループ
+OMICS_LOG_GROUP_NAME = '/aws/omics/WorkflowLog'
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+s3 = boto3.client('s3')
+logs = boto3.client('logs')
+omics = boto3.client('omics')
+
+# ワークフローごとの進捗の見積もりのモデルのキャッシュ
+# Lambda 関数の実行環境が再利用される間は RunStatistics テーブルの読み込みを省略する
+profileCache = {}
+
+# ワークフローの種類と ID から workflowKey を返す
+def get_workflow_key(workflowType: str, workflowId: str) -> str:
+    return f'{workflowType}_{workflowId}'
+
+
+# S3 の URI が指すオブジェクト、またはプレフィックス以下のオブジェクトの合計サイズを返す (確認できなければ 0 を返す)
+def measure_s3_uri_bytes(uri: str) -> int:
+    parsed = urlparse(uri)
+    bucket = parsed.netloc
+    key = parsed.path.lstrip('/')
+    if not bucket:
+        return 0
+
+    try:
+        if key and not key.endswith('/') and '*' not in key:
+            try:
+                return s3.head_object(Bucket=bucket, Key=key)['ContentLength']
+            except botocore.exceptions.ClientError as err:
+                if err.response['Error']['Code'] not in ['404', 'NoSuchKey']:
+                    raise
+
+        total = 0
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(
+            Bucket=bucket,
+            Prefix=key.split('*', 1)[0],
+            PaginationConfig={'MaxItems': MAX_LIST_PAGES * 1000},
+        ):
+            total += sum(item['Size'] for item in page.get('Contents', []))
+        return total
+
+    except botocore.exceptions.ClientError:
+        return 0
+
+
+# S3 の URI の一覧が指すオブジェクトの合計サイズを、重複を除いて並列に求める
+def measure_s3_bytes(uris: list) -> int:
+    uris = list(dict.fromkeys(uris))
+    if not uris:
+        return 0
+    with ThreadPoolExecutor(max_workers=S3_MEASURE_CONCURRENCY) as executor:
+        return sum(executor.map(measure_s3_uri_bytes, uris))
+
+
+# 実行パラメーターに含まれる S3 の入力ファイルの合計サイズを求める
+def measure_input_bytes(parameters: dict) -> int:
+    return measure_s3_bytes([
+        uri for key, value in (parameters or {}).items() for _, uri in analysis_preflight.find_s3_uris(key, value)
+    ])
+
+
+# 値に含まれる指定した名前のキーの値を、入れ子になった dict や list からも探して返す
+def _find_key(value, name: str):
+    if isinstance(value, dict):
+        if name in value:
+            return value[name]
+        for item in value.values():
+            found = _find_key(item, name)
+            if found is not None:
+                return found
+    elif isinstance(value, list):
+        for item in value:
+            found = _find_key(item, name)
+            if found is not None:
+                return found
+    return None
+
+
+# 実行のマニフェストログから、実行中に使用したストレージの最大量 (GiB) を返す (取得できなければ None を返す)
+def get_peak_storage_gib(runId: str) -> float:
+    try:
+        response = logs.describe_log_streams(
+            logGroupName=OMICS_LOG_GROUP_NAME,
+            logStreamNamePrefix=f'manifest/run/{runId}',
+        )
+        for logStream in response.get('logStreams', []):
+            events = logs.get_log_events(
+                logGroupName=OMICS_LOG_GROUP_NAME,
+                logStreamName=logStream['logStreamName'],
+                startFromHead=True,
+            ).get('events', [])
+            for event in events:
+                try:
+                    message = json.loads(event['message'])
+                except ValueError:
+                    continue
+                value = _find_key(message, 'storageMaximumGiB')
+                if value is not None:
+                    return float(value)
+
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ResourceNotFoundException':
+            raise
+    return None
+
+
+# 終了したワークフロー実行の統計情報を記録する
+def record_run_statistics(tableName: str, run: dict, inputBytes: int, outputBytes: int, peakStorageGiB: float,
+                          taskSummary: dict = None, peakResources: dict = None) -> dict:
+    startTime = run.get('startTime')
+    stopTime = run.get('stopTime')
+    item = {
+        'workflowKey': get_workflow_key(run.get('workflowType') or 'PRIVATE', run['workflowId']),
+        'runKey': f"{stopTime.isoformat() if stopTime else ''}#{run['id']}",
+        'runId': run['id'],
+        'status': run['status'],
+        'workflowVersionName': run.get('workflowVersionName'),
+        'startTime': startTime.isoformat() if startTime else None,
+        'stopTime': stopTime.isoformat() if stopTime else None,
+        'durationSeconds': int((stopTime - startTime).total_seconds()) if startTime and stopTime else None,
+        'storageType': run.get('storageType'),
+        'storageCapacity': run.get('storageCapacity'),
+        'inputBytes': inputBytes,
+        'outputBytes': outputBytes,
+        'peakStorageGiB': peakStorageGiB,
+        'taskSummary': json.dumps(taskSummary) if taskSummary is not None else None,
+        'peakCpus': (peakResources or {}).get('cpus'),
+        'peakGpus': (peakResources or {}).get('gpus'),
+    }
+    dynamodb.put_item(
+        TableName=tableName,
+        Item=dynamodb_common.to_dynamodb(item),
+    )
+    return item
+
+
+# ワークフローの終了した実行の統計情報を、終了時刻の新しい順に返す
+def list_run_statistics(tableName: str, workflowType: str, workflowId: str, limit: int = RECOMMENDATION_RUN_COUNT,
+                        status: str = None) -> list:
+    items = []
+    paginator = dynamodb.get_paginator('query')
+    for page in paginator.paginate(
+        TableName=tableName,
+        KeyConditionExpression='workflowKey = :workflowKey',
+        **({'FilterExpression': '#status = :status'} if status else {}),
+        **({'ExpressionAttributeNames': {'#status': 'status'}} if status else {}),
+        ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+            ':workflowKey': get_workflow_key(workflowType, workflowId),
+            **({':status': status} if status else {}),
+        }),
+        ScanIndexForward=False,
+    ):
+        items.extend(dynamodb_common.from_dynamodb(item) for item in page.get('Items', []))
+        if len(items) >= limit:
+            break
+    return items[:limit]
+
+
+# 実行に必要だったストレージの量 (GiB) を返す
+# 最大使用量が取得できなかった場合は、入力と出力の合計サイズから中間ファイルを含めた量を見積もる
+def get_required_gib(item: dict) -> float:
+    if item.get('peakStorageGiB'):
+        return float(item['peakStorageGiB'])
+    return (item.get('inputBytes', 0) + item.get('outputBytes', 0)) / GIB * INTERMEDIATE_FACTOR
+
+
+# 値の一覧のパーセンタイルを返す
+def percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    index = max(0, math.ceil(len(values) * percent / 100) - 1)
+    return values[index]
+
+
+# 必要量に余裕を持たせ、Omics で指定できるストレージ容量に切り上げる
+def round_storage_capacity(requiredGiB: float) -> int:
+    capacity = math.ceil(requiredGiB * SAFETY_MARGIN / STORAGE_CAPACITY_INCREMENT) * STORAGE_CAPACITY_INCREMENT
+    return min(max(capacity, MIN_STORAGE_CAPACITY), MAX_STORAGE_CAPACITY)
+
+
+# 同じワークフローの完了済みの実行から、ストレージ容量 (GiB) を推奨する
+# 入力サイズが分かれば入力サイズあたりの必要量から見積もり、分からなければ過去の必要量から見積もる
+def recommend_storage_capacity(tableName: str, workflowType: str, workflowId: str, inputBytes: int = 0) -> dict:
+    items = [
+        item for item in list_run_statistics(tableName, workflowType, workflowId, status='COMPLETED')
+        if get_required_gib(item) > 0
+    ]
+    if not items:
+        return {
+            'basis': 'NONE',
+            'sampleCount': 0,
+            'inputBytes': inputBytes,
+        }
+
+    scaledItems = [item for item in items if item.get('inputBytes')]
+    if inputBytes and scaledItems:
+        ratio = percentile(
+            [get_required_gib(item) / (item['inputBytes'] / GIB) for item in scaledItems], RECOMMENDATION_PERCENTILE)
+        requiredGiB = ratio * inputBytes / GIB
+        basis = 'INPUT_SIZE'
+        sampleCount = len(scaledItems)
+    else:
+        requiredGiB = percentile([get_required_gib(item) for item in items], RECOMMENDATION_PERCENTILE)
+        basis = 'HISTORY'
+        sampleCount = len(items)
+
+    return {
+        'recommendedStorageCapacity': round_storage_capacity(requiredGiB),
+        'estimatedRequiredGiB': round(requiredGiB, 1),
+        'basis': basis,
+        'sampleCount': sampleCount,
+        'inputBytes': inputBytes,
+    }
+
+
+# ワークフロー実行のタスクの一覧を返す (maxCount に None を指定すると全てのタスクを返す)
+def list_run_tasks(runId: str, maxCount: int = MAX_TASK_COUNT) -> list:
+    tasks = []
+    paginator = omics.get_paginator('list_run_tasks')
+    for page in paginator.paginate(id=runId, PaginationConfig={'MaxItems': maxCount}):
+        tasks.extend(page.get('items', []))
+    return tasks
+
+
+# タスク名から、サンプル名やシャードの番号などの実行ごとに変わる部分を取り除く
+# 例: 'FASTQC (sample1)' -> 'FASTQC', 'call-align-shard-3' -> 'call-align'
+def normalize_task_name(name: str) -> str:
+    name = re.sub(r'\s*\(.*\)\s*$', '', name or '')
+    name = re.sub(r'[-_:]shard[-_:]?\d+$', '', name)
+    return name.strip()
+
+
+# タスクの実行時間 (秒) を返す (開始していなければ None を返す)
+def get_task_seconds(task: dict, now: float = None) -> float:
+    startTime = task.get('startTime')
+    if not startTime:
+        return None
+    stopTime = task.get('stopTime')
+    if stopTime:
+        return (stopTime - startTime).total_seconds()
+    return max((now or time.time()) - startTime.timestamp(), 0)
+
+
+# タスクの実行期間から、実行全体で同時に使用した vCPU 数と GPU 数の最大値を求める
+def get_peak_resources(tasks: list) -> dict:
+    events = []
+    for task in tasks:
+        startTime = task.get('startTime')
+        stopTime = task.get('stopTime')
+        if not startTime or not stopTime:
+            continue
+        cpus = task.get('cpus') or 0
+        gpus = task.get('gpus') or 0
+        events.append((startTime, 1, cpus, gpus))
+        events.append((stopTime, 0, -cpus, -gpus))
+
+    # 同じ時刻に終了と開始が重なる場合は、終了を先に数える
+    peakCpus = peakGpus = cpus = gpus = 0
+    for _, _, deltaCpus, deltaGpus in sorted(events, key=lambda event: (event[0], event[1])):
+        cpus += deltaCpus
+        gpus += deltaGpus
+        peakCpus = max(peakCpus, cpus)
+        peakGpus = max(peakGpus, gpus)
+    return {
+        'cpus': peakCpus,
+        'gpus': peakGpus,
+    }
+
+
+# 同じワークフローの完了済みの実行から、1 回の実行が同時に使用する vCPU 数と GPU 数を見積もる (記録がなければ None を返す)
+def estimate_run_resources(tableName: str, workflowType: str, workflowId: str) -> dict:
+    items = [
+        item for item in list_run_statistics(tableName, workflowType, workflowId, limit=PROFILE_RUN_COUNT, status='COMPLETED')
+        if item.get('peakCpus') is not None
+    ]
+    if not items:
+        return None
+    return {
+        'cpus': int(percentile([item['peakCpus'] for item in items], RECOMMENDATION_PERCENTILE)),
+        'gpus': int(percentile([item.get('peakGpus') or 0 for item in items], RECOMMENDATION_PERCENTILE)),
+        'sampleCount': len(items),
+    }
+
+
+# 完了したタスクを、タスク名ごとのタスクの数と合計実行時間 (秒) にまとめる
+def summarize_tasks(tasks: list) -> dict:
+    summary = {}
+    for task in tasks:
+        if task.get('status') != 'COMPLETED':
+            continue
+        seconds = get_task_seconds(task)
+        if seconds is None:
+            continue
+        item = summary.setdefault(normalize_task_name(task.get('name')), {'count': 0, 'totalSeconds': 0})
+        item['count'] += 1
+        item['totalSeconds'] += int(seconds)
+    return summary
+
+
+# ワークフローの完了済みの実行のタスクの記録から、進捗の見積もりのモデルを作成する (記録がなければ None を返す)
+# タスク名ごとの 1 回の実行あたりのタスクの数 (中央値) と、タスク 1 つあたりの実行時間 (平均)、実行全体の時間 (中央値) を求める
+def get_task_profile(tableName: str, workflowType: str, workflowId: str) -> dict:
+    now = time.time()
+    workflowKey = get_workflow_key(workflowType, workflowId)
+    cached = profileCache.get(workflowKey)
+    if cached and cached['expiresAt'] > now:
+        return cached['profile']
+
+    summaries = []
+    runSeconds = []
+    for item in list_run_statistics(tableName, workflowType, workflowId, limit=PROFILE_RUN_COUNT, status='COMPLETED'):
+        if item.get('taskSummary'):
+            summaries.append(json.loads(item['taskSummary']))
+            if item.get('durationSeconds'):
+                runSeconds.append(item['durationSeconds'])
+
+    profile = None
+    if summaries:
+        names = set(name for summary in summaries for name in summary.keys())
+        tasks = {}
+        for name in names:
+            counts = [summary.get(name, {}).get('count', 0) for summary in summaries]
+            totalCount = sum(counts)
+            totalSeconds = sum(summary.get(name, {}).get('totalSeconds', 0) for summary in summaries)
+            tasks[name] = {
+                'expectedCount': statistics.median(counts),
+                'meanSeconds': totalSeconds / totalCount if totalCount else 0,
+            }
+        profile = {
+            'tasks': tasks,
+            'runSeconds': statistics.median(runSeconds) if runSeconds else None,
+            'sampleCount': len(summaries),
+        }
+
+    profileCache[workflowKey] = {
+        'expiresAt': now + PROFILE_CACHE_SECONDS,
+        'profile': profile,
+    }
+    return profile
+
+
+# 実行中のワークフロー実行のタスクの状況から、進捗の割合と残り時間 (秒) を見積もる
+# タスク名ごとに、過去の実行のタスクの数 (今回の実行の方が多ければその数) と実行時間から全体の作業量を求め、
+# 完了したタスクと、実行中のタスクの経過時間の分だけ進んだとみなす
+def estimate_progress(profile: dict, tasks: list, elapsedSeconds: float) -> dict:
+    now = time.time()
+    profileTasks = profile['tasks']
+    defaultSeconds = statistics.mean(
+        [task['meanSeconds'] for task in profileTasks.values() if task['meanSeconds']] or [0]
+    )
+
+    groups = {}
+    for task in tasks:
+        groups.setdefault(normalize_task_name(task.get('name')), []).append(task)
+
+    totalWork = 0
+    doneWork = 0
+    for name in set(profileTasks.keys()) | set(groups.keys()):
+        seconds = profileTasks.get(name, {}).get('meanSeconds') or defaultSeconds
+        groupTasks = groups.get(name, [])
+        totalWork += max(profileTasks.get(name, {}).get('expectedCount', 0), len(groupTasks)) * seconds
+        for task in groupTasks:
+            if task.get('status') == 'COMPLETED':
+                doneWork += seconds
+            elif task.get('status') == 'RUNNING' and seconds:
+                doneWork += min(get_task_seconds(task, now) / seconds, MAX_RUNNING_TASK_PROGRESS) * seconds
+
+    progress = min(doneWork / totalWork, MAX_PROGRESS) if totalWork else 0
+
+    # 過去の実行全体の時間から求めた残り時間を、進捗が進むほど今回の実行のペースで補正する
+    runSeconds = profile.get('runSeconds')
+    remainingSeconds = None
+    if runSeconds:
+        remainingSeconds = (1 - progress) * ((1 - progress) * runSeconds + elapsedSeconds)
+    elif progress > 0:
+        remainingSeconds = elapsedSeconds / progress - elapsedSeconds
+
+    return {
+        'percentComplete': round(progress * 100, 1),
+        **({'estimatedRemainingSeconds': int(remainingSeconds)} if remainingSeconds is not None else {}),
+        'sampleCount': profile['sampleCount'],
+    }
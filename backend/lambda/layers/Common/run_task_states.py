@@ -0,0 +1,278 @@
+import json
+import time
+import uuid
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import botocore
+import dynamodb_common
+import run_statistics
+
+# ワークフロー実行のタスクの状態を記録し、前回の取得以降に作成・変更されたタスクだけを返すためのライブラリ
+#
+# タスクの一覧を取得するたびに Omics から取得したタスクの状態を RunTaskStates テーブルの記録と比べ、
+# 変わったタスクに実行ごとに増える連番 (sequence) を振って保存する
+# クライアントは前回受け取った連番 (カーソル) を渡すことで、それより後に変わったタスクだけを受け取れる
+#
+# 同じ実行の同期が並行すると、古い状態が新しい状態を上書きしたり、保存中の連番をカーソルが追い越したりするため、
+# 同期は実行ごとのリース (leaseToken) を取得した 1 つのリクエストだけが行い、保存を終えた連番を committedSequence に記録する
+# クライアントには committedSequence までのタスクだけを返す
+#
+# RunTaskStates テーブルの項目
+#   runId      ワークフロー実行の ID
+#   taskId     タスク ID。実行ごとの管理用の項目は RUN_ITEM_KEY
+#   sequence   タスクの状態が変わったときに振った連番 (SequenceIndex のソートキー)
+#   stateHash  タスクの状態のハッシュ値 (変わったかどうかの判定に使う)
+#   task       タスクの情報の JSON
+# 管理用の項目
+#   lastSequence       最後に予約した連番
+#   committedSequence  保存を終えた最後の連番 (これ以下の連番のタスクは全て保存済み)
+#   syncedAt           最後に Omics からタスクの状態の取得を始めた時刻
+#   leaseToken         同期中のリクエストを識別する値
+#   leaseUntil         同期中のリクエストが異常終了したとみなして、リースを引き継げるようになる時刻
+#   isFinal            ワークフロー実行が終了した後に取得済みで、以降はタスクの状態が変わらないか
+
+# 実行ごとの管理用の項目の taskId
+RUN_ITEM_KEY = '#RUN'
+
+# 連番の順にタスクを取得するためのインデックス
+SEQUENCE_INDEX_NAME = 'SequenceIndex'
+
+# Omics からタスクの状態を取得する最小の間隔 (秒)
+# 同じ実行の結果を複数の画面で開いていても、この間隔より頻繁には Omics の API を呼び出さない
+MIN_SYNC_INTERVAL_SECONDS = 5
+
+# 同期のリースを保持する時間 (秒)
+# API の Lambda 関数のタイムアウトより長くする
+LEASE_SECONDS = 60
+
+# タスクの状態を並列に保存するスレッド数
+WRITE_CONCURRENCY = 8
+
+# 終了したワークフロー実行の status
+TERMINAL_STATUSES = ['COMPLETED', 'FAILED', 'CANCELLED', 'DELETED']
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+omics = boto3.client('omics')
+
+# Omics のタスクの情報を JSON 化できる形式に変換する
+def _to_task(task: dict) -> dict:
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in task.items()}
+
+
+def _hash_task(task: dict) -> str:
+    return hashlib.sha256(json.dumps(task, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _get_run_item(tableName: str, runId: str) -> dict:
+    response = dynamodb.get_item(
+        TableName=tableName,
+        Key=dynamodb_common.to_dynamodb({
+            'runId': runId,
+            'taskId': RUN_ITEM_KEY,
+        }),
+        ConsistentRead=True,
+    )
+    return dynamodb_common.from_dynamodb(response.get('Item') or {})
+
+
+def _list_state_hashes(tableName: str, runId: str) -> dict:
+    hashes = {}
+    paginator = dynamodb.get_paginator('query')
+    for page in paginator.paginate(
+        TableName=tableName,
+        KeyConditionExpression='runId = :runId',
+        ProjectionExpression='taskId, stateHash',
+        ConsistentRead=True,
+        ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+            ':runId': runId,
+        }),
+    ):
+        for item in page.get('Items', []):
+            item = dynamodb_common.from_dynamodb(item)
+            if item.get('stateHash'):
+                hashes[item['taskId']] = item['stateHash']
+    return hashes
+
+
+# 同期のリースを取得する
+# 最後の取得から間もない場合、終了したワークフロー実行を取得済みの場合、他のリクエストが同期中の場合は None を返す
+def _acquire_lease(tableName: str, runId: str) -> str:
+    now = time.time()
+    leaseToken = uuid.uuid4().hex
+    try:
+        dynamodb.update_item(
+            TableName=tableName,
+            Key=dynamodb_common.to_dynamodb({
+                'runId': runId,
+                'taskId': RUN_ITEM_KEY,
+            }),
+            UpdateExpression='SET syncedAt = :now, leaseToken = :leaseToken, leaseUntil = :leaseUntil',
+            ConditionExpression='(attribute_not_exists(syncedAt) OR syncedAt <= :syncThreshold) '
+                                'AND (attribute_not_exists(leaseUntil) OR leaseUntil < :now) '
+                                'AND (attribute_not_exists(isFinal) OR isFinal = :false)',
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':now': int(now),
+                ':syncThreshold': int(now - MIN_SYNC_INTERVAL_SECONDS),
+                ':leaseToken': leaseToken,
+                ':leaseUntil': int(now + LEASE_SECONDS),
+                ':false': False,
+            }),
+        )
+        return leaseToken
+
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return None
+
+
+# リースを保持していることを確かめて連番をまとめて予約し、予約した最初の連番を返す
+# リースを失っていた場合は None を返す
+def _reserve_sequences(tableName: str, runId: str, leaseToken: str, count: int) -> int:
+    try:
+        response = dynamodb.update_item(
+            TableName=tableName,
+            Key=dynamodb_common.to_dynamodb({
+                'runId': runId,
+                'taskId': RUN_ITEM_KEY,
+            }),
+            UpdateExpression='ADD lastSequence :count',
+            ConditionExpression='leaseToken = :leaseToken',
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':count': count,
+                ':leaseToken': leaseToken,
+            }),
+            ReturnValues='UPDATED_NEW',
+        )
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return None
+    lastSequence = int(response['Attributes']['lastSequence']['N'])
+    return lastSequence - count + 1
+
+
+# タスクの状態を保存する
+# リースを失った後に書き込みが遅れて届いても新しい状態を上書きしないよう、保存済みの連番より大きい場合だけ書き込む
+def _write_item(tableName: str, item: dict):
+    try:
+        dynamodb.put_item(
+            TableName=tableName,
+            Item=dynamodb_common.to_dynamodb(item),
+            ConditionExpression='attribute_not_exists(#sequence) OR #sequence < :sequence',
+            ExpressionAttributeNames={
+                '#sequence': 'sequence',
+            },
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':sequence': item['sequence'],
+            }),
+        )
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+# 保存を終えた連番と実行が終了したかを記録し、リースを解放する
+# リースを失っていた (他のリクエストが引き継いだ) 場合は記録せずに False を返す
+def _commit(tableName: str, runId: str, leaseToken: str, lastSequence: int, isFinal: bool) -> bool:
+    try:
+        dynamodb.update_item(
+            TableName=tableName,
+            Key=dynamodb_common.to_dynamodb({
+                'runId': runId,
+                'taskId': RUN_ITEM_KEY,
+            }),
+            UpdateExpression='SET committedSequence = :lastSequence, isFinal = :isFinal REMOVE leaseToken, leaseUntil',
+            # 自分より後に連番を予約したリクエストがあれば、そちらの結果を優先する
+            ConditionExpression='leaseToken = :leaseToken AND lastSequence = :lastSequence',
+            ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+                ':lastSequence': lastSequence,
+                ':isFinal': isFinal,
+                ':leaseToken': leaseToken,
+            }),
+        )
+        return True
+
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+# Omics から取得したタスクの状態を記録と比べ、変わったタスクに連番を振って保存する
+# 保存を終えた最後の連番と、以降はタスクの状態が変わらないかを (committedSequence, isFinal) で返す
+# 最後の取得から間もない場合、終了したワークフロー実行を取得済みの場合、他のリクエストが同期中の場合は
+# Omics の API を呼び出さずに、記録済みの値を返す
+def sync(tableName: str, runId: str) -> tuple:
+    leaseToken = _acquire_lease(tableName, runId)
+    if leaseToken:
+        result = _sync_with_lease(tableName, runId, leaseToken)
+        if result:
+            return result
+
+    runItem = _get_run_item(tableName, runId)
+    return runItem.get('committedSequence', 0), bool(runItem.get('isFinal'))
+
+
+# リースを取得したリクエストが同期を行い、(committedSequence, isFinal) を返す (途中でリースを失った場合は None を返す)
+def _sync_with_lease(tableName: str, runId: str, leaseToken: str) -> tuple:
+    # タスクの一覧より前に実行の状態を取得し、終了した後に取得したタスクの一覧だけを最終とみなす
+    isFinal = omics.get_run(id=runId)['status'] in TERMINAL_STATUSES
+    tasks = [_to_task(task) for task in run_statistics.list_run_tasks(runId, maxCount=None)]
+    hashes = _list_state_hashes(tableName, runId)
+
+    changedTasks = [task for task in tasks if hashes.get(task['taskId']) != _hash_task(task)]
+    # 変わったタスクがなくても、リースを保持していることを確かめるために予約する (0 件の予約は連番を変えない)
+    firstSequence = _reserve_sequences(tableName, runId, leaseToken, len(changedTasks))
+    if firstSequence is None:
+        return None
+
+    items = [
+        {
+            'runId': runId,
+            'taskId': task['taskId'],
+            'sequence': firstSequence + index,
+            'stateHash': _hash_task(task),
+            'task': json.dumps(task),
+        }
+        for index, task in enumerate(changedTasks)
+    ]
+    if items:
+        with ThreadPoolExecutor(max_workers=WRITE_CONCURRENCY) as executor:
+            list(executor.map(lambda item: _write_item(tableName, item), items))
+
+    lastSequence = firstSequence + len(changedTasks) - 1
+    if not _commit(tableName, runId, leaseToken, lastSequence, isFinal):
+        return None
+    return lastSequence, isFinal
+
+
+# 指定された連番より後、until 以下の連番で作成・変更されたタスクを、連番の順に返す
+def list_changes(tableName: str, runId: str, since: int, until: int) -> list:
+    tasks = []
+    if until <= since:
+        return tasks
+
+    paginator = dynamodb.get_paginator('query')
+    for page in paginator.paginate(
+        TableName=tableName,
+        IndexName=SEQUENCE_INDEX_NAME,
+        KeyConditionExpression='runId = :runId AND #sequence BETWEEN :from AND :until',
+        # 直前に保存したタスクも返せるよう、ローカルセカンダリインデックスを強い整合性で読む
+        ConsistentRead=True,
+        ExpressionAttributeNames={
+            '#sequence': 'sequence',
+        },
+        ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+            ':runId': runId,
+            ':from': since + 1,
+            ':until': until,
+        }),
+    ):
+        for item in page.get('Items', []):
+            item = dynamodb_common.from_dynamodb(item)
+            tasks.append(json.loads(item['task']))
+    return tasks
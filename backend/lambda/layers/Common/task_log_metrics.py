@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import boto3
+import botocore
+from botocore.config import Config
+
+# タスクのログに出力されるツールの進捗行から、処理量 (スループット) の指標を取り出すライブラリ
+#
+# GATK の ProgressMeter や STAR、bwa などが出力する進捗行は、タスクの実行時間よりも処理の速さをよく表すため、
+# 完了したタスクのログを先頭から 1 回だけ読み、パターンに一致した行から指標を集計する
+#
+# パターンは次の形式の dict で定義し、DEFAULT_PATTERNS に加えて環境変数 TASK_LOG_METRIC_PATTERNS に JSON の配列で追加できる
+#   tool       指標をまとめるツールの名前
+#   keyword    行に含まれる文字列 (含まれない行は正規表現を評価せずに読み飛ばす)
+#   taskName   パターンを適用するタスク名の正規表現 (省略時は全てのタスク)
+#   値の指標:
+#     pattern    名前付きグループで指標の値を取り出す正規表現
+#     aggregate  一致した行が複数ある場合の集計方法 (sum, last, max, mean)。指標ごとに dict でも指定できる
+#     rates      2 つの指標の比を求める指標 ({"指標名": ["分子の指標名", "分母の指標名"]})
+#   区間の指標:
+#     phase      区間の名前 ({phase}Seconds という指標になる)
+#     start, end 区間の開始と終了の行の正規表現 (ログイベントのタイムスタンプの差を区間の時間とする)
+
+# 集計方法
+SUM = 'sum'
+LAST = 'last'
+MAX = 'max'
+MEAN = 'mean'
+
+# 標準のパターン
+DEFAULT_PATTERNS = [
+    # GATK: "ProgressMeter -  chr1:1234567  1.0  1000000  1000000.0" (位置、経過分、処理数、1 分あたりの処理数)
+    {
+        'tool': 'gatk',
+        'keyword': 'ProgressMeter',
+        'pattern': r'ProgressMeter\s+-\s+\S+\s+(?P<elapsedMinutes>[\d.]+)\s+(?P<recordsProcessed>\d+)\s+(?P<recordsPerMinute>[\d.]+)\s*$',
+        'aggregate': {'elapsedMinutes': LAST, 'recordsProcessed': LAST, 'recordsPerMinute': MEAN},
+    },
+    {
+        'tool': 'gatk',
+        'keyword': 'Traversal complete',
+        'pattern': r'Traversal complete\. Processed (?P<totalRecords>[\d,]+) total \w+ in (?P<traversalMinutes>[\d.]+) minutes',
+        'aggregate': LAST,
+    },
+    # bwa mem: "[M::mem_process_seqs] Processed 10000 reads in 12.345 CPU sec, 3.210 real sec"
+    {
+        'tool': 'bwa',
+        'keyword': 'mem_process_seqs',
+        'pattern': r'Processed (?P<reads>\d+) reads in (?P<cpuSeconds>[\d.]+) CPU sec, (?P<realSeconds>[\d.]+) real sec',
+        'aggregate': SUM,
+        'rates': {'readsPerSecond': ['reads', 'realSeconds']},
+    },
+    {
+        'tool': 'bwa',
+        'keyword': '[main] Real time',
+        'pattern': r'\[main\] Real time: (?P<totalRealSeconds>[\d.]+) sec; CPU: (?P<totalCpuSeconds>[\d.]+) sec',
+        'aggregate': LAST,
+        'rates': {'cpuUtilization': ['totalCpuSeconds', 'totalRealSeconds']},
+    },
+    # STAR: "Mar 01 10:00:00 ..... started mapping" などの区間と、Log.final.out の集計値
+    {
+        'tool': 'star',
+        'phase': 'loadGenome',
+        'start': r'\.\.\.\.\. loading genome',
+        'end': r'\.\.\.\.\. started mapping',
+    },
+    {
+        'tool': 'star',
+        'phase': 'mapping',
+        'start': r'\.\.\.\.\. started mapping',
+        'end': r'\.\.\.\.\. finished mapping',
+    },
+    {
+        'tool': 'star',
+        'phase': 'sortBam',
+        'start': r'\.\.\.\.\. started sorting BAM',
+        'end': r'\.\.\.\.\. finished successfully',
+    },
+    {
+        'tool': 'star',
+        'keyword': 'Number of input reads',
+        'pattern': r'Number of input reads \|\s*(?P<inputReads>\d+)',
+        'aggregate': LAST,
+    },
+    {
+        'tool': 'star',
+        'keyword': 'Mapping speed',
+        'pattern': r'Mapping speed, Million of reads per hour \|\s*(?P<millionReadsPerHour>[\d.]+)',
+        'aggregate': LAST,
+    },
+    # Picard: "MarkDuplicates  Read 10,000,000 records.  Elapsed time: 00:01:23s."
+    {
+        'tool': 'picard',
+        'keyword': 'Elapsed time',
+        'pattern': r'(?:Read|Processed) (?P<records>[\d,]+) records\.\s+Elapsed time: (?P<elapsedSeconds>[\d:]+)s',
+        'aggregate': LAST,
+        'rates': {'recordsPerSecond': ['records', 'elapsedSeconds']},
+    },
+]
+
+# 1 つのタスクについて読むログイベントの最大数
+MAX_LOG_EVENTS = 500000
+
+# タスクのログが出力されるロググループと、ログストリームの名前
+OMICS_LOG_GROUP_NAME = '/aws/omics/WorkflowLog'
+LOG_STREAM_NAME_FORMAT = 'run/{runId}/task/{taskId}'
+
+# AWS サービスのクライアントを初期化
+# GetLogEvents はアカウント全体で秒間の呼び出し数の上限が低いため、スロットリングされたら間隔を空けて再試行する
+logs = boto3.client('logs', config=Config(retries={'max_attempts': 10, 'mode': 'adaptive'}))
+
+
+# パターンの正規表現をコンパイルする
+def compile_patterns(definitions: list) -> list:
+    patterns = []
+    for definition in definitions:
+        pattern = {**definition}
+        for key in ['pattern', 'start', 'end', 'taskName']:
+            if pattern.get(key):
+                pattern[key] = re.compile(pattern[key])
+        patterns.append(pattern)
+    return patterns
+
+
+# 標準のパターンと、環境変数で追加されたパターンを返す
+def load_patterns() -> list:
+    definitions = [*DEFAULT_PATTERNS]
+    extra = os.environ.get('TASK_LOG_METRIC_PATTERNS')
+    if extra:
+        definitions.extend(json.loads(extra))
+    return compile_patterns(definitions)
+
+
+# 指標の値を数値に変換する (桁区切りのカンマと、hh:mm:ss 形式の時間に対応する)
+def to_number(value: str) -> float:
+    value = value.replace(',', '')
+    if ':' in value:
+        seconds = 0
+        for part in value.split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    return float(value)
+
+
+# ログを先頭から 1 回だけ読みながら、パターンに一致した行の指標を集計する
+class MetricsCollector:
+    def __init__(self, patterns: list, taskName: str = None):
+        self.patterns = [
+            pattern for pattern in patterns
+            if not pattern.get('taskName') or pattern['taskName'].search(taskName or '')
+        ]
+        self.values = {}
+        self.phases = {}
+
+    def _aggregate(self, pattern: dict, metric: str) -> str:
+        aggregate = pattern.get('aggregate', LAST)
+        return aggregate.get(metric, LAST) if isinstance(aggregate, dict) else aggregate
+
+    def add(self, message: str, timestamp: int):
+        for index, pattern in enumerate(self.patterns):
+            keyword = pattern.get('keyword')
+            if keyword and keyword not in message:
+                continue
+
+            if pattern.get('phase'):
+                phase = self.phases.setdefault(index, {})
+                if 'start' not in phase and pattern['start'].search(message):
+                    phase['start'] = timestamp
+                elif 'start' in phase and 'end' not in phase and pattern['end'].search(message):
+                    phase['end'] = timestamp
+                continue
+
+            match = pattern['pattern'].search(message)
+            if not match:
+                continue
+            for metric, value in match.groupdict().items():
+                if value is None:
+                    continue
+                try:
+                    number = to_number(value)
+                except ValueError:
+                    continue
+                key = (pattern['tool'], metric)
+                current = self.values.setdefault(key, {'aggregate': self._aggregate(pattern, metric), 'count': 0})
+                aggregate = current['aggregate']
+                if aggregate in [SUM, MEAN]:
+                    current['value'] = current.get('value', 0) + number
+                elif aggregate == MAX:
+                    current['value'] = max(current.get('value', number), number)
+                else:
+                    current['value'] = number
+                current['count'] += 1
+
+    # ツールごとの指標を返す ({"bwa": {"reads": 1000000, "readsPerSecond": 3115.3}})
+    def result(self) -> dict:
+        metrics = {}
+        for (tool, metric), current in self.values.items():
+            value = current['value'] / current['count'] if current['aggregate'] == MEAN else current['value']
+            metrics.setdefault(tool, {})[metric] = round(value, 3)
+
+        for index, phase in self.phases.items():
+            if 'start' in phase and 'end' in phase:
+                pattern = self.patterns[index]
+                metrics.setdefault(pattern['tool'], {})[f"{pattern['phase']}Seconds"] = (phase['end'] - phase['start']) / 1000
+
+        for pattern in self.patterns:
+            for metric, (numerator, denominator) in (pattern.get('rates') or {}).items():
+                toolMetrics = metrics.get(pattern['tool'], {})
+                if toolMetrics.get(denominator) and numerator in toolMetrics:
+                    toolMetrics[metric] = round(toolMetrics[numerator] / toolMetrics[denominator], 3)
+        return metrics
+
+
+# タスクのログイベントを先頭から順に返す (ログストリームがなければ何も返さない)
+def iterate_log_events(runId: str, taskId: str, maxEvents: int = MAX_LOG_EVENTS):
+    count = 0
+    nextToken = None
+    while True:
+        try:
+            response = logs.get_log_events(
+                logGroupName=OMICS_LOG_GROUP_NAME,
+                logStreamName=LOG_STREAM_NAME_FORMAT.format(runId=runId, taskId=taskId),
+                startFromHead=True,
+                **({'nextToken': nextToken} if nextToken else {}),
+            )
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            return
+
+        events = response.get('events', [])
+        for event in events:
+            yield event
+            count += 1
+            if count >= maxEvents:
+                return
+
+        # 同じトークンが返されたら、ログの末尾まで読んだとみなす
+        if not events or response.get('nextForwardToken') == nextToken:
+            return
+        nextToken = response.get('nextForwardToken')
+
+
+# タスクのログを読み、ツールごとの指標を返す
+def mine_task_log(runId: str, task: dict, patterns: list, maxEvents: int = MAX_LOG_EVENTS) -> dict:
+    collector = MetricsCollector(patterns, task.get('name'))
+    eventCount = 0
+    for event in iterate_log_events(runId, task['taskId'], maxEvents):
+        collector.add(event.get('message') or '', event.get('timestamp') or 0)
+        eventCount += 1
+
+    return {
+        'taskId': task['taskId'],
+        'name': task.get('name'),
+        'metrics': collector.result(),
+        'eventCount': eventCount,
+        'truncated': eventCount >= maxEvents,
+    }
@@ -0,0 +1,113 @@
+import json
+import statistics
+import run_statistics
+
+# 同じワークフローの完了済みの実行と比べて、実行時間が大きく変わったタスクを検出するライブラリ
+#
+# RunStatistics テーブルに実行ごとに記録したタスク名ごとの実行時間 (taskSummary) を、終了時刻の順に並んだ時系列として使う
+# 対象の実行より前に完了した実行を基準とし、タスク 1 つあたりの平均実行時間が基準の中央値から外れたタスクを返す
+# 外れ具合は中央値絶対偏差 (MAD) から求めた頑健な z スコアで測るため、基準に 1 回だけ遅い実行があっても影響を受けにくい
+
+# 遅くなった / 速くなった
+SLOWER = 'SLOWER'
+FASTER = 'FASTER'
+
+# 基準とする完了済みの実行の数と、タスクごとに比較するために必要な最小の数
+BASELINE_RUN_COUNT = 10
+MIN_BASELINE_RUN_COUNT = 3
+
+# 対象の実行を探すために遡る完了済みの実行の数
+MAX_SEARCH_RUN_COUNT = 50
+
+# 変化とみなす基準の中央値に対する比率、z スコア、実行時間の差 (秒)
+# 短いタスクの誤差を検出しないよう、全ての条件を満たした場合のみ変化とみなす
+MIN_RATIO = 1.5
+MIN_Z_SCORE = 3.0
+MIN_DELTA_SECONDS = 60
+
+# MAD を正規分布の標準偏差に換算する係数
+MAD_SCALE = 1.4826
+
+# 基準のばらつきがない場合に、中央値に対して最低限とみなすばらつきの割合
+MIN_SPREAD_RATIO = 0.05
+
+
+# taskSummary から、タスク名ごとのタスク 1 つあたりの平均実行時間 (秒) を求める
+def get_mean_seconds(taskSummary: dict) -> dict:
+    return {
+        name: item['totalSeconds'] / item['count']
+        for name, item in (taskSummary or {}).items() if item.get('count')
+    }
+
+
+# 対象の実行のタスクの平均実行時間を、基準の実行の平均実行時間の系列と比較する (変化していなければ None を返す)
+def compare_task(name: str, seconds: float, baseline: list) -> dict:
+    if len(baseline) < MIN_BASELINE_RUN_COUNT:
+        return None
+
+    values = [point['meanSeconds'] for point in baseline]
+    median = statistics.median(values)
+    mad = statistics.median([abs(value - median) for value in values])
+    spread = max(MAD_SCALE * mad, MIN_SPREAD_RATIO * median, 1)
+    zScore = (seconds - median) / spread
+    ratio = seconds / median if median else None
+
+    if abs(seconds - median) < MIN_DELTA_SECONDS or abs(zScore) < MIN_Z_SCORE:
+        return None
+    if ratio is not None and 1 / MIN_RATIO < ratio < MIN_RATIO:
+        return None
+
+    return {
+        'name': name,
+        'direction': SLOWER if seconds > median else FASTER,
+        'meanSeconds': round(seconds, 1),
+        'baselineMedianSeconds': round(median, 1),
+        **({'ratio': round(ratio, 2)} if ratio is not None else {}),
+        'zScore': round(zScore, 1),
+        'baselineRunCount': len(baseline),
+        # 基準の実行の時系列 (古い順)
+        'history': list(reversed(baseline)),
+    }
+
+
+# ワークフローの完了済みの実行 (指定しなければ最新の実行) について、実行時間が大きく変わったタスクを返す
+# 対象の実行の統計情報が記録されていなければ None を返す
+def detect_task_regressions(tableName: str, workflowType: str, workflowId: str, runId: str = None) -> dict:
+    items = [
+        item for item in run_statistics.list_run_statistics(
+            tableName, workflowType, workflowId, limit=MAX_SEARCH_RUN_COUNT + BASELINE_RUN_COUNT, status='COMPLETED')
+        if item.get('taskSummary')
+    ]
+    index = next((i for i, item in enumerate(items[:MAX_SEARCH_RUN_COUNT]) if not runId or item['runId'] == runId), None)
+    if index is None:
+        return None
+
+    target = items[index]
+    baselineItems = items[index + 1:index + 1 + BASELINE_RUN_COUNT]
+
+    # タスク名ごとの基準の時系列 (新しい順)
+    series = {}
+    for item in baselineItems:
+        for name, seconds in get_mean_seconds(json.loads(item['taskSummary'])).items():
+            series.setdefault(name, []).append({
+                'runId': item['runId'],
+                'stopTime': item.get('stopTime'),
+                **({'workflowVersionName': item['workflowVersionName']} if item.get('workflowVersionName') else {}),
+                'meanSeconds': round(seconds, 1),
+            })
+
+    regressions = []
+    for name, seconds in get_mean_seconds(json.loads(target['taskSummary'])).items():
+        regression = compare_task(name, seconds, series.get(name, []))
+        if regression:
+            regressions.append(regression)
+    # 遅くなったタスクを先に、外れ具合の大きい順に並べる
+    regressions.sort(key=lambda item: (item['direction'] != SLOWER, -abs(item['zScore'])))
+
+    return {
+        'runId': target['runId'],
+        'stopTime': target.get('stopTime'),
+        **({'workflowVersionName': target['workflowVersionName']} if target.get('workflowVersionName') else {}),
+        'baselineRunCount': len(baselineItems),
+        'regressions': regressions,
+    }
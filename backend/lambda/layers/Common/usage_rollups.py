@@ -0,0 +1,205 @@
+import time
+import boto3
+import botocore
+import dynamodb_common
+
+# ユーザーごと・ワークフローごとのリソースの使用量を月単位で集計するライブラリ
+#
+# ワークフロー実行が終了するたびに、その実行の使用量を集計値に加算する (ADD) ため、使用量を求めるときに過去の実行を走査する必要がない
+# 同じ実行を 2 回加算しないよう、加算と同じトランザクションで実行ごとの記録済みマーカーを条件付きで書き込む
+#
+# UsageRollups テーブルの項目
+#   rollupKey    集計の単位 (USER#{ユーザー ID}, WORKFLOW#{ワークフローの種類}_{ワークフロー ID}, ACCOUNT#ALL)
+#                記録済みマーカーは RUN#{実行 ID}
+#   period       集計の期間 (YYYY-MM, ワークフロー実行の終了時刻の月 (UTC))。記録済みマーカーは RECORDED
+#   scopePeriod  集計の単位の種類と期間を連結した値 (USER#YYYY-MM など)。期間ごとに全てのユーザーやワークフローを一覧するインデックスのキー
+#   runCount などの集計値 (COUNTERS)
+
+# 集計の単位の種類
+USER = 'USER'
+WORKFLOW = 'WORKFLOW'
+ACCOUNT = 'ACCOUNT'
+SCOPES = [USER, WORKFLOW, ACCOUNT]
+
+# 期間ごとに全てのユーザーやワークフローを一覧するためのインデックス
+SCOPE_PERIOD_INDEX_NAME = 'ScopePeriodIndex'
+
+# 集計値の名前
+COUNTERS = [
+    'runCount',
+    'completedRunCount',
+    'failedRunCount',
+    'cancelledRunCount',
+    'taskCount',
+    'runHours',
+    'cpuHours',
+    'memoryGiBHours',
+    'gpuHours',
+    'storageGiBHours',
+    'idleStorageGiBHours',
+    'computeCost',
+    'storageCost',
+    'totalCost',
+]
+
+# 記録済みマーカーを保持する期間 (秒)
+# 同じ実行の統計情報の記録が再試行されても二重に加算しないためのもので、再試行される期間より十分に長くする
+MARKER_EXPIRATION_SECONDS = 90 * 24 * 60 * 60
+
+# AWS サービスのクライアントを初期化
+dynamodb = boto3.client('dynamodb')
+
+# 集計の単位の種類と ID から rollupKey を返す
+def get_rollup_key(scope: str, scopeId: str) -> str:
+    return f'{scope}#{scopeId}'
+
+
+# ワークフローの集計の単位の ID を返す
+def get_workflow_scope_id(workflowType: str, workflowId: str) -> str:
+    return f'{workflowType}_{workflowId}'
+
+
+# ワークフロー実行を集計する期間 (YYYY-MM) を返す
+def get_period(run: dict) -> str:
+    timestamp = run.get('stopTime') or run.get('startTime') or run['creationTime']
+    return timestamp.strftime('%Y-%m')
+
+
+# ワークフロー実行の使用量 (run_accounting.compute_accounting() の結果) から、集計値に加算する値を求める
+# 加算を繰り返しても小数点以下の桁数が増え続けないよう、小数は 6 桁に丸める
+def get_increments(accounting: dict) -> dict:
+    status = accounting.get('status')
+    increments = {
+        'runCount': 1,
+        'completedRunCount': 1 if status == 'COMPLETED' else 0,
+        'failedRunCount': 1 if status == 'FAILED' else 0,
+        'cancelledRunCount': 1 if status == 'CANCELLED' else 0,
+        'taskCount': accounting['taskCount'],
+        'runHours': accounting['runHours'],
+        'cpuHours': accounting['cpuHours'],
+        'memoryGiBHours': accounting['memoryGiBHours'],
+        'gpuHours': accounting['gpuHours'],
+        'storageGiBHours': accounting['storage']['gibHours'],
+        'idleStorageGiBHours': accounting['storage']['idleGiBHours'],
+        'computeCost': accounting['estimatedCost']['compute'],
+        'storageCost': accounting['estimatedCost']['storage'],
+        'totalCost': accounting['estimatedCost']['total'],
+    }
+    return {name: round(value, 6) if isinstance(value, float) else value for name, value in increments.items()}
+
+
+# 終了したワークフロー実行の使用量を、ユーザー・ワークフロー・アカウント全体の集計値に加算する
+# 既に加算済みの実行であれば何もせずに False を返す
+def record_run_usage(tableName: str, userId: str, run: dict, accounting: dict) -> bool:
+    now = int(time.time())
+    period = get_period(run)
+    workflowType = run.get('workflowType') or 'PRIVATE'
+    workflowId = run['workflowId']
+    increments = get_increments(accounting)
+
+    # 集計の単位ごとに、一覧に表示するための属性
+    rollups = [
+        (USER, userId, {'userId': userId}),
+        (WORKFLOW, get_workflow_scope_id(workflowType, workflowId), {'workflowType': workflowType, 'workflowId': workflowId}),
+        (ACCOUNT, 'ALL', {}),
+    ]
+
+    transactItems = [{
+        'Put': {
+            'TableName': tableName,
+            'Item': dynamodb_common.to_dynamodb({
+                'rollupKey': get_rollup_key('RUN', run['id']),
+                'period': 'RECORDED',
+                'usagePeriod': period,
+                'userId': userId,
+                'recordedAt': now,
+                'expiresAt': now + MARKER_EXPIRATION_SECONDS,
+            }),
+            'ConditionExpression': 'attribute_not_exists(rollupKey)',
+        },
+    }]
+    for scope, scopeId, attributes in rollups:
+        attributes = {
+            'scopePeriod': f'{scope}#{period}',
+            'updatedAt': now,
+            **attributes,
+        }
+        transactItems.append({
+            'Update': {
+                'TableName': tableName,
+                'Key': dynamodb_common.to_dynamodb({
+                    'rollupKey': get_rollup_key(scope, scopeId),
+                    'period': period,
+                }),
+                'UpdateExpression': (
+                    'SET ' + ', '.join(f'#{name} = :{name}' for name in attributes.keys())
+                    + ' ADD ' + ', '.join(f'#{name} :{name}' for name in COUNTERS)
+                ),
+                'ExpressionAttributeNames': {
+                    f'#{name}': name for name in [*attributes.keys(), *COUNTERS]
+                },
+                'ExpressionAttributeValues': dynamodb_common.to_dynamodb({
+                    **{f':{name}': value for name, value in attributes.items()},
+                    **{f':{name}': increments[name] for name in COUNTERS},
+                }),
+            },
+        })
+
+    try:
+        dynamodb.transact_write_items(TransactItems=transactItems)
+        return True
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        # 記録済みマーカーの条件だけが満たされなかった場合は、加算済みの実行とみなす
+        reasons = err.response.get('CancellationReasons') or []
+        if reasons and reasons[0].get('Code') == 'ConditionalCheckFailed':
+            return False
+        raise
+
+
+def _to_usage(item: dict) -> dict:
+    scope, scopeId = item['rollupKey'].split('#', 1)
+    return {
+        'scope': scope,
+        'scopeId': scopeId,
+        'period': item['period'],
+        **{key: item[key] for key in ['userId', 'workflowType', 'workflowId'] if key in item},
+        **{name: item.get(name, 0) for name in COUNTERS},
+    }
+
+
+# 集計の単位 (ユーザー、ワークフロー、アカウント全体) の集計値を、期間の古い順に返す
+def list_usage(tableName: str, scope: str, scopeId: str, fromPeriod: str, toPeriod: str) -> list:
+    items = []
+    paginator = dynamodb.get_paginator('query')
+    for page in paginator.paginate(
+        TableName=tableName,
+        KeyConditionExpression='rollupKey = :rollupKey AND #period BETWEEN :fromPeriod AND :toPeriod',
+        ExpressionAttributeNames={
+            '#period': 'period',
+        },
+        ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+            ':rollupKey': get_rollup_key(scope, scopeId),
+            ':fromPeriod': fromPeriod,
+            ':toPeriod': toPeriod,
+        }),
+    ):
+        items.extend(_to_usage(dynamodb_common.from_dynamodb(item)) for item in page.get('Items', []))
+    return items
+
+
+# 指定された期間の、全てのユーザーまたは全てのワークフローの集計値を返す
+def list_usage_by_period(tableName: str, scope: str, period: str) -> list:
+    items = []
+    paginator = dynamodb.get_paginator('query')
+    for page in paginator.paginate(
+        TableName=tableName,
+        IndexName=SCOPE_PERIOD_INDEX_NAME,
+        KeyConditionExpression='scopePeriod = :scopePeriod',
+        ExpressionAttributeValues=dynamodb_common.to_dynamodb({
+            ':scopePeriod': f'{scope}#{period}',
+        }),
+    ):
+        items.extend(_to_usage(dynamodb_common.from_dynamodb(item)) for item in page.get('Items', []))
+    return items
@@ -4,6 +4,7 @@ import * as sfn from "aws-cdk-lib/aws-stepfunctions";
 import * as sfnTasks from "aws-cdk-lib/aws-stepfunctions-tasks";
 import * as glue from '@aws-cdk/aws-glue-alpha';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
+import * as lambdaPython from '@aws-cdk/aws-lambda-python-alpha';
 import * as s3 from "aws-cdk-lib/aws-s3";
 import * as iam from 'aws-cdk-lib/aws-iam';
 
@@ -16,6 +17,14 @@ import { DynamoDb } from "./constructs/backend-dynamodb";
 export interface AlphaFold3DmolVisualizerStackProps extends cdk.StackProps {
   /** 前処理や後処理の結果を保存するための DynamoDB テーブル */
   dynamoDb: DynamoDb;
+
+  /**
+   * Lambda 関数で展開する AlphaFold の実行結果 (results.tar.gz) の圧縮後の最大サイズ (バイト)
+   * HEAD リクエストで取得できる圧縮後のサイズで判定するため、展開後に 4 倍程度に膨らんでも
+   * Lambda 関数の実行時間内に展開できるよう、控えめな値にする
+   * これより大きな実行結果は Glue ジョブで展開する (default: 128 MiB)
+   */
+  lambdaMaxResultsSize?: number;
 }
 
 /** AlphaFold の 3Dmol による可視化を構築する CDK スタック */
@@ -30,22 +39,83 @@ export class AlphaFold3DmolVisualizerStack extends cdk.Stack {
     super(scope, id, props);
 
     const stageName = cdk.Stage.of(this)?.stageName;
+    const lambdaMaxResultsSize = props.lambdaMaxResultsSize ?? 128 * 1024 * 1024;
 
     // Omics ワークフローの実行結果の出力先となる S3 バケットを取得
     const workflowOutputBucketArn = cdk.Fn.importValue(`${stageName ?? ''}OmicsWorkflowOutputBucketArn`);
     const workflowOutputBucket = s3.Bucket.fromBucketArn(this, 'WorkflowOutputBucket', workflowOutputBucketArn);
 
-    // AlphaFold の実行結果を展開する Glue python shell ジョブを作成する
+    // 可視化ジョブの共通処理 (visualizer_sdk) をまとめた Lambda レイヤーを作成する
+    const visualizerSdkLayer = new lambdaPython.PythonLayerVersion(this, 'VisualizerSdkLayer', {
+      entry: path.resolve(__dirname, '../../visualizer/layers/VisualizerSdk'),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+      compatibleArchitectures: [lambda.Architecture.X86_64]
+    });
+
+    // AlphaFold の実行結果を展開する処理をまとめた Lambda レイヤーを作成する
+    const alphaFoldLayer = new lambdaPython.PythonLayerVersion(this, 'AlphaFoldLayer', {
+      entry: path.resolve(__dirname, '../../visualizer/layers/AlphaFold'),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+      compatibleArchitectures: [lambda.Architecture.X86_64]
+    });
+
+    // AlphaFold の実行結果のサイズを取得する Step Functions タスクを実装した Lambda 関数を作成する
+    const getResultsTaskFunction = new lambdaPython.PythonFunction(this, 'GetResultsTaskFunction', {
+      entry: path.resolve(__dirname, '../../visualizer/lambda/AlphaFoldGetResultsTask'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      layers: [visualizerSdkLayer, alphaFoldLayer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE,
+    });
+    workflowOutputBucket.grantRead(getResultsTaskFunction);
+
+    // サイズの小さな AlphaFold の実行結果を展開する Step Functions タスクを実装した Lambda 関数を作成する
+    const extractResultsTaskFunction = new lambdaPython.PythonFunction(this, 'ExtractResultsTaskFunction', {
+      entry: path.resolve(__dirname, '../../visualizer/lambda/AlphaFoldExtractResultsTask'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      // 展開したファイルをメモリ上で扱うため、メモリサイズを大きくする
+      // (MEMBER_MAX_MEMORY_SIZE を超えるファイルは一時ファイルを経由するため、メモリには読み込まない)
+      memorySize: 2048,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS: props.dynamoDb.runVisualizationsTable.tableName,
+      },
+
+      layers: [visualizerSdkLayer, alphaFoldLayer],
+
+      timeout: cdk.Duration.minutes(15),
+      tracing: lambda.Tracing.ACTIVE,
+    });
+    workflowOutputBucket.grantReadWrite(extractResultsTaskFunction);
+    props.dynamoDb.runVisualizationsTable.grantReadWriteData(extractResultsTaskFunction);
+
+    // サイズの大きな AlphaFold の実行結果を展開する Glue python shell ジョブを作成する
     const extractResultsJob = new glue.PythonShellJob(this, 'ExtractResultsJob', {
       jobName: `${stageName ?? ''}AlphaFoldExtractResultsJob`,
       // Job で利用する実行環境とソースコードの場所の指定
       glueVersion: glue.GlueVersion.V2_0,
       pythonVersion: glue.PythonVersion.THREE_NINE,
       script: glue.Code.fromAsset(path.join(__dirname, '../../visualizer/glue/AlphaFoldExtractResultsJob/index.py')),
+      // Lambda 関数と共通の展開処理を読み込む
+      extraPythonFiles: [
+        glue.Code.fromAsset(path.join(__dirname, '../../visualizer/layers/VisualizerSdk/visualizer_sdk.py')),
+        glue.Code.fromAsset(path.join(__dirname, '../../visualizer/layers/AlphaFold/alphafold_extract_results.py')),
+        glue.Code.fromAsset(path.join(__dirname, '../../visualizer/layers/AlphaFold/alphafold_structure.py')),
+        glue.Code.fromAsset(path.join(__dirname, '../../visualizer/layers/AlphaFold/alphafold_confidence.py')),
+        glue.Code.fromAsset(path.join(__dirname, '../../visualizer/layers/AlphaFold/alphafold_pae.py')),
+        glue.Code.fromAsset(path.join(__dirname, '../../visualizer/layers/AlphaFold/alphafold_comparison.py')),
+      ],
 
       // ジョブが利用する各種リソースをコマンドライン引数として設定
       defaultArguments: {
         '--DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS': props.dynamoDb.runVisualizationsTable.tableName,
+        // 構造データの変換に利用する numpy などの分析用ライブラリを読み込む
+        'library-set': 'analytics',
       },
 
       // Job の実行で利用する DPU (Data Processing Unit) の最大数
@@ -63,7 +133,48 @@ export class AlphaFold3DmolVisualizerStack extends cdk.Stack {
     workflowOutputBucket.grantReadWrite(extractResultsJob);
     props.dynamoDb.runVisualizationsTable.grantReadWriteData(extractResultsJob);
 
-    // AlphaFold の実行結果を展開するタスク
+    // AlphaFold の実行結果のサイズを取得するタスク
+    const getResultsTask = new sfnTasks.LambdaInvoke(this, 'GetResultsTask', {
+      comment: "Get size of AlphaFold results as 'Results'.",
+      lambdaFunction: getResultsTaskFunction,
+      payload: sfn.TaskInput.fromObject({
+        RunId: sfn.JsonPath.stringAt('$.OmicsRun.RunId'),
+        OutputUri: sfn.JsonPath.stringAt('$.OmicsRun.OutputUri'),
+      }),
+      resultSelector: {
+        Bucket: sfn.JsonPath.stringAt('$.Payload.Bucket'),
+        Key: sfn.JsonPath.stringAt('$.Payload.Key'),
+        ETag: sfn.JsonPath.stringAt('$.Payload.ETag'),
+        Size: sfn.JsonPath.numberAt('$.Payload.Size'),
+      },
+      resultPath: '$.Results',
+    });
+
+    // 実行結果のサイズに応じて展開処理の実行環境を選択するタスク
+    const checkResultsSizeTask = new sfn.Choice(this, 'CheckResultsSizeTask', {
+      comment: 'Is AlphaFold results small enough to extract with Lambda?',
+    });
+
+    // AlphaFold の実行結果を Lambda 関数で展開するタスク
+    const extractResultsFunctionTask = new sfnTasks.LambdaInvoke(this, 'ExtractResultsFunctionTask', {
+      comment: 'Visualize small AlphaFold results with Lambda.',
+      lambdaFunction: extractResultsTaskFunction,
+      payload: sfn.TaskInput.fromObject({
+        AnalysisId: sfn.JsonPath.stringAt('$.AnalysisId'),
+        UserId: sfn.JsonPath.stringAt('$.UserId'),
+        RunId: sfn.JsonPath.stringAt('$.OmicsRun.RunId'),
+        OutputUri: sfn.JsonPath.stringAt('$.OmicsRun.OutputUri'),
+        VisualizerId: sfn.JsonPath.stringAt('$.Visualizer.VisualizerId'),
+      }),
+      resultSelector: {
+        Skipped: sfn.JsonPath.stringAt('$.Payload.Skipped'),
+        Uploaded: sfn.JsonPath.numberAt('$.Payload.Uploaded'),
+        Registered: sfn.JsonPath.numberAt('$.Payload.Registered'),
+      },
+      resultPath: '$.ExtractResult',
+    });
+
+    // AlphaFold の実行結果を Glue ジョブで展開するタスク
     const extractResultsTask = new sfnTasks.GlueStartJobRun(this, 'ExtractResultsTask', {
       comment: 'Visualize AlphaFold results.',
       glueJobName: extractResultsJob.jobName,
@@ -75,6 +186,7 @@ export class AlphaFold3DmolVisualizerStack extends cdk.Stack {
         '--output_uri': sfn.JsonPath.stringAt('$.OmicsRun.OutputUri'),
         '--visualizer_id': sfn.JsonPath.stringAt('$.Visualizer.VisualizerId'),
       }),
+      resultPath: '$.ExtractResult',
     });
 
     // ワークフローの前処理や後処理を実行する Step Functions ステートマシンの実行ロールを取得
@@ -84,7 +196,13 @@ export class AlphaFold3DmolVisualizerStack extends cdk.Stack {
     // 可視化を実行するための Step Functions ステートマシンを作成する
     const stateMachine = new sfn.StateMachine(this, 'StateMachine', {
       stateMachineName: `${stageName ?? ''}AlphaFold3DmolVisualizer`,
-      definition: extractResultsTask,
+      definition: getResultsTask
+        .next(checkResultsSizeTask
+          .when(sfn.Condition.numberLessThanEquals('$.Results.Size', lambdaMaxResultsSize),
+            extractResultsFunctionTask
+          )
+          .otherwise(extractResultsTask)
+        ),
       tracingEnabled: true,
     });
     stateMachine.grantStartExecution(workflowRunnerRole);
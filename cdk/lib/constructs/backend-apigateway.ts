@@ -81,6 +81,7 @@ export class ApiGateway extends Construct {
 
       defaultCorsPreflightOptions: {
         allowOrigins: [this.allowOrigin], // REST API への接続元 Origin に特別な制限を設けない (テスト用の設定)
+        allowHeaders: [...apigw.Cors.DEFAULT_HEADERS, 'Idempotency-Key'], // 解析の開始を冪等にするための冪等性キーを受け付ける
       },
 
       // REST API のデフォルト認証方法を Cognito 認証とする
@@ -180,6 +181,75 @@ export class ApiGateway extends Construct {
     visualizer.addMethod('GET', new apigw.LambdaIntegration(workflowVisualizersApiFunction));
   }
 
+  /**
+   * 同じワークフローの過去の実行からストレージ容量を推奨する API を作成する
+   * `POST /workflows/{workflowType}/{workflowId}/storage-recommendation`
+   * @param dynamoDb DynamoDB テーブルを作成するコンストラクト
+   */
+  addStorageRecommendationApi(dynamoDb: DynamoDb) {
+    // API を実装した Lambda 関数を作成する
+    const storageRecommendationApiFunction = new lambdaPython.PythonFunction(this, 'StorageRecommendationApiFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/ApiGateway/StorageRecommendationApi'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS: dynamoDb.runStatisticsTable.tableName,
+        CORS_ALLOW_ORIGIN: this.allowOrigin,
+      },
+
+      layers: [this.layer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    // 実行パラメーターに指定された S3 の入力ファイルのサイズを求める
+    storageRecommendationApiFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        's3:GetObject',
+        's3:ListBucket',
+      ],
+      resources: ['*'],
+    }));
+    dynamoDb.runStatisticsTable.grantReadData(storageRecommendationApiFunction);
+
+    // API Gateway にルートを登録する
+    const workflow = this.restApi.root.getResource('workflows')!.getResource('{workflowType}')!.getResource('{workflowId}')!;
+    const storageRecommendation = workflow.addResource('storage-recommendation');
+    storageRecommendation.addMethod('POST', new apigw.LambdaIntegration(storageRecommendationApiFunction));
+  }
+
+  /**
+   * 同じワークフローの過去の実行と比べて、実行時間が大きく変わったタスクを取得する API を作成する
+   * `GET /workflows/{workflowType}/{workflowId}/task-regressions`
+   * @param dynamoDb DynamoDB テーブルを作成するコンストラクト
+   */
+  addTaskRegressionsApi(dynamoDb: DynamoDb) {
+    // API を実装した Lambda 関数を作成する
+    const taskRegressionsApiFunction = new lambdaPython.PythonFunction(this, 'TaskRegressionsApiFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/ApiGateway/TaskRegressionsApi'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS: dynamoDb.runStatisticsTable.tableName,
+        CORS_ALLOW_ORIGIN: this.allowOrigin,
+      },
+
+      layers: [this.layer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    dynamoDb.runStatisticsTable.grantReadData(taskRegressionsApiFunction);
+
+    // API Gateway にルートを登録する
+    const workflow = this.restApi.root.getResource('workflows')!.getResource('{workflowType}')!.getResource('{workflowId}')!;
+    const taskRegressions = workflow.addResource('task-regressions');
+    taskRegressions.addMethod('GET', new apigw.LambdaIntegration(taskRegressionsApiFunction));
+  }
+
   /**
    * 分析を実行する API を作成する
    * `POST /analyses`
@@ -202,6 +272,9 @@ export class ApiGateway extends Construct {
         OMICS_OUTPUT_BUCKET_URL: s3BucketForOutput.s3UrlForObject(),
         STEPFUNCTIONS_STATE_MACHINE_ARN: workflowRunner.stateMachine.stateMachineArn,
         DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS: dynamoDb.workflowVisualizersTable.tableName,
+        DYNAMODB_TABLE_NAME_RUN_FINGERPRINTS: dynamoDb.runFingerprintsTable.tableName,
+        DYNAMODB_TABLE_NAME_ANALYSIS_IDEMPOTENCY: dynamoDb.analysisIdempotencyTable.tableName,
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS: dynamoDb.runStatisticsTable.tableName,
         STAGE_NAME: cdk.Stage.of(this)?.stageName ?? '',
         CORS_ALLOW_ORIGIN: this.allowOrigin,
       },
@@ -215,23 +288,132 @@ export class ApiGateway extends Construct {
       effect: iam.Effect.ALLOW,
       actions: [
         'omics:GetWorkflow',
+        // 再利用する実行が完了状態のまま残っているかを確認する
+        'omics:GetRun',
+        // 指定された実行グループが存在するかを、ワークフロー実行の開始前に確認する
+        'omics:GetRunGroup',
+      ],
+      resources: ['*'],
+    }));
+    // 実行パラメーターに指定された S3 の入力ファイルが存在するかを、ワークフロー実行の開始前に確認する
+    startAnalysisApiFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        's3:GetObject',
+        's3:ListBucket',
       ],
       resources: ['*'],
     }));
     workflowRunner.stateMachine.grantStartExecution(startAnalysisApiFunction);
     dynamoDb.workflowVisualizersTable.grantReadData(startAnalysisApiFunction);
+    dynamoDb.runFingerprintsTable.grantReadWriteData(startAnalysisApiFunction);
+    dynamoDb.analysisIdempotencyTable.grantReadWriteData(startAnalysisApiFunction);
+    dynamoDb.runStatisticsTable.grantReadData(startAnalysisApiFunction);
 
     // API Gateway にルートを登録する
     const analyses = this.restApi.root.addResource('analyses');
     analyses.addMethod('POST', new apigw.LambdaIntegration(startAnalysisApiFunction));
   }
 
+  /**
+   * 複数のサンプルの解析をまとめて開始する API を作成する
+   * `POST /analyses/batches`
+   * `GET /analyses/batches/{batchId}`
+   * @param s3BucketForOutput ワークフローの出力を格納する S3 バケット
+   * @param workflowRunner Step Functions ステートマシンを作成するコンストラクト
+   * @param dynamoDb DynamoDB テーブルを作成するコンストラクト
+   */
+  addAnalysisBatchesApi(s3BucketForOutput: s3.IBucket, omicsWorkflowRunRole: iam.IRole, workflowRunner: WorkflowRunner, dynamoDb: DynamoDb) {
+    // サンプルごとのステートマシンの実行を非同期に開始する Lambda 関数を作成する
+    // (Omics の StartRun の速度は、待ち行列の振り分け処理が制限する)
+    const analysisBatchSubmitterFunction = new lambdaPython.PythonFunction(this, 'AnalysisBatchSubmitterFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/Async/AnalysisBatchSubmitter'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        STEPFUNCTIONS_STATE_MACHINE_ARN: workflowRunner.stateMachine.stateMachineArn,
+        DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES: dynamoDb.analysisBatchesTable.tableName,
+      },
+
+      layers: [this.layer],
+
+      // 同じバッチを同時に処理しないよう、1 つずつ実行する
+      reservedConcurrentExecutions: 1,
+      timeout: cdk.Duration.minutes(15),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    workflowRunner.stateMachine.grantStartExecution(analysisBatchSubmitterFunction);
+    dynamoDb.analysisBatchesTable.grantReadWriteData(analysisBatchSubmitterFunction);
+    // 実行時間の上限に近づいたら、自身を呼び出し直して残りのサンプルを開始する
+    // 関数の ARN を参照するポリシーを関数のデフォルトポリシーに含めると循環参照になるため、作成後に別のポリシーとして割り当てる
+    const analysisBatchSubmitterSelfInvokePolicy = new iam.Policy(this, 'AnalysisBatchSubmitterSelfInvokePolicy', {
+      statements: [
+        new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: [
+            'lambda:InvokeFunction',
+          ],
+          resources: [
+            analysisBatchSubmitterFunction.functionArn,
+          ],
+        }),
+      ],
+    });
+    analysisBatchSubmitterFunction.role?.attachInlinePolicy(analysisBatchSubmitterSelfInvokePolicy);
+
+    // API を実装した Lambda 関数を作成する
+    const analysisBatchesApiFunction = new lambdaPython.PythonFunction(this, 'AnalysisBatchesApiFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/ApiGateway/AnalysisBatchesApi'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        OMICS_WORKFLOW_RUN_ROLE_ARN: omicsWorkflowRunRole.roleArn,
+        OMICS_OUTPUT_BUCKET_URL: s3BucketForOutput.s3UrlForObject(),
+        DYNAMODB_TABLE_NAME_WORKFLOW_VISUALIZERS: dynamoDb.workflowVisualizersTable.tableName,
+        DYNAMODB_TABLE_NAME_ANALYSIS_BATCHES: dynamoDb.analysisBatchesTable.tableName,
+        ANALYSIS_BATCH_SUBMITTER_FUNCTION_NAME: analysisBatchSubmitterFunction.functionName,
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS: dynamoDb.runStatisticsTable.tableName,
+        CORS_ALLOW_ORIGIN: this.allowOrigin,
+      },
+
+      layers: [this.layer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    analysisBatchesApiFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        'omics:GetWorkflow',
+        // 指定された実行グループが存在するかを、サンプルの実行を開始する前に確認する
+        'omics:GetRunGroup',
+      ],
+      resources: ['*'],
+    }));
+    // バッチの進捗を返すため、ステートマシンの実行状態を取得する権限を追加
+    workflowRunner.stateMachine.grantRead(analysisBatchesApiFunction);
+    dynamoDb.workflowVisualizersTable.grantReadData(analysisBatchesApiFunction);
+    dynamoDb.analysisBatchesTable.grantReadWriteData(analysisBatchesApiFunction);
+    dynamoDb.runStatisticsTable.grantReadData(analysisBatchesApiFunction);
+    analysisBatchSubmitterFunction.grantInvoke(analysisBatchesApiFunction);
+
+    // API Gateway にルートを登録する
+    const batches = this.restApi.root.resourceForPath('analyses').addResource('batches');
+    batches.addMethod('POST', new apigw.LambdaIntegration(analysisBatchesApiFunction));
+
+    const batch = batches.addResource('{batchId}');
+    batch.addMethod('GET', new apigw.LambdaIntegration(analysisBatchesApiFunction));
+  }
+
   /**
    * ワークフローの実行に関する情報を取得する API を作成する
    * `GET /runs`
    * `GET /runs/{runId}`
+   * @param dynamoDb DynamoDB テーブルを作成するコンストラクト
   */
-  addRunsApi() {
+  addRunsApi(dynamoDb: DynamoDb) {
     // API を実装した Lambda 関数を作成する
     const runsApiFunction = new lambdaPython.PythonFunction(this, 'RunsApiFunction', {
       entry: path.resolve(__dirname, '../../../backend/lambda/functions/ApiGateway/RunsApi'),
@@ -242,6 +424,8 @@ export class ApiGateway extends Construct {
       // ephemeralStorageSize: cdk.Size.gibibytes(1),
 
       environment: {
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS: dynamoDb.runStatisticsTable.tableName,
+        DYNAMODB_TABLE_NAME_RUN_CACHE: dynamoDb.runCacheTable.tableName,
         CORS_ALLOW_ORIGIN: this.allowOrigin,
       },
 
@@ -255,9 +439,15 @@ export class ApiGateway extends Construct {
       actions: [
         'omics:ListRuns',
         'omics:GetRun',
+        // 実行中のタスクの状況から進捗を見積もり、一覧の実行ごとにタスクの数を数える
+        'omics:ListRunTasks',
       ],
       resources: ['*'],
     }));
+    // 同じワークフローの過去の実行のタスクの記録から進捗を見積もる
+    dynamoDb.runStatisticsTable.grantReadData(runsApiFunction);
+    // 終了した実行のタスクの数をキャッシュする
+    dynamoDb.runCacheTable.grantReadWriteData(runsApiFunction);
 
     // API Gateway にルートを登録する
     const runs = this.restApi.root.addResource('runs');
@@ -270,9 +460,10 @@ export class ApiGateway extends Construct {
   /**
    * ワークフロー実行のタスクに関する情報を取得する API を作成する
    * `GET /runs/{runId}/tasks`
+   * `GET /runs/{runId}/tasks?since={cursor}`
    * `GET /runs/{runId}/tasks/{taskId}`
    */
-  addRunTasksApi() {
+  addRunTasksApi(dynamoDb: DynamoDb) {
     // API を実装した Lambda 関数を作成する
     const runTasksApiFunction = new lambdaPython.PythonFunction(this, 'RunTasksApiFunction', {
       entry: path.resolve(__dirname, '../../../backend/lambda/functions/ApiGateway/RunTasksApi'),
@@ -284,6 +475,7 @@ export class ApiGateway extends Construct {
 
       environment: {
         CORS_ALLOW_ORIGIN: this.allowOrigin,
+        DYNAMODB_TABLE_NAME_RUN_TASK_STATES: dynamoDb.runTaskStatesTable.tableName,
       },
 
       layers: [this.layer],
@@ -294,11 +486,13 @@ export class ApiGateway extends Construct {
     runTasksApiFunction.addToRolePolicy(new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
       actions: [
+        'omics:GetRun',
         'omics:ListRunTasks',
         'omics:GetRunTask',
       ],
       resources: ['*'],
     }));
+    dynamoDb.runTaskStatesTable.grantReadWriteData(runTasksApiFunction);
 
     // API Gateway にルートを登録する
     const run = this.restApi.root.getResource('runs')!.getResource('{runId}')!;
@@ -354,6 +548,115 @@ export class ApiGateway extends Construct {
     taskLog.addMethod('GET', new apigw.LambdaIntegration(taskLogApiFunction));
   }
 
+  /**
+   * ワークフロー実行のリソースの使用量と費用の見積もりを取得する API を作成する
+   * `GET /runs/{runId}/accounting`
+   *
+   * @param dynamoDb 集計結果をキャッシュする RunCache テーブルを含む {@link DynamoDb} コンストラクト
+   */
+  addRunAccountingApi(dynamoDb: DynamoDb) {
+    // API を実装した Lambda 関数を作成する
+    const runAccountingApiFunction = new lambdaPython.PythonFunction(this, 'RunAccountingApiFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/ApiGateway/RunAccountingApi'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      // memorySize: 1024,
+      // ephemeralStorageSize: cdk.Size.gibibytes(1),
+
+      environment: {
+        CORS_ALLOW_ORIGIN: this.allowOrigin,
+        DYNAMODB_TABLE_NAME_RUN_CACHE: dynamoDb.runCacheTable.tableName,
+      },
+
+      layers: [this.layer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    runAccountingApiFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        'omics:GetRun',
+        'omics:ListRunTasks',
+      ],
+      resources: ['*'],
+    }));
+    dynamoDb.runCacheTable.grantReadWriteData(runAccountingApiFunction);
+
+    // API Gateway にルートを登録する
+    const run = this.restApi.root.getResource('runs')!.getResource('{runId}')!;
+    const accounting = run.addResource('accounting');
+    accounting.addMethod('GET', new apigw.LambdaIntegration(runAccountingApiFunction));
+  }
+
+  /**
+   * ワークフロー実行のタスクのログから取り出した、ツールの処理量の指標を取得する API を作成する
+   * `GET /runs/{runId}/task-log-metrics`
+   *
+   * @param dynamoDb 指標を保存する RunCache テーブルを含む {@link DynamoDb} コンストラクト
+   */
+  addTaskLogMetricsApi(dynamoDb: DynamoDb) {
+    // API を実装した Lambda 関数を作成する
+    const taskLogMetricsApiFunction = new lambdaPython.PythonFunction(this, 'TaskLogMetricsApiFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/ApiGateway/TaskLogMetricsApi'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      // memorySize: 1024,
+      // ephemeralStorageSize: cdk.Size.gibibytes(1),
+
+      environment: {
+        CORS_ALLOW_ORIGIN: this.allowOrigin,
+        DYNAMODB_TABLE_NAME_RUN_CACHE: dynamoDb.runCacheTable.tableName,
+      },
+
+      layers: [this.layer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    dynamoDb.runCacheTable.grantReadData(taskLogMetricsApiFunction);
+
+    // API Gateway にルートを登録する
+    const run = this.restApi.root.getResource('runs')!.getResource('{runId}')!;
+    const taskLogMetrics = run.addResource('task-log-metrics');
+    taskLogMetrics.addMethod('GET', new apigw.LambdaIntegration(taskLogMetricsApiFunction));
+  }
+
+  /**
+   * ユーザーごと・ワークフローごとの月単位のリソースの使用量を取得する API を作成する
+   * `GET /usage`
+   *
+   * @param dynamoDb 使用量の集計値を保存する UsageRollups テーブルを含む {@link DynamoDb} コンストラクト
+   */
+  addUsageApi(dynamoDb: DynamoDb) {
+    // API を実装した Lambda 関数を作成する
+    const usageApiFunction = new lambdaPython.PythonFunction(this, 'UsageApiFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/ApiGateway/UsageApi'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      // memorySize: 1024,
+      // ephemeralStorageSize: cdk.Size.gibibytes(1),
+
+      environment: {
+        CORS_ALLOW_ORIGIN: this.allowOrigin,
+        DYNAMODB_TABLE_NAME_USAGE_ROLLUPS: dynamoDb.usageRollupsTable.tableName,
+      },
+
+      layers: [this.layer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    dynamoDb.usageRollupsTable.grantReadData(usageApiFunction);
+
+    // API Gateway にルートを登録する
+    const usage = this.restApi.root.addResource('usage');
+    usage.addMethod('GET', new apigw.LambdaIntegration(usageApiFunction));
+  }
+
   /**
    * ワークフローの出力ファイルを取得する API を作成する
    * `GET /runs/{runId}/outputs`
@@ -13,6 +13,24 @@ export class DynamoDb extends Construct {
   /** 可視化の結果を保存するための DynamoDB テーブル */
   readonly workflowVisualizersTable: dynamodb.Table;
   readonly runVisualizationsTable: dynamodb.Table;
+  /** ワークフロー実行の完了を待つ Step Functions のタスクトークンを保存するための DynamoDB テーブル */
+  readonly runTaskTokensTable: dynamodb.Table;
+  /** 複数のサンプルの解析をまとめて開始するバッチを保存するための DynamoDB テーブル */
+  readonly analysisBatchesTable: dynamodb.Table;
+  /** 実行グループの空きを待つ解析の待ち行列を保存するための DynamoDB テーブル */
+  readonly analysisQueueTable: dynamodb.Table;
+  /** 完了したワークフロー実行を、結果を再利用するための指紋と共に保存する DynamoDB テーブル */
+  readonly runFingerprintsTable: dynamodb.Table;
+  /** 解析の開始リクエストの結果を、冪等性キーごとに保存する DynamoDB テーブル */
+  readonly analysisIdempotencyTable: dynamodb.Table;
+  /** 終了したワークフロー実行の統計情報を、ワークフローごとに保存する DynamoDB テーブル */
+  readonly runStatisticsTable: dynamodb.Table;
+  /** ワークフロー実行ごとに求めた集計結果をキャッシュする DynamoDB テーブル */
+  readonly runCacheTable: dynamodb.Table;
+  /** ユーザーごと・ワークフローごとのリソースの使用量を月単位で集計する DynamoDB テーブル */
+  readonly usageRollupsTable: dynamodb.Table;
+  /** ワークフロー実行のタスクの状態を、変更の順に取得できるよう記録する DynamoDB テーブル */
+  readonly runTaskStatesTable: dynamodb.Table;
 
   /**
    * {@link DynamoDb} コンストラクトを作成する
@@ -52,5 +70,159 @@ export class DynamoDb extends Construct {
       },
       removalPolicy: cdk.RemovalPolicy.DESTROY,
     });
+
+    // ワークフロー実行の完了を待つタスクトークンを管理する RunTaskTokens テーブルを作成する
+    this.runTaskTokensTable = new dynamodb.Table(this, 'RunTaskTokensTable', {
+      tableName: `${stageName ?? ''}OmicsRunTaskTokens`,
+      partitionKey: {
+        name: 'runId',
+        type: dynamodb.AttributeType.STRING,
+      },
+      // 再開されなかったタスクトークンは一定期間後に自動削除する
+      timeToLiveAttribute: 'expiresAt',
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // 複数のサンプルの解析をまとめて開始するバッチを管理する AnalysisBatches テーブルを作成する
+    this.analysisBatchesTable = new dynamodb.Table(this, 'AnalysisBatchesTable', {
+      tableName: `${stageName ?? ''}OmicsAnalysisBatches`,
+      partitionKey: {
+        name: 'batchId',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'itemId',
+        type: dynamodb.AttributeType.STRING,
+      },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // 実行グループの空きを待つ解析を管理する AnalysisQueue テーブルを作成する
+    this.analysisQueueTable = new dynamodb.Table(this, 'AnalysisQueueTable', {
+      tableName: `${stageName ?? ''}OmicsAnalysisQueue`,
+      partitionKey: {
+        name: 'runGroupKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'analysisId',
+        type: dynamodb.AttributeType.STRING,
+      },
+      // 削除されなかった再開済みの項目は一定期間後に自動削除する
+      timeToLiveAttribute: 'expiresAt',
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // 完了したワークフロー実行を指紋と共に管理する RunFingerprints テーブルを作成する
+    this.runFingerprintsTable = new dynamodb.Table(this, 'RunFingerprintsTable', {
+      tableName: `${stageName ?? ''}OmicsRunFingerprints`,
+      partitionKey: {
+        name: 'fingerprint',
+        type: dynamodb.AttributeType.STRING,
+      },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // 解析の開始リクエストの結果を冪等性キーごとに管理する AnalysisIdempotency テーブルを作成する
+    this.analysisIdempotencyTable = new dynamodb.Table(this, 'AnalysisIdempotencyTable', {
+      tableName: `${stageName ?? ''}OmicsAnalysisIdempotency`,
+      partitionKey: {
+        name: 'idempotencyKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      // 再送を受け付ける期間を過ぎた項目は自動削除する
+      timeToLiveAttribute: 'expiresAt',
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // 終了したワークフロー実行の統計情報をワークフローごとに管理する RunStatistics テーブルを作成する
+    this.runStatisticsTable = new dynamodb.Table(this, 'RunStatisticsTable', {
+      tableName: `${stageName ?? ''}OmicsRunStatistics`,
+      partitionKey: {
+        name: 'workflowKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'runKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // ワークフロー実行ごとの集計結果をキャッシュする RunCache テーブルを作成する
+    this.runCacheTable = new dynamodb.Table(this, 'RunCacheTable', {
+      tableName: `${stageName ?? ''}OmicsRunCache`,
+      partitionKey: {
+        name: 'runId',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'cacheKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      // 保持する期間を過ぎた項目は自動削除する
+      timeToLiveAttribute: 'expiresAt',
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // ユーザーごと・ワークフローごとのリソースの使用量を月単位で管理する UsageRollups テーブルを作成する
+    this.usageRollupsTable = new dynamodb.Table(this, 'UsageRollupsTable', {
+      tableName: `${stageName ?? ''}OmicsUsageRollups`,
+      partitionKey: {
+        name: 'rollupKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'period',
+        type: dynamodb.AttributeType.STRING,
+      },
+      // 二重加算を防ぐための記録済みマーカーは、保持する期間を過ぎたら自動削除する
+      timeToLiveAttribute: 'expiresAt',
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+    // 月ごとに全てのユーザーや全てのワークフローの集計値を一覧するためのインデックスを作成する
+    this.usageRollupsTable.addGlobalSecondaryIndex({
+      indexName: 'ScopePeriodIndex',
+      partitionKey: {
+        name: 'scopePeriod',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'rollupKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+    });
+
+    // ワークフロー実行のタスクの状態を記録する RunTaskStates テーブルを作成する
+    this.runTaskStatesTable = new dynamodb.Table(this, 'RunTaskStatesTable', {
+      tableName: `${stageName ?? ''}OmicsRunTaskStates`,
+      partitionKey: {
+        name: 'runId',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'taskId',
+        type: dynamodb.AttributeType.STRING,
+      },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+    // 前回の取得以降に変わったタスクを、変わった順に取得するためのインデックスを作成する
+    // 直前に保存したタスクを強い整合性で読めるよう、ローカルセカンダリインデックスにする
+    this.runTaskStatesTable.addLocalSecondaryIndex({
+      indexName: 'SequenceIndex',
+      sortKey: {
+        name: 'sequence',
+        type: dynamodb.AttributeType.NUMBER,
+      },
+    });
   }
 }
@@ -5,13 +5,40 @@ import * as sfnTasks from "aws-cdk-lib/aws-stepfunctions-tasks";
 import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as lambdaPython from '@aws-cdk/aws-lambda-python-alpha';
 import * as iam from 'aws-cdk-lib/aws-iam';
+import * as events from 'aws-cdk-lib/aws-events';
+import * as eventsTargets from 'aws-cdk-lib/aws-events-targets';
+import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 
 import * as path from 'path';
 
+import { DynamoDb } from "./backend-dynamodb";
+
 /** {@link WorkflowRunner} コンストラクトのパラメーター */
 export interface WorkflowRunnerProps {
   /** Lambda 関数が共通で利用する Lambda レイヤー */
   commonLayer: lambda.ILayerVersion;
+
+  /** ワークフロー実行の完了を待つタスクトークンを保存するための DynamoDB テーブル */
+  dynamoDb: DynamoDb;
+
+  /**
+   * 実行状態の変更イベントを取りこぼした場合に備えて、ワークフロー実行の状態を確認する間隔の上限
+   * 実際の間隔は実行状態、経過時間、同じワークフローの過去の実行時間から `OmicsGetRunStatusTask` が求める
+   * (default: 1 時間)
+   */
+  runStatusReconciliationInterval?: cdk.Duration;
+
+  /**
+   * 完了を待っている全てのワークフロー実行の状態を一括で確認する間隔
+   * (default: 1 分)
+   */
+  runStatusPollingInterval?: cdk.Duration;
+
+  /**
+   * 実行グループを指定しない解析を同時に実行できる数
+   * (default: 0 (制限しない))
+   */
+  defaultMaxRuns?: number;
 }
 
 /**
@@ -30,6 +57,53 @@ export class WorkflowRunner extends Construct {
   constructor(scope: Construct, id: string, props: WorkflowRunnerProps) {
     super(scope, id);
 
+    // ステートマシンの名前
+    const stageName = cdk.Stage.of(this)?.stageName;
+    const stateMachineName = `${stageName ?? ''}OmicsWorkflowRunner`;
+
+    // 待機中のステートマシンの実行を再開する権限
+    // ステートマシンから呼び出す Lambda 関数にも付与するため、循環参照にならないようステートマシンの名前から ARN を求める
+    const workflowRunnerTaskResponsePolicy = new iam.Policy(this, 'WorkflowRunnerTaskResponsePolicy', {
+      statements: [
+        new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: [
+            'states:SendTaskSuccess',
+            'states:SendTaskFailure',
+            'states:SendTaskHeartbeat',
+          ],
+          resources: [
+            cdk.Stack.of(this).formatArn({
+              service: 'states',
+              resource: 'stateMachine',
+              resourceName: stateMachineName,
+              arnFormat: cdk.ArnFormat.COLON_RESOURCE_NAME,
+            }),
+          ],
+        }),
+      ],
+    });
+
+    // ステートマシンの実行状態を取得する権限
+    const workflowRunnerDescribeExecutionPolicy = new iam.Policy(this, 'WorkflowRunnerDescribeExecutionPolicy', {
+      statements: [
+        new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: [
+            'states:DescribeExecution',
+          ],
+          resources: [
+            cdk.Stack.of(this).formatArn({
+              service: 'states',
+              resource: 'execution',
+              resourceName: `${stateMachineName}:*`,
+              arnFormat: cdk.ArnFormat.COLON_RESOURCE_NAME,
+            }),
+          ],
+        }),
+      ],
+    });
+
     // Omics のワークフローを実行する Step Functions タスクを実装した Lambda 関数を作成する
     const omicsStartRunTaskFunction = new lambdaPython.PythonFunction(this, 'OmicsStartRunTaskFunction', {
       entry: path.resolve(__dirname, '../../../backend/lambda/functions/StepFunctions/StartRunTask'),
@@ -98,11 +172,13 @@ export class WorkflowRunner extends Construct {
       // ephemeralStorageSize: cdk.Size.gibibytes(1),
 
       environment: {
+        MAX_WAIT_SECONDS: (props.runStatusReconciliationInterval ?? cdk.Duration.hours(1)).toSeconds().toString(),
       },
 
       layers: [props.commonLayer],
 
-      timeout: cdk.Duration.seconds(30),
+      // 過去の実行時間を求めるために完了済みの実行を一覧する
+      timeout: cdk.Duration.seconds(60),
       tracing: lambda.Tracing.ACTIVE
     });
 
@@ -120,6 +196,266 @@ export class WorkflowRunner extends Construct {
     });
     omicsGetRunStatusTaskFunction.role?.attachInlinePolicy(omicsGetRunPolicy);
 
+    // 過去の実行時間を求めるため、Omics ワークフローの実行を一覧する権限を `OmicsGetRunStatusTaskFunction` 関数に追加
+    const omicsListRunsPolicy = new iam.Policy(this, 'OmicsListRunsPolicy', {
+      statements: [
+        new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: [
+            'omics:ListRuns',
+          ],
+          resources: ['*'],
+        }),
+      ],
+    });
+    omicsGetRunStatusTaskFunction.role?.attachInlinePolicy(omicsListRunsPolicy);
+
+    // Omics ワークフロー実行の完了を待つタスクトークンを登録する Step Functions タスクを実装した Lambda 関数を作成する
+    const registerRunTaskTokenTaskFunction = new lambdaPython.PythonFunction(this, 'RegisterRunTaskTokenTaskFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/StepFunctions/RegisterRunTaskTokenTask'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS: props.dynamoDb.runTaskTokensTable.tableName,
+      },
+
+      layers: [props.commonLayer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    props.dynamoDb.runTaskTokensTable.grantReadWriteData(registerRunTaskTokenTaskFunction);
+    registerRunTaskTokenTaskFunction.role?.attachInlinePolicy(workflowRunnerTaskResponsePolicy);
+    // 登録時に実行状態を確認するため、Omics ワークフローの情報を取得する権限を追加
+    registerRunTaskTokenTaskFunction.role?.attachInlinePolicy(omicsGetRunPolicy);
+
+    // Omics ワークフローの実行状態の変更イベントを受け取り、ステートマシンの実行を再開する Lambda 関数を作成する
+    const omicsRunStatusChangeHandlerFunction = new lambdaPython.PythonFunction(this, 'OmicsRunStatusChangeHandlerFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/EventBridge/OmicsRunStatusChangeHandler'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS: props.dynamoDb.runTaskTokensTable.tableName,
+      },
+
+      layers: [props.commonLayer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    props.dynamoDb.runTaskTokensTable.grantReadWriteData(omicsRunStatusChangeHandlerFunction);
+    omicsRunStatusChangeHandlerFunction.role?.attachInlinePolicy(workflowRunnerTaskResponsePolicy);
+
+    // Omics ワークフロー実行が終了したときのイベントで `OmicsRunStatusChangeHandlerFunction` 関数を呼び出す
+    new events.Rule(this, 'OmicsRunStatusChangeRule', {
+      description: 'Resume workflow runner when Omics workflow run is finished.',
+      eventPattern: {
+        source: ['aws.omics'],
+        detailType: ['Run Status Change'],
+        detail: {
+          status: ['COMPLETED', 'DELETED', 'CANCELLED', 'FAILED'],
+        },
+      },
+      targets: [
+        new eventsTargets.LambdaFunction(omicsRunStatusChangeHandlerFunction, {
+          retryAttempts: 8,
+        }),
+      ],
+    });
+
+    // 完了を待っている全てのワークフロー実行の状態を一括で確認し、終了した実行のステートマシンを再開する Lambda 関数を作成する
+    const omicsRunStatusPollerFunction = new lambdaPython.PythonFunction(this, 'OmicsRunStatusPollerFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/EventBridge/OmicsRunStatusPoller'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_RUN_TASK_TOKENS: props.dynamoDb.runTaskTokensTable.tableName,
+      },
+
+      layers: [props.commonLayer],
+
+      timeout: cdk.Duration.seconds(60),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    props.dynamoDb.runTaskTokensTable.grantReadWriteData(omicsRunStatusPollerFunction);
+    omicsRunStatusPollerFunction.role?.attachInlinePolicy(workflowRunnerTaskResponsePolicy);
+    omicsRunStatusPollerFunction.role?.attachInlinePolicy(omicsGetRunPolicy);
+    omicsRunStatusPollerFunction.role?.attachInlinePolicy(omicsListRunsPolicy);
+
+    // 一定間隔で `OmicsRunStatusPollerFunction` 関数を呼び出す
+    new events.Rule(this, 'OmicsRunStatusPollingRule', {
+      description: 'Poll status of all Omics workflow runs waited by workflow runner.',
+      schedule: events.Schedule.rate(props.runStatusPollingInterval ?? cdk.Duration.minutes(1)),
+      targets: [
+        new eventsTargets.LambdaFunction(omicsRunStatusPollerFunction),
+      ],
+    });
+
+    // 待ち行列に登録された解析を、実行グループの空きに応じて再開する Lambda 関数を作成する
+    const analysisQueueDispatcherFunction = new lambdaPython.PythonFunction(this, 'AnalysisQueueDispatcherFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/EventBridge/AnalysisQueueDispatcher'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE: props.dynamoDb.analysisQueueTable.tableName,
+        DEFAULT_MAX_RUNS: (props.defaultMaxRuns ?? 0).toString(),
+        // Omics の StartRun のクォータに合わせて、1 秒あたりに再開する解析の数を制限する
+        START_RATE: '1',
+        START_BURST: '5',
+      },
+
+      layers: [props.commonLayer],
+
+      // 実行グループの空きを数え間違えないよう、振り分け処理は 1 つずつ実行する
+      reservedConcurrentExecutions: 1,
+      timeout: cdk.Duration.seconds(60),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    props.dynamoDb.analysisQueueTable.grantReadWriteData(analysisQueueDispatcherFunction);
+    analysisQueueDispatcherFunction.role?.attachInlinePolicy(workflowRunnerTaskResponsePolicy);
+    // 再開済みの解析のステートマシンの実行が続いているかを確認する
+    analysisQueueDispatcherFunction.role?.attachInlinePolicy(workflowRunnerDescribeExecutionPolicy);
+    analysisQueueDispatcherFunction.role?.attachInlinePolicy(omicsListRunsPolicy);
+    analysisQueueDispatcherFunction.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: [
+        'omics:GetRunGroup',
+        // 実行グループを指定しない解析の数から、実行グループに属する実行を除く
+        'omics:ListRunGroups',
+        // 実行グループの vCPU 数と GPU 数の使用量を数える
+        'omics:ListRunTasks',
+      ],
+      resources: ['*'],
+    }));
+
+    // 取りこぼしやクォータ超過に備えて、一定間隔で `AnalysisQueueDispatcherFunction` 関数を呼び出す
+    new events.Rule(this, 'AnalysisQueueDispatchRule', {
+      description: 'Dispatch queued analyses when run group capacity is available.',
+      schedule: events.Schedule.rate(cdk.Duration.minutes(1)),
+      targets: [
+        new eventsTargets.LambdaFunction(analysisQueueDispatcherFunction),
+      ],
+    });
+
+    // 解析を待ち行列に登録する Step Functions タスクを実装した Lambda 関数を作成する
+    const enqueueAnalysisTaskFunction = new lambdaPython.PythonFunction(this, 'EnqueueAnalysisTaskFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/StepFunctions/EnqueueAnalysisTask'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE: props.dynamoDb.analysisQueueTable.tableName,
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS: props.dynamoDb.runStatisticsTable.tableName,
+        ANALYSIS_QUEUE_DISPATCHER_FUNCTION_NAME: analysisQueueDispatcherFunction.functionName,
+      },
+
+      layers: [props.commonLayer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    props.dynamoDb.analysisQueueTable.grantReadWriteData(enqueueAnalysisTaskFunction);
+    // 同じワークフローの過去の実行から、同時に使用する vCPU 数と GPU 数を見積もる
+    props.dynamoDb.runStatisticsTable.grantReadData(enqueueAnalysisTaskFunction);
+    analysisQueueDispatcherFunction.grantInvoke(enqueueAnalysisTaskFunction);
+
+    // ワークフロー実行が終了した解析を待ち行列から削除する Step Functions タスクを実装した Lambda 関数を作成する
+    const releaseAnalysisTaskFunction = new lambdaPython.PythonFunction(this, 'ReleaseAnalysisTaskFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/StepFunctions/ReleaseAnalysisTask'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_ANALYSIS_QUEUE: props.dynamoDb.analysisQueueTable.tableName,
+        ANALYSIS_QUEUE_DISPATCHER_FUNCTION_NAME: analysisQueueDispatcherFunction.functionName,
+      },
+
+      layers: [props.commonLayer],
+
+      timeout: cdk.Duration.seconds(30),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    props.dynamoDb.analysisQueueTable.grantReadWriteData(releaseAnalysisTaskFunction);
+    analysisQueueDispatcherFunction.grantInvoke(releaseAnalysisTaskFunction);
+
+    // 終了したワークフロー実行の統計情報を記録する Step Functions タスクを実装した Lambda 関数を作成する
+    const recordRunStatisticsTaskFunction = new lambdaPython.PythonFunction(this, 'RecordRunStatisticsTaskFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/StepFunctions/RecordRunStatisticsTask'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS: props.dynamoDb.runStatisticsTable.tableName,
+        DYNAMODB_TABLE_NAME_RUN_CACHE: props.dynamoDb.runCacheTable.tableName,
+        DYNAMODB_TABLE_NAME_USAGE_ROLLUPS: props.dynamoDb.usageRollupsTable.tableName,
+      },
+
+      layers: [props.commonLayer],
+
+      // 入力ファイルと出力ファイルのサイズを求めるために S3 のオブジェクトを一覧する
+      timeout: cdk.Duration.minutes(5),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    props.dynamoDb.runStatisticsTable.grantReadWriteData(recordRunStatisticsTaskFunction);
+    props.dynamoDb.runCacheTable.grantReadWriteData(recordRunStatisticsTaskFunction);
+    props.dynamoDb.usageRollupsTable.grantReadWriteData(recordRunStatisticsTaskFunction);
+
+    // ワークフロー実行の情報・タスク・入出力ファイルのサイズ・マニフェストログを取得する権限を `RecordRunStatisticsTaskFunction` 関数に追加
+    const recordRunStatisticsPolicy = new iam.Policy(this, 'RecordRunStatisticsPolicy', {
+      statements: [
+        new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: [
+            'omics:GetRun',
+            'omics:ListRunTasks',
+            's3:GetObject',
+            's3:ListBucket',
+            'logs:DescribeLogStreams',
+            'logs:GetLogEvents',
+          ],
+          resources: ['*'],
+        }),
+      ],
+    });
+    recordRunStatisticsTaskFunction.role?.attachInlinePolicy(recordRunStatisticsPolicy);
+
+    // 終了したワークフロー実行のタスクのログから、ツールの処理量の指標を取り出す Step Functions タスクを実装した Lambda 関数を作成する
+    const mineTaskLogsTaskFunction = new lambdaPython.PythonFunction(this, 'MineTaskLogsTaskFunction', {
+      entry: path.resolve(__dirname, '../../../backend/lambda/functions/StepFunctions/MineTaskLogsTask'),
+      runtime: lambda.Runtime.PYTHON_3_9,
+      architecture: lambda.Architecture.X86_64,
+
+      environment: {
+        DYNAMODB_TABLE_NAME_RUN_CACHE: props.dynamoDb.runCacheTable.tableName,
+      },
+
+      layers: [props.commonLayer],
+
+      // タスクの多いワークフロー実行では全てのタスクのログを読むのに時間がかかるため、読み切れなければステートマシンで繰り返し呼び出す
+      timeout: cdk.Duration.minutes(15),
+      tracing: lambda.Tracing.ACTIVE
+    });
+    props.dynamoDb.runCacheTable.grantReadWriteData(mineTaskLogsTaskFunction);
+
+    // ワークフロー実行のタスクとタスクのログを取得する権限を `MineTaskLogsTaskFunction` 関数に追加
+    const mineTaskLogsPolicy = new iam.Policy(this, 'MineTaskLogsPolicy', {
+      statements: [
+        new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: [
+            'omics:ListRunTasks',
+            'logs:GetLogEvents',
+          ],
+          resources: ['*'],
+        }),
+      ],
+    });
+    mineTaskLogsTaskFunction.role?.attachInlinePolicy(mineTaskLogsPolicy);
+
     // ワークフロー完了時のメール通知を行う Step Functions タスクを実装した Lambda 関数を作成する
     const notificationTaskFunction = new lambdaPython.PythonFunction(this, 'NotificationTaskFunction', {
       entry: path.resolve(__dirname, '../../../backend/lambda/functions/StepFunctions/NotificationTask'),
@@ -130,6 +466,7 @@ export class WorkflowRunner extends Construct {
       // ephemeralStorageSize: cdk.Size.gibibytes(1),
 
       environment: {
+        DYNAMODB_TABLE_NAME_RUN_STATISTICS: props.dynamoDb.runStatisticsTable.tableName,
       },
 
       layers: [props.commonLayer],
@@ -137,6 +474,8 @@ export class WorkflowRunner extends Construct {
       timeout: cdk.Duration.seconds(30),
       tracing: lambda.Tracing.ACTIVE
     });
+    // 実行時間が大きく変わったタスクを通知するために、同じワークフローの過去の実行の統計情報を読み込む
+    props.dynamoDb.runStatisticsTable.grantReadData(notificationTaskFunction);
 
     // SES でメールを送信する権限を `NotificationTaskFunction` 関数に追加
     const sendEmailPolicy = new iam.Policy(this, 'SendEmailPolicy', {
@@ -165,6 +504,31 @@ export class WorkflowRunner extends Construct {
       comment: "Is 'OmicsRun' present in the input?",
     });
 
+    // Omics のワークフロー実行の詳細を `OmicsRun` として出力するための resultSelector
+    const omicsRunDetailsSelector = {
+          RunId: sfn.JsonPath.stringAt('$.Payload.RunId'),
+          RoleArn: sfn.JsonPath.stringAt('$.Payload.RoleArn'),
+          Status: sfn.JsonPath.stringAt('$.Payload.Status'),
+          StatusMessage: sfn.JsonPath.stringAt('$.Payload.StatusMessage'),
+          IsFinished: sfn.JsonPath.stringAt('$.Payload.IsFinished'),
+          IsError: sfn.JsonPath.stringAt('$.Payload.IsError'),
+          WorkflowType: sfn.JsonPath.stringAt('$.Payload.WorkflowType'),
+          WorkflowId: sfn.JsonPath.stringAt('$.Payload.WorkflowId'),
+          OutputUri: sfn.JsonPath.stringAt('$.Payload.OutputUri'),
+          Parameters: sfn.JsonPath.objectAt('$.Payload.Parameters'),
+          Name: sfn.JsonPath.stringAt('$.Payload.Name'),
+          Priority: sfn.JsonPath.stringAt('$.Payload.Priority'),
+          StorageCapacity: sfn.JsonPath.stringAt('$.Payload.StorageCapacity'),
+          Accelerators: sfn.JsonPath.stringAt('$.Payload.Accelerators'),
+          RunGroupId: sfn.JsonPath.stringAt('$.Payload.RunGroupId'),
+          LogLevel: sfn.JsonPath.stringAt('$.Payload.LogLevel'),
+          Tags: sfn.JsonPath.objectAt('$.Payload.Tags'),
+          StartedBy: sfn.JsonPath.stringAt('$.Payload.StartedBy'),
+          CreationTime: sfn.JsonPath.stringAt('$.Payload.CreationTime'),
+          StartTime: sfn.JsonPath.stringAt('$.Payload.StartTime'),
+          StopTime: sfn.JsonPath.stringAt('$.Payload.StopTime'),
+    };
+
     // Omics のワークフロー実行の詳細情報を取得するタスク
     const omicsGetRunTask = new sfnTasks.LambdaInvoke(this, 'OmicsGetRunTask', {
       comment: "Get Omics workflow run details as 'OmicsRun'.",
@@ -173,32 +537,55 @@ export class WorkflowRunner extends Construct {
         AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
         OmicsRun: sfn.JsonPath.objectAt('$.OmicsRun'),
       }),
-      resultSelector: {
-        RunId: sfn.JsonPath.stringAt('$.Payload.RunId'),
-        RoleArn: sfn.JsonPath.stringAt('$.Payload.RoleArn'),
-        Status: sfn.JsonPath.stringAt('$.Payload.Status'),
-        StatusMessage: sfn.JsonPath.stringAt('$.Payload.StatusMessage'),
-        IsFinished: sfn.JsonPath.stringAt('$.Payload.IsFinished'),
-        IsError: sfn.JsonPath.stringAt('$.Payload.IsError'),
-        WorkflowType: sfn.JsonPath.stringAt('$.Payload.WorkflowType'),
-        WorkflowId: sfn.JsonPath.stringAt('$.Payload.WorkflowId'),
-        OutputUri: sfn.JsonPath.stringAt('$.Payload.OutputUri'),
-        Parameters: sfn.JsonPath.objectAt('$.Payload.Parameters'),
-        Name: sfn.JsonPath.stringAt('$.Payload.Name'),
-        Priority: sfn.JsonPath.stringAt('$.Payload.Priority'),
-        StorageCapacity: sfn.JsonPath.stringAt('$.Payload.StorageCapacity'),
-        Accelerators: sfn.JsonPath.stringAt('$.Payload.Accelerators'),
-        RunGroupId: sfn.JsonPath.stringAt('$.Payload.RunGroupId'),
-        LogLevel: sfn.JsonPath.stringAt('$.Payload.LogLevel'),
-        Tags: sfn.JsonPath.objectAt('$.Payload.Tags'),
-        StartedBy: sfn.JsonPath.stringAt('$.Payload.StartedBy'),
-        CreationTime: sfn.JsonPath.stringAt('$.Payload.CreationTime'),
-        StartTime: sfn.JsonPath.stringAt('$.Payload.StartTime'),
-        StopTime: sfn.JsonPath.stringAt('$.Payload.StopTime'),
-      },
+      resultSelector: omicsRunDetailsSelector,
       resultPath: '$.OmicsRun',
     });
 
+    // 解析を待ち行列に登録し、実行グループに空きができるまで待つタスク
+    // 振り分け処理が再開できない状態になっても待ち続けないよう、待機する時間の上限を設ける
+    const enqueueAnalysisTask = new sfnTasks.LambdaInvoke(this, 'EnqueueAnalysisTask', {
+      comment: 'Wait in analysis queue until run group capacity is available.',
+      lambdaFunction: enqueueAnalysisTaskFunction,
+      integrationPattern: sfn.IntegrationPattern.WAIT_FOR_TASK_TOKEN,
+      payload: sfn.TaskInput.fromObject({
+        TaskToken: sfn.JsonPath.taskToken,
+        AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
+        UserId: sfn.JsonPath.stringAt('$.UserId'),
+        Parameters: sfn.JsonPath.objectAt('$.OmicsStartRun'),
+      }),
+      taskTimeout: sfn.Timeout.duration(cdk.Duration.days(7)),
+      resultPath: sfn.JsonPath.DISCARD,
+    });
+
+    // ワークフロー実行が終了した解析を待ち行列から削除するタスク
+    const releaseAnalysisTask = new sfnTasks.LambdaInvoke(this, 'ReleaseAnalysisTask', {
+      comment: 'Release analysis from analysis queue.',
+      lambdaFunction: releaseAnalysisTaskFunction,
+      payload: sfn.TaskInput.fromObject({
+        AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
+        Parameters: sfn.JsonPath.objectAt('$.OmicsStartRun'),
+      }),
+      resultPath: sfn.JsonPath.DISCARD,
+    });
+
+    // ワークフローを開始できなかった解析を待ち行列から削除するタスク
+    const releaseFailedAnalysisTask = new sfnTasks.LambdaInvoke(this, 'ReleaseFailedAnalysisTask', {
+      comment: 'Release analysis which failed to start from analysis queue.',
+      lambdaFunction: releaseAnalysisTaskFunction,
+      payload: sfn.TaskInput.fromObject({
+        AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
+        Parameters: sfn.JsonPath.objectAt('$.OmicsStartRun'),
+      }),
+      resultPath: sfn.JsonPath.DISCARD,
+    });
+
+    // ワークフローを開始できなかった場合にステートマシンの実行を失敗とするタスク
+    const omicsStartRunFailedTask = new sfn.Fail(this, 'OmicsStartRunFailedTask', {
+      comment: 'Failed to start Omics workflow run.',
+      errorPath: '$.OmicsStartRunError.Error',
+      causePath: '$.OmicsStartRunError.Cause',
+    });
+
     // Omics のワークフローを実行するタスク
     const omicsStartRunTask = new sfnTasks.LambdaInvoke(this, 'OmicsStartRunTask', {
       comment: 'Start Omics workflow run.',
@@ -215,23 +602,39 @@ export class WorkflowRunner extends Construct {
         StatusMessage: sfn.JsonPath.stringAt('$.Payload.StatusMessage'),
         IsFinished: sfn.JsonPath.stringAt('$.Payload.IsFinished'),
         IsError: sfn.JsonPath.stringAt('$.Payload.IsError'),
+        NextWaitSeconds: sfn.JsonPath.numberAt('$.Payload.NextWaitSeconds'),
       },
       resultPath: '$.OmicsRun',
     });
 
-    // Omics ワークフローの実行完了を一定時間待つタスク
-    const waitAfterOmicsStartRunTask = new sfn.Wait(this, 'WaitAfterOmicsStartRunTask', {
-      comment: 'Wait for a few minutes for Omics workflow run to complete.',
-      time: sfn.WaitTime.duration(cdk.Duration.seconds(60)),
+    // Omics ワークフロー実行の完了を、実行状態の変更イベントによって再開されるまで待つタスク
+    // イベントを取りこぼした場合に備えて、`OmicsRun.NextWaitSeconds` の時間でタイムアウトさせて実行状態を確認する
+    const waitForOmicsRunTask = new sfnTasks.LambdaInvoke(this, 'WaitForOmicsRunTask', {
+      comment: 'Wait for Omics workflow run to finish until resumed by run status change event.',
+      lambdaFunction: registerRunTaskTokenTaskFunction,
+      integrationPattern: sfn.IntegrationPattern.WAIT_FOR_TASK_TOKEN,
+      payload: sfn.TaskInput.fromObject({
+        TaskToken: sfn.JsonPath.taskToken,
+        AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
+        OmicsRun: {
+          RunId: sfn.JsonPath.stringAt('$.OmicsRun.RunId'),
+        },
+      }),
+      taskTimeout: sfn.Timeout.at('$.OmicsRun.NextWaitSeconds'),
+      resultPath: sfn.JsonPath.DISCARD,
     });
 
     // Omics のワークフロー実行状態を取得するタスク
+    // 完了を待つ間は繰り返し実行されるため、ステートのサイズを抑えるよう実行状態だけを `OmicsRun` として出力する
     const omicsGetRunStatusTask = new sfnTasks.LambdaInvoke(this, 'OmicsGetRunStatusTask', {
       comment: "Get Omics run status as 'OmicsRun'.",
       lambdaFunction: omicsGetRunStatusTaskFunction,
       payload: sfn.TaskInput.fromObject({
         AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
-        OmicsRun: sfn.JsonPath.objectAt('$.OmicsRun'),
+        OmicsRun: {
+          RunId: sfn.JsonPath.stringAt('$.OmicsRun.RunId'),
+        },
+        StatusOnly: true,
       }),
       resultSelector: {
         RunId: sfn.JsonPath.stringAt('$.Payload.RunId'),
@@ -240,25 +643,62 @@ export class WorkflowRunner extends Construct {
         StatusMessage: sfn.JsonPath.stringAt('$.Payload.StatusMessage'),
         IsFinished: sfn.JsonPath.stringAt('$.Payload.IsFinished'),
         IsError: sfn.JsonPath.stringAt('$.Payload.IsError'),
-        WorkflowType: sfn.JsonPath.stringAt('$.Payload.WorkflowType'),
-        WorkflowId: sfn.JsonPath.stringAt('$.Payload.WorkflowId'),
-        OutputUri: sfn.JsonPath.stringAt('$.Payload.OutputUri'),
-        Parameters: sfn.JsonPath.objectAt('$.Payload.Parameters'),
-        Name: sfn.JsonPath.stringAt('$.Payload.Name'),
-        Priority: sfn.JsonPath.stringAt('$.Payload.Priority'),
-        StorageCapacity: sfn.JsonPath.stringAt('$.Payload.StorageCapacity'),
-        Accelerators: sfn.JsonPath.stringAt('$.Payload.Accelerators'),
-        RunGroupId: sfn.JsonPath.stringAt('$.Payload.RunGroupId'),
-        LogLevel: sfn.JsonPath.stringAt('$.Payload.LogLevel'),
-        Tags: sfn.JsonPath.objectAt('$.Payload.Tags'),
-        StartedBy: sfn.JsonPath.stringAt('$.Payload.StartedBy'),
-        CreationTime: sfn.JsonPath.stringAt('$.Payload.CreationTime'),
-        StartTime: sfn.JsonPath.stringAt('$.Payload.StartTime'),
-        StopTime: sfn.JsonPath.stringAt('$.Payload.StopTime'),
+        NextWaitSeconds: sfn.JsonPath.numberAt('$.Payload.NextWaitSeconds'),
       },
       resultPath: '$.OmicsRun',
     });
 
+    // 終了した Omics のワークフロー実行の詳細を、可視化と通知の前に 1 回だけ取得するタスク
+    const omicsGetFinishedRunTask = new sfnTasks.LambdaInvoke(this, 'OmicsGetFinishedRunTask', {
+      comment: "Get finished Omics workflow run details as 'OmicsRun'.",
+      lambdaFunction: omicsGetRunStatusTaskFunction,
+      payload: sfn.TaskInput.fromObject({
+        AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
+        OmicsRun: {
+          RunId: sfn.JsonPath.stringAt('$.OmicsRun.RunId'),
+        },
+      }),
+      resultSelector: omicsRunDetailsSelector,
+      resultPath: '$.OmicsRun',
+    });
+
+    // 終了したワークフロー実行の統計情報を、ストレージ容量の推奨のために記録し、使用量をユーザーとワークフローの集計値に加算するタスク
+    const recordRunStatisticsTask = new sfnTasks.LambdaInvoke(this, 'RecordRunStatisticsTask', {
+      comment: 'Record statistics and usage of finished Omics workflow run.',
+      lambdaFunction: recordRunStatisticsTaskFunction,
+      payload: sfn.TaskInput.fromObject({
+        AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
+        UserId: sfn.JsonPath.stringAt('$.UserId'),
+        OmicsRun: {
+          RunId: sfn.JsonPath.stringAt('$.OmicsRun.RunId'),
+        },
+      }),
+      resultPath: sfn.JsonPath.DISCARD,
+    });
+
+    // 終了したワークフロー実行の完了したタスクのログから、ツールの処理量の指標を取り出して保存するタスク
+    const mineTaskLogsTask = new sfnTasks.LambdaInvoke(this, 'MineTaskLogsTask', {
+      comment: "Extract throughput metrics from logs of completed tasks as 'TaskLogMetrics'.",
+      lambdaFunction: mineTaskLogsTaskFunction,
+      payload: sfn.TaskInput.fromObject({
+        AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
+        OmicsRun: {
+          RunId: sfn.JsonPath.stringAt('$.OmicsRun.RunId'),
+        },
+      }),
+      resultSelector: {
+        MinedTaskCount: sfn.JsonPath.numberAt('$.Payload.MinedTaskCount'),
+        RemainingTaskCount: sfn.JsonPath.numberAt('$.Payload.RemainingTaskCount'),
+        IsComplete: sfn.JsonPath.stringAt('$.Payload.IsComplete'),
+      },
+      resultPath: '$.TaskLogMetrics',
+    });
+
+    // 全ての完了したタスクのログを読み終えたかどうかをチェックするタスク
+    const checkTaskLogsMinedTask = new sfn.Choice(this, 'CheckTaskLogsMinedTask', {
+      comment: 'Are logs of all completed tasks mined?',
+    });
+
     // Omics のワークフロー実行が完了したかどうかをチェックするタスク
     const checkOmicsRunFinishedTask = new sfn.Choice(this, 'CheckOmicsRunFinishedTask', {
       comment: 'Is Omics workflow run finished?',
@@ -269,25 +709,90 @@ export class WorkflowRunner extends Construct {
       comment: 'Is Omics workflow run failed?',
     });
 
-    // 'Visualizer' がステートマシンの入力にあるかどうかをチェックするタスク
+    // 'Fingerprint' がステートマシンの入力にあるかどうかをチェックするタスク
+    const checkFingerprintTask = new sfn.Choice(this, 'CheckFingerprintTask', {
+      comment: "Is 'Fingerprint' present in the input?",
+    });
+
+    // 完了したワークフロー実行を、同じ指紋の解析で結果を再利用できるよう登録するタスク
+    const recordRunFingerprintTask = new sfnTasks.DynamoPutItem(this, 'RecordRunFingerprintTask', {
+      comment: 'Record completed Omics workflow run with its fingerprint for reuse.',
+      table: props.dynamoDb.runFingerprintsTable,
+      item: {
+        fingerprint: sfnTasks.DynamoAttributeValue.fromString(sfn.JsonPath.stringAt('$.Fingerprint')),
+        runId: sfnTasks.DynamoAttributeValue.fromString(sfn.JsonPath.stringAt('$.OmicsRun.RunId')),
+        workflowType: sfnTasks.DynamoAttributeValue.fromString(sfn.JsonPath.stringAt('$.OmicsRun.WorkflowType')),
+        workflowId: sfnTasks.DynamoAttributeValue.fromString(sfn.JsonPath.stringAt('$.OmicsRun.WorkflowId')),
+        analysisId: sfnTasks.DynamoAttributeValue.fromString(sfn.JsonPath.stringAt('$$.Execution.Id')),
+        completedAt: sfnTasks.DynamoAttributeValue.fromString(sfn.JsonPath.stringAt('$$.State.EnteredTime')),
+      },
+      resultPath: sfn.JsonPath.DISCARD,
+    });
+
+    // 'Visualizers' がステートマシンの入力にあるかどうかをチェックするタスク
     const checkVisualizerTask = new sfn.Choice(this, 'CheckVisualizerTask', {
-      comment: "Is 'Visualizer' present in the input?",
+      comment: "Is 'Visualizers' present in the input?",
     });
 
     // 可視化を実行する子ステートマシンを実行するタスク
     const visualizationTask = new StepFunctionsDynamicStateMachineExecutionTask(this, 'VisualizationTask', {
       comment: 'Start visualization of workflow run outputs with nested Step Functions state machine.',
       stateMachineArn: sfn.JsonPath.stringAt('$.Visualizer.StateMachineArn'),
-      name: sfn.JsonPath.format('{}-visualization', sfn.JsonPath.stringAt('$$.Execution.Name')),
+      name: sfn.JsonPath.format('{}-visualization-{}', sfn.JsonPath.stringAt('$$.Execution.Name'), sfn.JsonPath.stringAt('$.Index')),
       input: sfn.TaskInput.fromObject({
         AnalysisId: sfn.JsonPath.stringAt('$$.Execution.Id'),
         UserId: sfn.JsonPath.stringAt('$.UserId'),
         OmicsRun: sfn.JsonPath.objectAt('$.OmicsRun'),
         Visualizer: sfn.JsonPath.objectAt('$.Visualizer'),
       }),
+      resultSelector: {
+        ExecutionArn: sfn.JsonPath.stringAt('$.ExecutionArn'),
+        Status: sfn.JsonPath.stringAt('$.Status'),
+      },
       resultPath: '$.VisualizationResult',
     });
 
+    // 可視化の成功を記録するタスク
+    const visualizationSucceededTask = new sfn.Pass(this, 'VisualizationSucceededTask', {
+      comment: 'Record status of visualization.',
+      parameters: {
+        VisualizerId: sfn.JsonPath.stringAt('$.Visualizer.VisualizerId'),
+        Status: sfn.JsonPath.stringAt('$.VisualizationResult.Status'),
+        ExecutionArn: sfn.JsonPath.stringAt('$.VisualizationResult.ExecutionArn'),
+      },
+    });
+
+    // 可視化の失敗を記録するタスク (他の可視化は中断せずに続行する)
+    const visualizationFailedTask = new sfn.Pass(this, 'VisualizationFailedTask', {
+      comment: 'Record failure of visualization.',
+      parameters: {
+        VisualizerId: sfn.JsonPath.stringAt('$.Visualizer.VisualizerId'),
+        Status: 'FAILED',
+        Error: sfn.JsonPath.stringAt('$.VisualizationError.Error'),
+        Cause: sfn.JsonPath.stringAt('$.VisualizationError.Cause'),
+      },
+    });
+
+    // 指定された全ての可視化を並列に実行するタスク
+    const visualizationMapTask = new sfn.Map(this, 'VisualizationMapTask', {
+      comment: "Run all visualizers in 'Visualizers' concurrently and collect their status as 'VisualizationResults'.",
+      itemsPath: '$.Visualizers',
+      itemSelector: {
+        Index: sfn.JsonPath.stringAt('$$.Map.Item.Index'),
+        UserId: sfn.JsonPath.stringAt('$.UserId'),
+        OmicsRun: sfn.JsonPath.objectAt('$.OmicsRun'),
+        Visualizer: sfn.JsonPath.objectAt('$$.Map.Item.Value'),
+      },
+      resultPath: '$.VisualizationResults',
+    });
+    visualizationMapTask.itemProcessor(
+      visualizationTask
+      .addCatch(visualizationFailedTask, {
+        resultPath: '$.VisualizationError',
+      })
+      .next(visualizationSucceededTask)
+    );
+
     // 'Notification' がステートマシンの入力にあるかどうかをチェックするタスク
     const checkNotificationTask = new sfn.Choice(this, 'CheckNotificationTask', {
       comment: "Is 'Notification' present in the input?",
@@ -325,11 +830,10 @@ export class WorkflowRunner extends Construct {
       cause: '$.OmicsRun.StatusMessage',
     });
 
-    const stageName = cdk.Stage.of(this)?.stageName;
 
     // ワークフローの前処理や後処理を実行する Step Functions ステートマシンを作成する
     this.stateMachine = new sfn.StateMachine(this, 'StateMachine', {
-      stateMachineName: `${stageName ?? ''}OmicsWorkflowRunner`,
+      stateMachineName: stateMachineName,
       definition: checkOmicsStartRunTask
         .when(sfn.Condition.isNotPresent('$.OmicsStartRun'),
           checkOmicsRunTask
@@ -340,40 +844,91 @@ export class WorkflowRunner extends Construct {
           .otherwise(omicsWorkflowRunnerSucceedTask)
         )
         .otherwise(
-          omicsStartRunTask
-          .next(waitAfterOmicsStartRunTask)
+          enqueueAnalysisTask
+            // 待機がタイムアウトした場合や、実行グループが存在しない場合は、待ち行列から削除して失敗とする
+            .addCatch(releaseFailedAnalysisTask, {
+              resultPath: '$.OmicsStartRunError',
+            })
+          .next(omicsStartRunTask
+            // 実行グループやアカウントのクォータを超えた場合は、間隔を空けて再試行する
+            .addRetry({
+              errors: ['RunQuotaExceededError'],
+              interval: cdk.Duration.minutes(1),
+              backoffRate: 2,
+              maxAttempts: 8,
+            })
+            .addCatch(releaseFailedAnalysisTask
+              .next(omicsStartRunFailedTask), {
+              resultPath: '$.OmicsStartRunError',
+            })
+          )
+          .next(waitForOmicsRunTask
+            .addCatch(omicsGetRunStatusTask, {
+              errors: [sfn.Errors.TIMEOUT],
+              resultPath: sfn.JsonPath.DISCARD,
+            })
+          )
           .next(omicsGetRunStatusTask)
           .next(checkOmicsRunFinishedTask
             .when(sfn.Condition.booleanEquals('$.OmicsRun.IsFinished', false),
-              waitAfterOmicsStartRunTask
+              waitForOmicsRunTask
             )
             .otherwise(
-              checkOmicsRunFailedTask
-              .when(sfn.Condition.booleanEquals('$.OmicsRun.IsError', false),
-                checkVisualizerTask
-                .when(sfn.Condition.isPresent('$.Visualizer'),
-                  visualizationTask
-                )
-                .afterwards({
-                  includeOtherwise: true,
+              releaseAnalysisTask
+              .next(omicsGetFinishedRunTask)
+              .next(recordRunStatisticsTask
+                // 統計情報を記録できなくても、解析は続ける
+                .addCatch(mineTaskLogsTask, {
+                  resultPath: sfn.JsonPath.DISCARD,
                 })
-                .next(checkNotificationTask)
               )
-              .afterwards({
-                includeOtherwise: true,
-              })
-              .next(checkNotificationTask
-                .when(sfn.Condition.isPresent('$.Notification'),
-                  notificationTask
-                )
-                .afterwards({
-                  includeOtherwise: true,
+              .next(mineTaskLogsTask
+                // タスクのログから指標を取り出せなくても、解析は続ける
+                .addCatch(checkOmicsRunFailedTask, {
+                  resultPath: sfn.JsonPath.DISCARD,
                 })
-                .next(checkWorkflowRunnerFailedTask
-                  .when(sfn.Condition.booleanEquals('$.OmicsRun.IsError', true),
-                    omicsRunFailedTask
-                  ).otherwise(
-                    omicsWorkflowRunnerSucceedTask
+              )
+              .next(checkTaskLogsMinedTask
+                // Lambda 関数のタイムアウトまでに読み切れなかった場合は、続きのタスクのログを読む
+                .when(sfn.Condition.booleanEquals('$.TaskLogMetrics.IsComplete', false),
+                  mineTaskLogsTask
+                )
+                .otherwise(checkOmicsRunFailedTask
+                  .when(sfn.Condition.booleanEquals('$.OmicsRun.IsError', false),
+                    checkFingerprintTask
+                    .when(sfn.Condition.isPresent('$.Fingerprint'),
+                      recordRunFingerprintTask
+                    )
+                    .afterwards({
+                      includeOtherwise: true,
+                    })
+                    .next(checkVisualizerTask
+                      .when(sfn.Condition.isPresent('$.Visualizers'),
+                        visualizationMapTask
+                      )
+                      .afterwards({
+                        includeOtherwise: true,
+                      })
+                      .next(checkNotificationTask)
+                    )
+                  )
+                  .afterwards({
+                    includeOtherwise: true,
+                  })
+                  .next(checkNotificationTask
+                    .when(sfn.Condition.isPresent('$.Notification'),
+                      notificationTask
+                    )
+                    .afterwards({
+                      includeOtherwise: true,
+                    })
+                    .next(checkWorkflowRunnerFailedTask
+                      .when(sfn.Condition.booleanEquals('$.OmicsRun.IsError', true),
+                        omicsRunFailedTask
+                      ).otherwise(
+                        omicsWorkflowRunnerSucceedTask
+                      )
+                    )
                   )
                 )
               )
@@ -382,6 +937,7 @@ export class WorkflowRunner extends Construct {
         ),
       tracingEnabled: true, // AWS X-Ray によるトレースを有効化する
     });
+
   }
 }
 
@@ -119,6 +119,47 @@ export class OmicsAnalysisAppStack extends cdk.Stack {
     new cdk.CfnOutput(this, "DynamoDbRunVisualizationsTableName", {
       value: this.dynamoDb.runVisualizationsTable.tableName,
     });
+    // DynamoDB の RunTaskTokens テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbRunTaskTokensTableName", {
+      value: this.dynamoDb.runTaskTokensTable.tableName,
+    });
+    // DynamoDB の AnalysisBatches テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbAnalysisBatchesTableName", {
+      value: this.dynamoDb.analysisBatchesTable.tableName,
+    });
+    // DynamoDB の AnalysisQueue テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbAnalysisQueueTableName", {
+      value: this.dynamoDb.analysisQueueTable.tableName,
+    });
+    // DynamoDB の RunFingerprints テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbRunFingerprintsTableName", {
+      value: this.dynamoDb.runFingerprintsTable.tableName,
+    });
+
+    // DynamoDB の AnalysisIdempotency テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbAnalysisIdempotencyTableName", {
+      value: this.dynamoDb.analysisIdempotencyTable.tableName,
+    });
+
+    // DynamoDB の RunStatistics テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbRunStatisticsTableName", {
+      value: this.dynamoDb.runStatisticsTable.tableName,
+    });
+
+    // DynamoDB の RunCache テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbRunCacheTableName", {
+      value: this.dynamoDb.runCacheTable.tableName,
+    });
+
+    // DynamoDB の UsageRollups テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbUsageRollupsTableName", {
+      value: this.dynamoDb.usageRollupsTable.tableName,
+    });
+
+    // DynamoDB の RunTaskStates テーブルの名前を CloudFormation スタックの出力に追加
+    new cdk.CfnOutput(this, "DynamoDbRunTaskStatesTableName", {
+      value: this.dynamoDb.runTaskStatesTable.tableName,
+    });
 
     // Omics ワークフローを実行するための IAM ロールを作成する
     const omicsWorkflowRunRole = new iam.Role(this, 'OmicsWorkflowRunRole', {
@@ -183,6 +224,7 @@ export class OmicsAnalysisAppStack extends cdk.Stack {
     // ワークフローに後処理や後処理を追加するための Step Functions ステートマシンを作成
     this.workflowRunner = new WorkflowRunner(this, 'WorkflowRunner', {
       commonLayer: this.commonLayer,
+      dynamoDb: this.dynamoDb,
     });
     // ステートマシンの実行ロールの ARN を CloudFormation スタックの出力に追加
     new cdk.CfnOutput(this, "WorkflowRunnerStateMachineRoleArn", {
@@ -239,9 +281,15 @@ export class OmicsAnalysisAppStack extends cdk.Stack {
     // API Gateway に REST API の定義を追加
     this.apiGateway.addWorkflowsApi();
     this.apiGateway.addWorkflowVisualizersApi(this.dynamoDb);
+    this.apiGateway.addStorageRecommendationApi(this.dynamoDb);
+    this.apiGateway.addTaskRegressionsApi(this.dynamoDb);
     this.apiGateway.addStartAnalysisApi(s3BucketForOutput, omicsWorkflowRunRole, this.workflowRunner, this.dynamoDb);
-    this.apiGateway.addRunsApi();
-    this.apiGateway.addRunTasksApi();
+    this.apiGateway.addAnalysisBatchesApi(s3BucketForOutput, omicsWorkflowRunRole, this.workflowRunner, this.dynamoDb);
+    this.apiGateway.addRunsApi(this.dynamoDb);
+    this.apiGateway.addRunTasksApi(this.dynamoDb);
+    this.apiGateway.addRunAccountingApi(this.dynamoDb);
+    this.apiGateway.addTaskLogMetricsApi(this.dynamoDb);
+    this.apiGateway.addUsageApi(this.dynamoDb);
     this.apiGateway.addTaskLogApi();
     this.apiGateway.addRunOutputsApi();
     this.apiGateway.addDeleteRunApi();
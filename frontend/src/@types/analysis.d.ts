@@ -11,7 +11,7 @@ export type AnalysisSettings = {
   priority: number;
   workflowType: WorkflowType;
   workflow?: Workflow;
-  visualizer?: WorkflowVisualizer;
+  visualizers?: WorkflowVisualizer[];
 };
 
 export type Workflow = {
@@ -57,6 +57,26 @@ export type Analysis = {
   runId: string;
   workflowType: WorkflowType;
   workflowId: string;
+  progress?: RunProgress;
+  taskCounts?: RunTaskCounts;
+};
+
+/** ワークフロー実行の状態ごとのタスクの数 */
+export type RunTaskCounts = {
+  total: number;
+  pending: number;
+  running: number;
+  completed: number;
+  failed: number;
+  cancelled: number;
+};
+
+/** 同じワークフローの過去の実行から見積もった、実行中のワークフロー実行の進捗 */
+export type RunProgress = {
+  percentComplete: number;
+  estimatedRemainingSeconds?: number;
+  estimatedCompletionTime?: string;
+  sampleCount: number;
 };
 
 export type ParameterDescription = {
@@ -88,10 +108,13 @@ export type StartAnalysisParams = {
   priority?: number;
   requestId?: string;
   runId?: string;
-  storageCapacity?: number;
+  storageCapacity?: number | 'auto';
   workflowType?: WorkflowType;
   workflowId?: string;
   visualizerId?: string;
+  visualizerIds?: string[];
+  reuse?: 'OFF' | 'OFFER' | 'REUSE';
+  validateOnly?: boolean;
 };
 
 export type OutputItem = {
@@ -112,4 +135,36 @@ export type RunVisualization = {
   type: string;
   dashboardId?: string;
   pdbPath?: string;
+  structurePath?: string;
+  coarseStructurePath?: string;
+  modelName?: string;
+  rank?: number;
+  residueCount?: number;
+  meanPlddt?: number;
+  plddtQuantiles?: {
+    p05: number;
+    p25: number;
+    p50: number;
+    p75: number;
+    p95: number;
+  };
+  fractionPlddtVeryHigh?: number;
+  fractionPlddtConfident?: number;
+  fractionPlddtVeryLow?: number;
+  ptm?: number;
+  iptm?: number;
+  rankingConfidence?: number;
+  chains?: {
+    chainId: string;
+    residueCount: number;
+    meanPlddt: number;
+  }[];
+  paePath?: string;
+  maxPae?: number;
+  tileSize?: number;
+  levelCount?: number;
+  referenceModel?: string;
+  modelNames?: string[];
+  rmsd?: number[][];
+  comparisonPath?: string;
 };
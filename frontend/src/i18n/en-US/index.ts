@@ -39,6 +39,8 @@ export default {
           creationTime: 'Creation Time',
           startTime: 'Start Time',
           stopTime: 'Stop Time',
+          progress: 'Progress (estimated from {count} completed runs)',
+          estimatedCompletionTime: 'Estimated Completion Time',
         },
       },
       setting: {
@@ -51,7 +53,7 @@ export default {
           logLevel: 'Log Level',
           workflowType: 'Workflow Type',
           workflow: 'Workflow',
-          visualizer: 'Visualizer',
+          visualizer: 'Visualizers',
           s3output: 'S3 Output URI',
         },
       },
@@ -97,6 +99,8 @@ export default {
         },
         confirmation: {
           title: 'Confirmation',
+          reuseResults:
+            'Reuse results of a completed run with the same workflow and parameters',
         },
         btn: {
           continue: 'Continue',
@@ -108,12 +112,27 @@ export default {
           title: 'Confirmation',
           message: 'Do you want to run analysis?',
         },
+        reuseConfirmation: {
+          title: 'Reusable Results',
+          message:
+            'Run "{runName}" has already completed with the same workflow and parameters. Do you want to reuse its results instead of running the workflow again?',
+          reuse: 'Reuse',
+          run: 'Run Again',
+        },
       },
       loading: {
         message: 'Analysis will be running. Please wait...',
       },
       notice: {
         success: 'Analysis is running.',
+        reused: 'Analysis is reusing the results of a completed run.',
+      },
+      storageRecommendation: {
+        suggested:
+          'Recommended storage capacity is {capacity} GiB based on {count} completed runs of this workflow.',
+        autoFilled:
+          'Storage capacity was set to {capacity} GiB based on {count} completed runs of this workflow.',
+        apply: 'Apply',
       },
       error: {
         validationErrorMessage: 'Validation Error. Please check the parameters',
@@ -125,11 +144,14 @@ export default {
       listTableLabel: {
         status: 'Status',
         name: 'Name',
+        taskProgress: 'Task Progress',
         executionTime: 'Execution Time',
         creationTime: 'Creation Time',
         startTime: 'Start Time',
         stopTime: 'Stop Time',
       },
+      taskProgress:
+        '{completed} / {total} completed, {running} running, {failed} failed',
     },
     result: {
       title: 'Analysis Results',
@@ -145,12 +167,67 @@ export default {
           startTime: 'Start Time',
           stopTime: 'Stop Time',
         },
+        logMetrics: 'Tool metrics from the task log',
+      },
+      accounting: {
+        title: 'Resource Usage',
+        topTasks: 'Most expensive tasks',
+        disclaimer:
+          'Costs are estimated from resource usage and unit prices, and may differ from the actual bill.',
+        error: 'Failed to load resource usage.',
+        summary: {
+          cpuHours: 'vCPU hours',
+          memoryGiBHours: 'Memory GiB hours',
+          gpuHours: 'GPU hours',
+          storageGiBHours: 'Storage GiB hours',
+          idleHours: 'Storage idle hours',
+          computeCost: 'Estimated compute cost',
+          storageCost: 'Estimated storage cost',
+          totalCost: 'Estimated total cost',
+        },
+        listTableLabel: {
+          name: 'Task Name',
+          instanceType: 'Instance Type',
+          hours: 'Hours',
+          cpuHours: 'vCPU Hours',
+          memoryGiBHours: 'Memory GiB Hours',
+          estimatedCost: 'Estimated Cost',
+        },
       },
       dashboard: {
         title: 'Dashboard',
         notFoundError: 'Dashboard not generated.',
         otherError: 'An error occurred while embedding the dashboard.',
       },
+      structure: {
+        refine: 'Load all atoms',
+      },
+      pae: {
+        title: 'Predicted Aligned Error ({modelName})',
+        reset: 'Reset zoom',
+        hover: 'Scored residue {x}, aligned residue {y}: {pae} Å',
+      },
+      comparison: {
+        title: 'Model Comparison',
+        rmsd: 'Pairwise RMSD after superposition',
+        deviation: 'Per-residue deviation from {modelName}',
+        rmsf: 'RMSF',
+      },
+      confidence: {
+        title: 'Model Confidence',
+        listTableLabel: {
+          rank: 'Rank',
+          modelName: 'Model',
+          meanPlddt: 'Mean pLDDT',
+          plddtMedian: 'Median pLDDT',
+          fractionPlddtConfident: 'pLDDT >= 70',
+          fractionPlddtVeryLow: 'pLDDT < 50',
+          ptm: 'pTM',
+          iptm: 'ipTM',
+          rankingConfidence: 'Ranking Confidence',
+          chains: 'Chains',
+        },
+      },
       outputs: {
         title: 'Outputs',
         download: 'Download',
@@ -20,6 +20,15 @@ export type GetTasksResponse = {
   nextToken?: string;
 };
 
+export type GetTaskChangesResponse = {
+  /** 前回の取得以降に作成・変更されたタスク */
+  items: AnalysisTask[];
+  /** 次の取得で指定するカーソル */
+  cursor: string;
+  /** 実行が終了し、以降はタスクが変わらないかどうか */
+  isFinal: boolean;
+};
+
 export type GetTaskLogOption = {
   /** ログの取得順序 true:古いログから取得 false:新しいログから取得 */
   startFromHead?: boolean;
@@ -61,11 +70,90 @@ export type GetRunOutputsResponse = {
   NextContinuationToken?: string;
 };
 
+/** 同じワークフローを同じパラメーターで実行した、結果を再利用できる完了済みの実行 */
+export type ReusableRun = {
+  runId: string;
+  name?: string;
+  outputUri?: string;
+  stopTime?: string;
+};
+
 export type StartRunResponse = {
   arn: string;
   id: string;
   status: string;
   tags: { [key: string]: string };
+  /** `reuse: 'OFFER'` の場合に、再利用できる実行があれば返される (解析は開始されない) */
+  reusableRun?: ReusableRun;
+  /** `reuse: 'REUSE'` で結果を再利用した実行の ID */
+  reusedRunId?: string;
+};
+
+/** 同じワークフローの過去の実行から推奨するストレージ容量 */
+export type StorageRecommendation = {
+  /** 推奨するストレージ容量 (GiB) (完了済みの実行がなければ返されない) */
+  recommendedStorageCapacity?: number;
+  estimatedRequiredGiB?: number;
+  basis: 'INPUT_SIZE' | 'HISTORY' | 'NONE';
+  sampleCount: number;
+  inputBytes: number;
+};
+
+/** ワークフロー実行のリソースの使用量と費用の見積もり */
+export type RunAccounting = {
+  runId: string;
+  status: string;
+  /** 実行が終了しており、集計結果が今後変わらないか */
+  isFinal: boolean;
+  computedAt: string;
+  cached: boolean;
+  taskCount: number;
+  runHours: number;
+  cpuHours: number;
+  memoryGiBHours: number;
+  gpuHours: number;
+  storage: {
+    storageType?: string;
+    capacityGiB: number;
+    gibHours: number;
+    idleHours: number;
+    idleGiBHours: number;
+    estimatedIdleCost: number;
+  };
+  estimatedCost: {
+    compute: number;
+    storage: number;
+    total: number;
+    currency: string;
+    prices: { [key: string]: number };
+  };
+  /** 費用の見積もりが大きい順のタスク */
+  topTasks: (Pick<
+    AnalysisTask,
+    'taskId' | 'name' | 'status' | 'cpus' | 'memory'
+  > & {
+    gpus: number;
+    instanceType?: string;
+    hours: number;
+    cpuHours: number;
+    memoryGiBHours: number;
+    gpuHours: number;
+    estimatedCost: number;
+  })[];
+};
+
+/** タスクのログから取り出した、ツールの処理量の指標 */
+export type TaskLogMetrics = {
+  taskId: string;
+  name?: string;
+  /** ツールごとの指標 ({"bwa": {"readsPerSecond": 16523.5}}) */
+  metrics: { [tool: string]: { [metric: string]: number } };
+  eventCount: number;
+  truncated: boolean;
+};
+
+export type GetTaskLogMetricsResponse = {
+  items: TaskLogMetrics[];
 };
 
 export type GetWorkflowsResponse = {
@@ -130,12 +218,14 @@ const getWorkflowVisualizers = async (
 /**
  * ワークフローの実行一覧を取得
  * @param startingToken ページング処理用トークン
+ * @param includeTaskCounts 実行ごとの状態ごとのタスクの数を含めるかどうか
  * @returns 実行一覧
  */
-const getRuns = async (startingToken?: string) => {
+const getRuns = async (startingToken?: string, includeTaskCounts = false) => {
   const response = await api.get<GetRunsResponse>('/runs', {
     params: {
       ...(startingToken && { startingToken: startingToken }),
+      ...(includeTaskCounts && { includeTaskCounts: true }),
     },
   });
   return response.data;
@@ -180,13 +270,17 @@ const useAnalysis = () => {
 
     /**
      * ワークフローの実行一覧を全件取得(ページング処理込み)
+     * @param includeTaskCounts 実行ごとの状態ごとのタスクの数を含めるかどうか
      * @returns 実行一覧(全件)
      */
-    getAllRuns: async () => {
+    getAllRuns: async (includeTaskCounts = false) => {
       const items: Analysis[] = [];
       let startingToken: string | undefined = undefined;
       do {
-        const response: GetRunsResponse = await getRuns(startingToken);
+        const response: GetRunsResponse = await getRuns(
+          startingToken,
+          includeTaskCounts
+        );
         items.push(...response.items);
         startingToken = response.nextToken;
       } while (startingToken);
@@ -223,6 +317,26 @@ const useAnalysis = () => {
       } while (startingToken);
       return items;
     },
+
+    /**
+     * 指定された実行で、前回の取得以降に作成・変更されたタスクを取得
+     * @param runId 実行 ID
+     * @param since 前回のレスポンスに含まれるカーソル (省略した場合は全件)
+     * @returns 作成・変更されたタスクと次のカーソル
+     */
+    getTaskChanges: async (runId: string, since?: string) => {
+      const response =
+        await apiWithoutErrorHandling.get<GetTaskChangesResponse>(
+          `/runs/${runId}/tasks`,
+          {
+            params: {
+              since: since ?? '',
+            },
+          }
+        );
+      return response.data;
+    },
+
     /**
      * 指定されたタスクの実行ログを取得
      * @param runId 実行 ID
@@ -250,6 +364,37 @@ const useAnalysis = () => {
       return response.data;
     },
 
+    /**
+     * 指定された実行のタスクのログから取り出した指標を取得
+     * @param runId 実行 ID
+     * @returns タスクごとの指標 (取得できなければ空の一覧)
+     */
+    getTaskLogMetrics: async (runId: string) => {
+      try {
+        const response =
+          await apiWithoutErrorHandling.get<GetTaskLogMetricsResponse>(
+            `/runs/${runId}/task-log-metrics`
+          );
+        return response.data.items;
+      } catch (err) {
+        // 指標は補助的な情報のため、取得できなくてもエラー処理しない
+        console.error(err);
+        return [];
+      }
+    },
+
+    /**
+     * 指定された実行のリソースの使用量と費用の見積もりを取得
+     * @param runId 実行 ID
+     * @returns リソースの使用量と費用の見積もり
+     */
+    getRunAccounting: async (runId: string) => {
+      const response = await api.get<RunAccounting>(
+        `/runs/${runId}/accounting`
+      );
+      return response.data;
+    },
+
     /**
      * ワークフロー実行結果の出力ファイル一覧を取得
      * @param runId 実行 ID
@@ -362,6 +507,32 @@ const useAnalysis = () => {
       }
     },
 
+    /**
+     * 同じワークフローの過去の実行から、ストレージ容量の推奨を取得
+     * @param workflowType ワークフロー種別
+     * @param workflowId ワークフローID
+     * @param parameters 実行パラメーター (入力ファイルのサイズに応じて推奨する)
+     * @returns ストレージ容量の推奨 (取得できなければundefined)
+     */
+    getStorageRecommendation: async (
+      workflowType: WorkflowType,
+      workflowId: string,
+      parameters?: StartAnalysisParams['parameters']
+    ): Promise<StorageRecommendation | undefined> => {
+      try {
+        const response =
+          await apiWithoutErrorHandling.post<StorageRecommendation>(
+            `/workflows/${workflowType}/${workflowId}/storage-recommendation`,
+            { parameters }
+          );
+        return response.data;
+      } catch (err) {
+        // 推奨は補助的な情報のため、取得できなくてもエラー処理しない
+        console.error(err);
+        return undefined;
+      }
+    },
+
     getWorkflowVisualizers,
 
     /**
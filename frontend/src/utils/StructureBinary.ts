@@ -0,0 +1,129 @@
+/**
+ * 可視化の展開処理 (alphafold_structure.py) が出力するバイナリ形式の構造データのデコーダー
+ * ファイル全体は gzip 圧縮されているが、S3 から Content-Encoding: gzip で配信されるため、
+ * ブラウザが展開した状態のデータを受け取る
+ */
+
+const MAGIC = 'AFBS';
+const FORMAT_VERSION = 1;
+const HEADER_SIZE = 32;
+
+/** ヘッダーの flags: CA のみの粗視化モデル */
+const FLAG_COARSE = 0x1;
+/** ヘッダーの flags: 座標が直前の原子との差分で格納されている */
+const FLAG_DELTA_CODED = 0x2;
+
+/** 原子ごとのフラグ: HETATM レコード */
+const ATOM_FLAG_HETERO = 0x1;
+
+/** 3Dmol の `GLModel.addAtoms()` に渡す原子の定義 */
+export type StructureAtom = {
+  index: number;
+  serial: number;
+  x: number;
+  y: number;
+  z: number;
+  elem: string;
+  atom: string;
+  resn: string;
+  resi: number;
+  chain: string;
+  hetflag: boolean;
+  b: number;
+  bonds: number[];
+  bondOrder: number[];
+  properties: Record<string, unknown>;
+};
+
+export type Structure = {
+  coarse: boolean;
+  atoms: StructureAtom[];
+  /** 残基ごとの pLDDT */
+  residuePlddt: Float32Array;
+};
+
+/**
+ * バイナリ形式の構造データをデコードする
+ * @param buffer 構造データ
+ * @returns 原子の一覧と残基ごとの pLDDT
+ */
+export const decodeStructure = (buffer: ArrayBuffer): Structure => {
+  const view = new DataView(buffer);
+  const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+  const version = view.getUint16(4, true);
+  if (magic !== MAGIC || version !== FORMAT_VERSION) {
+    throw new Error('Unsupported structure format');
+  }
+
+  const flags = view.getUint16(6, true);
+  const atomCount = view.getUint32(8, true);
+  const residueCount = view.getUint32(12, true);
+  const stringBytes = view.getUint32(20, true);
+  const coordScale = view.getFloat32(24, true);
+
+  // 各セクションは 4 バイト境界に揃えて格納されている
+  let offset = HEADER_SIZE;
+  const section = <T extends ArrayBufferView>(
+    TypedArray: new (buffer: ArrayBuffer, offset: number, length: number) => T,
+    length: number
+  ): T => {
+    const value = new TypedArray(buffer, offset, length);
+    offset += Math.ceil(value.byteLength / 4) * 4;
+    return value;
+  };
+
+  const coords = section(Int32Array, atomCount * 3);
+  const atomResidue = section(Uint32Array, atomCount);
+  const residueSeq = section(Int32Array, residueCount);
+  const atomName = section(Uint16Array, atomCount);
+  const atomElement = section(Uint16Array, atomCount);
+  const residueName = section(Uint16Array, residueCount);
+  const residueChain = section(Uint16Array, residueCount);
+  const plddt = section(Uint16Array, residueCount);
+  const atomFlags = section(Uint8Array, atomCount);
+  const strings = new TextDecoder()
+    .decode(new Uint8Array(buffer, offset, stringBytes))
+    .split('\0');
+
+  const residuePlddt = Float32Array.from(plddt, (value) => value / 100);
+
+  const atoms: StructureAtom[] = new Array(atomCount);
+  let x = 0;
+  let y = 0;
+  let z = 0;
+  for (let i = 0; i < atomCount; i++) {
+    if (flags & FLAG_DELTA_CODED) {
+      x += coords[i * 3];
+      y += coords[i * 3 + 1];
+      z += coords[i * 3 + 2];
+    } else {
+      x = coords[i * 3];
+      y = coords[i * 3 + 1];
+      z = coords[i * 3 + 2];
+    }
+    const residue = atomResidue[i];
+    atoms[i] = {
+      index: i,
+      serial: i + 1,
+      x: x / coordScale,
+      y: y / coordScale,
+      z: z / coordScale,
+      elem: strings[atomElement[i]],
+      atom: strings[atomName[i]],
+      resn: strings[residueName[residue]],
+      resi: residueSeq[residue],
+      chain: strings[residueChain[residue]],
+      hetflag: (atomFlags[i] & ATOM_FLAG_HETERO) !== 0,
+      b: residuePlddt[residue],
+      bonds: [],
+      bondOrder: [],
+      properties: {},
+    };
+  }
+
+  return {
+    coarse: (flags & FLAG_COARSE) !== 0,
+    atoms,
+    residuePlddt,
+  };
+};
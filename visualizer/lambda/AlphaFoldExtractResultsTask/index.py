@@ -0,0 +1,21 @@
+import os
+
+import alphafold_extract_results
+
+# DynamoDB のテーブル名を環境変数から取得
+DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS = os.environ['DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS']
+
+
+# AlphaFold の実行結果の可視化を行う Step Functions タスクを実装した Lambda 関数のハンドラ
+# Glue ジョブの起動時間を避けるため、サイズの小さな実行結果の展開に利用する
+def handler(event, context):
+    runId = event['RunId']
+    outputUri = event['OutputUri']
+    visualizerId = event['VisualizerId']
+
+    return alphafold_extract_results.extract_results(
+        DYNAMODB_TABLE_NAME_RUN_VISUALIZATIONS,
+        runId,
+        outputUri,
+        visualizerId,
+    )
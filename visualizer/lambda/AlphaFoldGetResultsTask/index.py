@@ -0,0 +1,18 @@
+import alphafold_extract_results
+
+
+# AlphaFold の実行結果のサイズを取得する Step Functions タスクを実装した Lambda 関数のハンドラ
+# ステートマシンはこのサイズを元に、展開処理を Lambda 関数と Glue ジョブのどちらで実行するかを選択する
+def handler(event, context):
+    runId = event['RunId']
+    outputUri = event['OutputUri']
+
+    # 'out/prediction/results.tar.gz' に HEAD リクエストを送信してサイズを取得する
+    info = alphafold_extract_results.get_results_info(outputUri, runId)
+
+    return {
+        'Bucket': info['bucket'],
+        'Key': info['key'],
+        'ETag': info['eTag'],
+        'Size': info['size'],
+    }
@@ -0,0 +1,125 @@
+import os
+import numpy as np
+
+import alphafold_structure
+import alphafold_confidence
+
+# AlphaFold のモデル同士を重ね合わせ (Kabsch アルゴリズム)、RMSD と残基ごとのずれを求めるライブラリ
+#
+# 出力形式 (comparison.json)
+#   version, referenceModel, modelNames, rmsd ([[number]])
+#   residues    {chainId: [string], resSeq: [integer]}
+#   deviations  {modelName: [number]}  基準モデルに重ね合わせた後の残基ごとの距離 (Å)
+#   rmsf        [number]               全モデルを基準モデルに重ね合わせた後の残基ごとの揺らぎ (Å)
+
+FORMAT_VERSION = 1
+
+# JSON に出力する距離の小数点以下の桁数
+DISTANCE_DECIMALS = 2
+
+
+# 実行結果の PDB ファイルからモデルごとの代表原子 (CA、P) の座標を収集し、モデル同士を比較する
+class ModelComparison:
+    def __init__(self):
+        # モデル名 (または ranked_N) ごとの代表原子の座標、チェーン ID、残基番号
+        self.structures = {}
+
+    # PDB ファイルを解析した結果から代表原子の座標を取得する
+    def add_structure(self, memberName: str, atoms: dict):
+        fileName = os.path.splitext(os.path.basename(memberName))[0]
+        match = alphafold_confidence.PDB_MODEL_NAME.match(fileName)
+        if not match and not alphafold_confidence.PDB_RANKED_NAME.match(fileName):
+            return
+
+        # relaxed と unrelaxed があれば relaxed の座標を優先する
+        modelName = match.group(1) if match else fileName
+        if modelName in self.structures and not fileName.startswith('relaxed_'):
+            return
+
+        coarse = alphafold_structure.select_coarse_atoms(atoms)
+        self.structures[modelName] = {
+            'coords': coarse['coords'],
+            'chainId': coarse['chainId'],
+            'resSeq': coarse['resSeq'],
+        }
+
+    # モデル同士の RMSD の行列と、基準モデル (順位が最も高いモデル) に対する残基ごとのずれを求める
+    # order には ranking_debug.json に記録されたモデルの順位を渡す
+    def compare(self, order: list) -> dict:
+        structures = dict(self.structures)
+
+        # ranked_N.pdb は順位でモデル名に対応付ける
+        for rank, modelName in enumerate(order):
+            rankedName = f'ranked_{rank}'
+            if rankedName in structures:
+                structures.setdefault(modelName, structures[rankedName])
+            structures.pop(rankedName, None)
+        structures = {
+            modelName: structure for modelName, structure in structures.items()
+            if not alphafold_confidence.PDB_RANKED_NAME.match(modelName)
+        }
+
+        ranks = {modelName: rank for rank, modelName in enumerate(order)}
+        modelNames = sorted(structures.keys(), key=lambda modelName: (ranks.get(modelName, len(ranks)), modelName))
+        if len(modelNames) < 2:
+            return None
+
+        # 基準モデルと残基数が異なるモデルは比較できないため除外する
+        reference = structures[modelNames[0]]
+        modelNames = [
+            modelName for modelName in modelNames
+            if len(structures[modelName]['coords']) == len(reference['coords'])
+        ]
+        if len(modelNames) < 2:
+            return None
+
+        coords = np.stack([structures[modelName]['coords'] for modelName in modelNames])
+        rmsd = rmsd_matrix(coords)
+
+        # 全モデルを基準モデルに重ね合わせ、残基ごとの距離と揺らぎを求める
+        aligned, target = superpose(coords, np.broadcast_to(coords[0], coords.shape))
+        deviations = np.linalg.norm(aligned - target, axis=2)
+        rmsf = np.sqrt(((aligned - aligned.mean(axis=0)) ** 2).sum(axis=2).mean(axis=0))
+
+        return {
+            'version': FORMAT_VERSION,
+            'referenceModel': modelNames[0],
+            'modelNames': modelNames,
+            'rmsd': np.round(rmsd, DISTANCE_DECIMALS).tolist(),
+            'residues': {
+                'chainId': reference['chainId'].tolist(),
+                'resSeq': reference['resSeq'].tolist(),
+            },
+            'deviations': {
+                modelName: np.round(deviation, DISTANCE_DECIMALS).tolist()
+                for modelName, deviation in zip(modelNames, deviations)
+            },
+            'rmsf': np.round(rmsf, DISTANCE_DECIMALS).tolist(),
+        }
+
+
+# 座標の組 (P, N, 3) をまとめて重ね合わせ、重心を原点に移した mobile と target を返す
+# H = mobile^T target の特異値分解から回転行列を求め、鏡像にならないように行列式の符号で補正する
+def superpose(mobile: np.ndarray, target: np.ndarray) -> tuple:
+    mobile = mobile - mobile.mean(axis=1, keepdims=True)
+    target = target - target.mean(axis=1, keepdims=True)
+
+    u, _, vt = np.linalg.svd(np.matmul(mobile.transpose(0, 2, 1), target))
+    d = np.sign(np.linalg.det(np.matmul(u, vt)))
+    d[d == 0] = 1
+    u[:, :, 2] *= d[:, np.newaxis]
+
+    return np.matmul(mobile, np.matmul(u, vt)), target
+
+
+# モデルの座標 (M, N, 3) から、全てのモデルの組み合わせの RMSD の行列 (M, M) を求める
+def rmsd_matrix(coords: np.ndarray) -> np.ndarray:
+    modelCount = len(coords)
+    first, second = np.triu_indices(modelCount, k=1)
+    aligned, target = superpose(coords[first], coords[second])
+    values = np.sqrt(((aligned - target) ** 2).sum(axis=2).mean(axis=1))
+
+    rmsd = np.zeros((modelCount, modelCount))
+    rmsd[first, second] = values
+    rmsd[second, first] = values
+    return rmsd
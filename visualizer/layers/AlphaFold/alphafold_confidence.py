@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import pickle
+import io
+import numpy as np
+
+import alphafold_structure
+
+# AlphaFold の信頼度の指標 (pLDDT、pTM、ipTM) をモデルごとに集計するライブラリ
+
+# 集計する pLDDT のパーセンタイル
+PLDDT_QUANTILES = {
+    'p05': 5,
+    'p25': 25,
+    'p50': 50,
+    'p75': 75,
+    'p95': 95,
+}
+
+# AlphaFold が pLDDT の信頼度の区分として利用するしきい値
+PLDDT_VERY_HIGH = 90
+PLDDT_CONFIDENT = 70
+PLDDT_LOW = 50
+
+# pTM や ipTM を取得するために読み込む result_model_*.pkl の最大サイズ
+# (distogram などを含むため、これより大きなファイルは展開時に一時ファイルへ書き出してアップロードだけを行い、
+#  メモリに読み込むことも unpickle することもしない)
+RESULT_PICKLE_MAX_SIZE = 512 * 1024 * 1024
+
+# ファイル名からモデル名を取得するための正規表現
+PDB_MODEL_NAME = re.compile(r'^(?:un)?relaxed_(model_.+)$')
+PDB_RANKED_NAME = re.compile(r'^ranked_(\d+)$')
+RESULT_PICKLE_NAME = re.compile(r'^result_(model_.+)\.pkl$')
+
+# result_model_*.pkl の読み込みで許可する numpy の配列とスカラーの復元関数
+ALLOWED_PICKLE_GLOBALS = {
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', 'scalar'),
+}
+
+
+# numpy の配列以外のオブジェクトを復元しないように制限した Unpickler
+class _NumpyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in ALLOWED_PICKLE_GLOBALS:
+            raise pickle.UnpicklingError(f'{module}.{name} is not allowed')
+        return super().find_class(module, name)
+
+
+# 実行結果の各ファイルからモデルごとの信頼度を収集し、集計結果を返す
+class ConfidenceCollector:
+    def __init__(self):
+        # モデル名 (または ranked_N) ごとの残基単位のチェーン ID と pLDDT
+        self.residues = {}
+        # モデル名ごとの PDB ファイルのパス
+        self.pdbPaths = {}
+        # モデル名ごとの pTM、ipTM、ランキングに使われた信頼度
+        self.scores = {}
+        # ranking_debug.json に記録されたモデルの順位
+        self.order = []
+
+    # PDB ファイルを解析した結果から残基ごとの pLDDT を取得する
+    def add_structure(self, memberName: str, atoms: dict):
+        fileName = os.path.splitext(os.path.basename(memberName))[0]
+        match = PDB_MODEL_NAME.match(fileName)
+        modelName = match.group(1) if match else fileName
+        if not match and not PDB_RANKED_NAME.match(fileName):
+            return
+
+        # relaxed と unrelaxed の pLDDT は同じため、relaxed のパスを優先して記録する
+        if modelName not in self.pdbPaths or fileName.startswith('relaxed_'):
+            self.pdbPaths[modelName] = f'out/prediction/{memberName}'
+        if modelName not in self.residues:
+            residueStarts, atomResidue = alphafold_structure.get_residue_index(atoms)
+            self.residues[modelName] = (
+                atoms['chainId'][residueStarts],
+                alphafold_structure.get_residue_plddt(atoms, atomResidue, len(residueStarts)),
+            )
+
+    # ranking_debug.json からモデルの順位とランキングに使われた信頼度を取得する
+    def add_ranking_debug(self, body: bytes):
+        ranking = json.loads(body)
+        self.order = ranking.get('order') or []
+        # マルチマーは 'iptm+ptm'、モノマーは 'plddts' でランキングされる
+        for key in ['iptm+ptm', 'ptm', 'plddts']:
+            for modelName, value in (ranking.get(key) or {}).items():
+                self.scores.setdefault(modelName, {})['rankingConfidence'] = float(value)
+            if key in ranking:
+                break
+
+    # result_model_*.pkl から pTM と ipTM を取得する
+    # (読み込んだ内容は PAE の変換などにも利用できるように返す)
+    def add_result_pickle(self, memberName: str, body: bytes) -> dict:
+        match = RESULT_PICKLE_NAME.match(os.path.basename(memberName))
+        if not match or len(body) > RESULT_PICKLE_MAX_SIZE:
+            return None
+
+        try:
+            result = _NumpyUnpickler(io.BytesIO(body)).load()
+        except (pickle.UnpicklingError, EOFError, ValueError) as err:
+            print(f'Skip: failed to load {memberName}: {err}')
+            return None
+        if not isinstance(result, dict):
+            return None
+
+        scores = self.scores.setdefault(match.group(1), {})
+        for key, name in [('ptm', 'ptm'), ('iptm', 'iptm'), ('ranking_confidence', 'rankingConfidence')]:
+            if key in result:
+                scores[name] = float(np.asarray(result[key]))
+
+        return result
+
+    # 収集した情報からモデルごとの集計結果を作成する
+    def summaries(self) -> list:
+        # ranked_N.pdb は ranking_debug.json の順位でモデル名に対応付ける
+        ranks = {modelName: rank for rank, modelName in enumerate(self.order)}
+        for rank, modelName in enumerate(self.order):
+            rankedName = f'ranked_{rank}'
+            if rankedName in self.residues:
+                residues = self.residues.pop(rankedName)
+                self.residues.setdefault(modelName, residues)
+                self.pdbPaths[modelName] = self.pdbPaths.pop(rankedName)
+
+        summaries = []
+        for modelName, (chainIds, plddt) in self.residues.items():
+            scores = self.scores.get(modelName, {})
+            summaries.append({
+                'modelName': modelName,
+                **({'rank': ranks[modelName]} if modelName in ranks else {}),
+                'pdbPath': self.pdbPaths[modelName],
+                'residueCount': len(plddt),
+                **summarize_plddt(plddt),
+                **scores,
+                'chains': summarize_chains(chainIds, plddt),
+            })
+
+        return sorted(summaries, key=lambda summary: (summary.get('rank', len(ranks)), summary['modelName']))
+
+
+# 残基ごとの pLDDT から平均値、パーセンタイル、信頼度の区分ごとの割合を求める
+def summarize_plddt(plddt: np.ndarray) -> dict:
+    quantiles = np.percentile(plddt, list(PLDDT_QUANTILES.values()))
+    return {
+        'meanPlddt': float(plddt.mean()),
+        'plddtQuantiles': dict(zip(PLDDT_QUANTILES.keys(), quantiles.tolist())),
+        'fractionPlddtVeryHigh': float(np.mean(plddt >= PLDDT_VERY_HIGH)),
+        'fractionPlddtConfident': float(np.mean(plddt >= PLDDT_CONFIDENT)),
+        'fractionPlddtVeryLow': float(np.mean(plddt < PLDDT_LOW)),
+    }
+
+
+# チェーンごとの残基数と pLDDT の平均値を求める
+def summarize_chains(chainIds: np.ndarray, plddt: np.ndarray) -> list:
+    chains, inverse = np.unique(chainIds, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(chains))
+    means = np.bincount(inverse, weights=plddt, minlength=len(chains)) / np.maximum(counts, 1)
+    return [
+        {
+            'chainId': chainId,
+            'residueCount': int(count),
+            'meanPlddt': float(mean),
+        }
+        for chainId, count, mean in zip(chains.tolist(), counts, means)
+    ]
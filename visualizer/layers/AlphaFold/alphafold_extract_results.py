@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import mimetypes
+import numpy as np
+
+import visualizer_sdk
+import alphafold_structure
+import alphafold_confidence
+import alphafold_pae
+import alphafold_comparison
+
+# AlphaFold の実行結果を展開して可視化に登録する処理をまとめたライブラリ
+# Glue python shell ジョブと Lambda 関数の両方から利用する
+# S3 と DynamoDB へのアクセスは visualizer_sdk を経由するため、ローカルのディレクトリに対しても実行できる
+
+# AlphaFold の実行結果を格納したディレクトリ (実行結果の出力先からの相対パス)
+PREDICTION_PATH = 'out/prediction'
+
+# 展開の対象となるアーカイブ
+RESULTS_SELECTOR = visualizer_sdk.InputSelector(f'{PREDICTION_PATH}/results.tar.gz')
+
+# 展開済みのファイルを記録するマニフェストのファイル名
+MANIFEST_FILE_NAME = 'results.manifest.json'
+MANIFEST_VERSION = 1
+
+# 途中で失敗しても再開できるように、この数のファイルを処理するごとにマニフェストを保存する
+MANIFEST_FLUSH_INTERVAL = 50
+
+# メモリに読み込んで解析するファイルの最大サイズ
+# これより大きなファイルは一時ファイルを経由してアップロードだけ行い、解析しない
+MEMBER_MAX_MEMORY_SIZE = alphafold_confidence.RESULT_PICKLE_MAX_SIZE
+
+
+# 'out/prediction/results.tar.gz' の圧縮後のサイズと ETag を取得する (アーカイブの内容は読まない)
+def get_results_info(outputUri: str, runId: str) -> dict:
+    bucket, rootPrefix = visualizer_sdk.parse_s3_uri(outputUri)
+    storage = visualizer_sdk.create_storage()
+    [results] = RESULTS_SELECTOR.select(storage, bucket, visualizer_sdk.join_key(rootPrefix, runId))
+    return {
+        'bucket': bucket,
+        'key': results['key'],
+        'eTag': results['eTag'],
+        'size': results['size'],
+    }
+
+
+# AlphaFold の実行結果を展開し、可視化の対象となるファイルを RunVisualizations テーブルに登録する
+def extract_results(tableName: str, runId: str, outputUri: str, visualizerId: str) -> dict:
+    with visualizer_sdk.VisualizerJob(tableName, runId, outputUri, visualizerId) as job:
+        return _extract_results(job)
+
+
+def _extract_results(job: visualizer_sdk.VisualizerJob) -> dict:
+    manifestPath = f'{PREDICTION_PATH}/{MANIFEST_FILE_NAME}'
+
+    # 'out/prediction/results.tar.gz' の ETag を取得し、前回の実行で記録したマニフェストと比較する
+    [results] = job.select(RESULTS_SELECTOR)
+    archive = {
+        'key': results['key'],
+        'eTag': results['eTag'],
+        'size': results['size'],
+    }
+    manifest = load_manifest(job, manifestPath)
+    if manifest.get('archive') != archive:
+        # アーカイブが更新されていれば、記録済みのファイルは内容の一致を確認してから再利用する
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'archive': archive,
+            'members': manifest.get('members', {}),
+            'completed': False,
+        }
+    elif manifest.get('completed'):
+        # 同じアーカイブの展開が完了済みであれば、ダウンロードせずに終了する
+        print(f"Skip: s3://{job.bucket}/{results['key']} has already been extracted")
+        return {
+            'Skipped': True,
+            'Uploaded': 0,
+            'Registered': 0,
+        }
+
+    members = manifest['members']
+    records = manifest.setdefault('records', {})
+    confidence = alphafold_confidence.ConfidenceCollector()
+    comparison = alphafold_comparison.ModelComparison()
+    # モデル名ごとの量子化した PAE の行列と最大値
+    paeMatrices = {}
+    processedCount = 0
+    uploadedCount = 0
+    registeredCount = 0
+
+    # 'out/prediction/results.tar.gz' をストリーミングで解凍する
+    for _, stream in job.read([results]):
+        for member in visualizer_sdk.read_tar_members(stream, maxMemorySize=MEMBER_MAX_MEMORY_SIZE):
+            memberName = member['name']
+            body = member['body']
+            entry = {
+                'size': member['size'],
+                'sha256': member['sha256'],
+            }
+            memberPath = f'{PREDICTION_PATH}/{memberName}'
+
+            recorded = members.get(memberName) or {}
+            isSameContent = recorded.get('size') == entry['size'] and recorded.get('sha256') == entry['sha256']
+            if not isSameContent and not recorded:
+                # マニフェストを保存する前に中断した場合に備えて、アップロード済みのファイルのメタデータも確認する
+                isSameContent = is_uploaded(job, memberPath, entry)
+
+            if not isSameContent:
+                # 解凍したファイルをアップロードする
+                contentType, contentEncoding = mimetypes.guess_type(memberName)
+                # 一時ファイルに書き出したファイルは、次のファイルに進む前に書き込みを完了させる
+                put = job.put if body is not None else job.put_now
+                put(
+                    memberPath,
+                    body if body is not None else member['file'],
+                    contentType=contentType,
+                    contentEncoding=contentEncoding,
+                    metadata={
+                        'sha256': entry['sha256'],
+                    },
+                )
+                uploadedCount += 1
+
+            # ファイルの拡張子が .pdb であれば、3Dmol による可視化の対象として登録する
+            fileName, ext = os.path.splitext(memberName)
+            if body is None:
+                # メモリに読み込まなかったファイルは解析しない
+                print(f'Skip: {memberName} ({member["size"]} bytes) is too large to analyze')
+
+            elif ext.lower() == '.pdb':
+                visualizationId = f'{job.visualizerId}_{fileName}'
+                structurePath = f'{PREDICTION_PATH}/{fileName}.structure.bin'
+                coarseStructurePath = f'{PREDICTION_PATH}/{fileName}.coarse.bin'
+
+                # 信頼度の集計のため、内容が変わっていなくても PDB ファイルは毎回解析する
+                atoms = alphafold_structure.parse_pdb(body)
+                confidence.add_structure(memberName, atoms)
+                comparison.add_structure(memberName, atoms)
+
+                if not isSameContent or recorded.get('structurePath') != structurePath:
+                    # ブラウザで高速に読み込めるように、全原子モデルと粗視化モデルのバイナリを生成してアップロードする
+                    structure, coarseStructure = alphafold_structure.encode_atoms(atoms)
+                    for path, data in [(structurePath, structure), (coarseStructurePath, coarseStructure)]:
+                        job.put(
+                            path,
+                            data,
+                            contentType='application/octet-stream',
+                            contentEncoding='gzip',
+                        )
+
+                if not isSameContent or recorded.get('visualizationId') != visualizationId or recorded.get('structurePath') != structurePath:
+                    # PDB ファイルとバイナリファイルのパスを登録する
+                    job.register(visualizationId, {
+                        'type': '3Dmol',
+                        'pdbPath': memberPath,
+                        'structurePath': structurePath,
+                        'coarseStructurePath': coarseStructurePath,
+                    })
+                    registeredCount += 1
+                entry['visualizationId'] = visualizationId
+                entry['structurePath'] = structurePath
+
+            elif os.path.basename(memberName) == 'ranking_debug.json':
+                confidence.add_ranking_debug(body)
+
+            elif alphafold_pae.PAE_JSON_NAME.match(os.path.basename(memberName)):
+                # PAE は pae_model_*.json を優先し、なければ result_model_*.pkl の値を使う
+                modelName = alphafold_pae.PAE_JSON_NAME.match(os.path.basename(memberName)).group(1)
+                matrix, maxPae = alphafold_pae.load_pae_json(body)
+                paeMatrices[modelName] = (alphafold_pae.quantize(matrix, maxPae), maxPae)
+
+            elif ext.lower() == '.pkl':
+                result = confidence.add_result_pickle(memberName, body)
+                if result and 'predicted_aligned_error' in result:
+                    modelName = alphafold_confidence.RESULT_PICKLE_NAME.match(os.path.basename(memberName)).group(1)
+                    matrix = np.asarray(result['predicted_aligned_error'], dtype=np.float32)
+                    maxPae = float(np.asarray(result.get('max_predicted_aligned_error', matrix.max())))
+                    paeMatrices.setdefault(modelName, (alphafold_pae.quantize(matrix, maxPae), maxPae))
+
+            members[memberName] = entry
+
+            processedCount += 1
+            if processedCount % MANIFEST_FLUSH_INTERVAL == 0:
+                # 書き込みと登録が完了したファイルだけがマニフェストに記録されるようにする
+                job.checkpoint()
+                save_manifest(job, manifestPath, manifest)
+
+    # モデルごとの信頼度の集計結果を、内容が変わったものだけ登録する
+    for summary in confidence.summaries():
+        visualizationId = f'{job.visualizerId}_confidence_{summary["modelName"]}'
+        item = {
+            'runId': job.runId,
+            'visualizationId': visualizationId,
+            'type': 'AlphaFoldConfidence',
+            **summary,
+        }
+        checksum = hashlib.sha256(json.dumps(item, sort_keys=True).encode('utf-8')).hexdigest()
+        if records.get(visualizationId) != checksum:
+            job.register(visualizationId, item)
+            records[visualizationId] = checksum
+            registeredCount += 1
+
+    # モデルごとの PAE をタイルに変換し、内容が変わったものだけアップロードして登録する
+    ranks = {modelName: rank for rank, modelName in enumerate(confidence.order)}
+    for modelName, (quantized, maxPae) in paeMatrices.items():
+        if register_pae(job, modelName, quantized, maxPae, ranks.get(modelName), records):
+            registeredCount += 1
+
+    # モデル同士の比較結果を、内容が変わった場合だけアップロードして登録する
+    if register_comparison(job, comparison.compare(confidence.order), records):
+        registeredCount += 1
+
+    # 全てのファイルを処理したら、完了したことをマニフェストに記録する
+    job.checkpoint()
+    manifest['completed'] = True
+    save_manifest(job, manifestPath, manifest)
+
+    return {
+        'Skipped': False,
+        'Uploaded': uploadedCount,
+        'Registered': registeredCount,
+    }
+
+
+# 量子化した PAE の行列をタイルのピラミッドに変換してアップロードし、可視化として登録する
+# 前回と同じ内容であれば何もせずに False を返す
+def register_pae(job: visualizer_sdk.VisualizerJob, modelName: str, quantized, maxPae: float, rank: int, records: dict) -> bool:
+    visualizationId = f'{job.visualizerId}_pae_{modelName}'
+    paePrefix = f'{PREDICTION_PATH}/pae/{modelName}'
+    item = {
+        'runId': job.runId,
+        'visualizationId': visualizationId,
+        'type': 'AlphaFoldPAE',
+        'modelName': modelName,
+        **({'rank': rank} if rank is not None else {}),
+        'paePath': f'{paePrefix}/pae.json',
+        'residueCount': int(quantized.shape[0]),
+        'maxPae': maxPae,
+        'tileSize': alphafold_pae.TILE_SIZE,
+    }
+    checksum = hashlib.sha256(
+        json.dumps(item, sort_keys=True).encode('utf-8') + hashlib.sha256(quantized.tobytes()).digest()
+    ).hexdigest()
+    if records.get(visualizationId) == checksum:
+        return False
+
+    levels, tiles = alphafold_pae.build_pyramid(quantized)
+    for level, row, col, data in tiles:
+        job.put(
+            alphafold_pae.get_tile_path(paePrefix, level, row, col),
+            data,
+            contentType='application/octet-stream',
+            contentEncoding='gzip',
+        )
+
+    # タイルを全てアップロードしてからインデックスを書き込む
+    job.writer.flush()
+    job.put_now(
+        f'{paePrefix}/pae.json',
+        json.dumps(alphafold_pae.build_index(quantized, maxPae, levels)).encode('utf-8'),
+        contentType='application/json',
+    )
+    job.register(visualizationId, {
+        **item,
+        'levelCount': len(levels),
+    })
+    records[visualizationId] = checksum
+    return True
+
+
+# モデル同士の比較結果をアップロードし、可視化として登録する
+# RMSD の行列は DynamoDB に、サイズの大きい残基ごとのずれは S3 の JSON ファイルに格納する
+def register_comparison(job: visualizer_sdk.VisualizerJob, result: dict, records: dict) -> bool:
+    if not result:
+        return False
+
+    visualizationId = f'{job.visualizerId}_comparison'
+    comparisonPath = f'{PREDICTION_PATH}/comparison.json'
+    body = json.dumps(result).encode('utf-8')
+    checksum = hashlib.sha256(body).hexdigest()
+    if records.get(visualizationId) == checksum:
+        return False
+
+    job.put(
+        comparisonPath,
+        body,
+        contentType='application/json',
+    )
+    job.register(visualizationId, {
+        'type': 'ModelComparison',
+        'referenceModel': result['referenceModel'],
+        'modelNames': result['modelNames'],
+        'rmsd': result['rmsd'],
+        'residueCount': len(result['rmsf']),
+        'comparisonPath': comparisonPath,
+    })
+    records[visualizationId] = checksum
+    return True
+
+
+# マニフェストを読み込む (存在しなければ空のマニフェストを返す)
+def load_manifest(job: visualizer_sdk.VisualizerJob, path: str) -> dict:
+    body = job.read_bytes(path)
+    if body is None:
+        return {}
+
+    manifest = json.loads(body)
+    return manifest if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+# マニフェストを保存する
+def save_manifest(job: visualizer_sdk.VisualizerJob, path: str, manifest: dict):
+    job.put_now(
+        path,
+        json.dumps(manifest).encode('utf-8'),
+        contentType='application/json',
+    )
+
+
+# 指定したパスに同じ内容のファイルがアップロード済みかどうかを、オブジェクトのメタデータで確認する
+def is_uploaded(job: visualizer_sdk.VisualizerJob, path: str, entry: dict) -> bool:
+    head = job.head(path)
+    return bool(head) and head['size'] == entry['size'] and head['metadata'].get('sha256') == entry['sha256']
+
+
+# ローカルのディレクトリを S3 の代わりに使って展開処理を実行する (検証やベンチマーク用)
+#   python alphafold_extract_results.py --local-root ./data --output-uri s3://bucket/prefix --run-id 1234567
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract AlphaFold results against a local directory.')
+    parser.add_argument('--local-root', required=True)
+    parser.add_argument('--output-uri', required=True)
+    parser.add_argument('--run-id', required=True)
+    parser.add_argument('--visualizer-id', default='local')
+    parser.add_argument('--table-name', default='RunVisualizations')
+    args = parser.parse_args()
+
+    os.environ[visualizer_sdk.LOCAL_ROOT_ENV] = args.local_root
+    print(json.dumps(extract_results(args.table_name, args.run_id, args.output_uri, args.visualizer_id)))
+    sys.exit(0)
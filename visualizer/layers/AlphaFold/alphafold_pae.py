@@ -0,0 +1,97 @@
+import re
+import gzip
+import json
+import numpy as np
+
+# AlphaFold の PAE (predicted aligned error) の行列を、ブラウザで拡大縮小しながら表示できる
+# 多解像度のタイルに変換するライブラリ
+#
+# 出力形式
+#   インデックス ({prefix}/pae.json)
+#     version, size (残基数), tileSize, maxPae, levels ([{level, size, scale}])
+#   タイル ({prefix}/{level}/{row}_{col}.bin、全体を gzip で圧縮する)
+#     u8[height * width]  PAE / maxPae x 255 を行優先で格納する
+#     (右端と下端のタイルは、そのレベルの行列の大きさに合わせて小さくなる)
+#   level 0 が元の解像度で、level が 1 増えるごとに縦横を 1/2 に縮小する (2x2 の平均)
+
+FORMAT_VERSION = 1
+
+# タイルの一辺の大きさ
+TILE_SIZE = 256
+
+# 量子化後の最大値
+QUANTIZED_MAX = 255
+
+# ファイル名からモデル名を取得するための正規表現
+PAE_JSON_NAME = re.compile(r'^pae_(model_.+)\.json$')
+
+
+# pae_model_*.json から PAE の行列と最大値を取得する
+def load_pae_json(body: bytes) -> tuple:
+    pae = json.loads(body)
+    # AlphaFold DB と同じく、リストの先頭要素に格納されている
+    if isinstance(pae, list):
+        pae = pae[0]
+    matrix = np.asarray(pae['predicted_aligned_error'], dtype=np.float32)
+    maxPae = float(pae.get('max_predicted_aligned_error') or matrix.max())
+    return matrix, maxPae
+
+
+# PAE の行列を 0 から 255 の整数に量子化する
+def quantize(matrix: np.ndarray, maxPae: float) -> np.ndarray:
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(f'PAE matrix must be square: {matrix.shape}')
+    scaled = np.clip(matrix, 0, maxPae) * (QUANTIZED_MAX / maxPae if maxPae > 0 else 0)
+    return np.rint(scaled).astype(np.uint8)
+
+
+# 行列を縦横 1/2 に縮小する (奇数の場合は最後の行と列を複製して揃える)
+def downsample(matrix: np.ndarray) -> np.ndarray:
+    size = matrix.shape[0]
+    if size % 2:
+        matrix = np.pad(matrix, ((0, 1), (0, 1)), mode='edge')
+    blocks = matrix.astype(np.uint16).reshape(matrix.shape[0] // 2, 2, matrix.shape[1] // 2, 2)
+    return ((blocks.sum(axis=(1, 3)) + 2) // 4).astype(np.uint8)
+
+
+# 量子化した行列からタイルのピラミッドを生成する
+# 行列全体が 1 枚のタイルに収まるまで縮小を繰り返す
+def build_pyramid(quantized: np.ndarray, tileSize: int = TILE_SIZE) -> tuple:
+    levels = []
+    tiles = []
+    matrix = quantized
+    level = 0
+    while True:
+        size = matrix.shape[0]
+        levels.append({
+            'level': level,
+            'size': size,
+            'scale': 2 ** level,
+        })
+        for row in range(0, size, tileSize):
+            for col in range(0, size, tileSize):
+                tile = np.ascontiguousarray(matrix[row:row + tileSize, col:col + tileSize])
+                tiles.append((level, row // tileSize, col // tileSize, gzip.compress(tile.tobytes())))
+
+        if size <= tileSize:
+            break
+        matrix = downsample(matrix)
+        level += 1
+
+    return levels, tiles
+
+
+# タイルの格納先のパスを返す
+def get_tile_path(prefix: str, level: int, row: int, col: int) -> str:
+    return f'{prefix}/{level}/{row}_{col}.bin'
+
+
+# ピラミッドのインデックスを作成する
+def build_index(quantized: np.ndarray, maxPae: float, levels: list, tileSize: int = TILE_SIZE) -> dict:
+    return {
+        'version': FORMAT_VERSION,
+        'size': int(quantized.shape[0]),
+        'tileSize': tileSize,
+        'maxPae': maxPae,
+        'levels': levels,
+    }
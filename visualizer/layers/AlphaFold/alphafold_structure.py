@@ -0,0 +1,198 @@
+import gzip
+import struct
+import numpy as np
+
+# AlphaFold が出力した PDB ファイルを解析し、ブラウザで高速に読み込めるバイナリ形式に変換するライブラリ
+#
+# バイナリ形式 (リトルエンディアン、全体を gzip で圧縮する)
+#   ヘッダー (32 バイト)
+#     magic 'AFBS', version (u16), flags (u16), atomCount (u32), residueCount (u32),
+#     stringCount (u32), stringBytes (u32), coordScale (f32), reserved (u32)
+#   以下のセクションを 4 バイト境界に揃えて順に格納する
+#     coords        i32[atomCount * 3]  座標 x coordScale (FLAG_DELTA_CODED の場合は直前の原子との差分)
+#     atomResidue   u32[atomCount]      原子が属する残基のインデックス
+#     residueSeq    i32[residueCount]   残基番号
+#     atomName      u16[atomCount]      原子名 (文字列テーブルのインデックス)
+#     atomElement   u16[atomCount]      元素記号 (文字列テーブルのインデックス)
+#     residueName   u16[residueCount]   残基名 (文字列テーブルのインデックス)
+#     residueChain  u16[residueCount]   チェーン ID (文字列テーブルのインデックス)
+#     residuePlddt  u16[residueCount]   残基ごとの pLDDT x 100
+#     atomFlags     u8[atomCount]       ATOM_FLAG_* の論理和
+#     strings       u8[stringBytes]     NUL 区切りの UTF-8 文字列テーブル
+
+MAGIC = b'AFBS'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHIIIIfI')
+
+# ヘッダーの flags
+FLAG_COARSE = 0x1
+FLAG_DELTA_CODED = 0x2
+
+# 原子ごとのフラグ
+ATOM_FLAG_HETERO = 0x1
+
+# 座標の量子化単位 (PDB の座標は小数点以下 3 桁のため、1000 倍しても精度は失われない)
+COORD_SCALE = 1000.0
+
+# 粗視化モデルで残す原子名 (タンパク質は CA、核酸は P)
+COARSE_ATOM_NAMES = ['CA', 'P']
+
+# PDB の固定長カラムの定義 (0 始まり、終端を含まない)
+PDB_LINE_WIDTH = 80
+PDB_COLUMNS = {
+    'record': (0, 6),
+    'atomName': (12, 16),
+    'resName': (17, 20),
+    'chainId': (21, 22),
+    'resSeq': (22, 26),
+    'iCode': (26, 27),
+    'x': (30, 38),
+    'y': (38, 46),
+    'z': (46, 54),
+    'bFactor': (60, 66),
+    'element': (76, 78),
+}
+
+
+# PDB ファイルの ATOM/HETATM レコードを列ごとの配列に変換する
+# 行を固定長の文字配列に揃え、カラム単位でまとめて数値化する
+def parse_pdb(body: bytes) -> dict:
+    lines = [
+        line.ljust(PDB_LINE_WIDTH)[:PDB_LINE_WIDTH]
+        for line in body.splitlines()
+        if line.startswith(b'ATOM  ') or line.startswith(b'HETATM')
+    ]
+    if not lines:
+        raise ValueError('PDB file has no ATOM or HETATM records')
+
+    chars = np.frombuffer(b''.join(lines), dtype='S1').reshape(len(lines), PDB_LINE_WIDTH)
+
+    def column(name):
+        start, end = PDB_COLUMNS[name]
+        return np.ascontiguousarray(chars[:, start:end]).view(f'S{end - start}').ravel()
+
+    def text(name):
+        return np.char.strip(np.char.decode(column(name), 'ascii'))
+
+    coords = np.stack([column('x'), column('y'), column('z')], axis=1).astype(np.float64)
+    bFactors = np.char.strip(column('bFactor'))
+    elements = text('element')
+    atomNames = text('atomName')
+
+    # 元素記号が省略されている場合は原子名の先頭文字で補う
+    missingElements = elements == ''
+    elements[missingElements] = np.char.lstrip(atomNames[missingElements], '0123456789').astype('U1')
+
+    return {
+        'coords': coords,
+        'atomName': atomNames,
+        'element': elements,
+        'resName': text('resName'),
+        'chainId': text('chainId'),
+        'resSeq': column('resSeq').astype(np.int32),
+        'iCode': text('iCode'),
+        'bFactor': np.where(bFactors == b'', b'0', bFactors).astype(np.float64),
+        'hetero': column('record') == b'HETATM',
+    }
+
+
+# 原子の配列から残基の境界を求める (チェーン ID、残基番号、挿入コードのいずれかが変化した位置で区切る)
+def get_residue_index(atoms: dict) -> tuple:
+    atomCount = len(atoms['resSeq'])
+    changed = np.ones(atomCount, dtype=bool)
+    changed[1:] = (
+        (atoms['chainId'][1:] != atoms['chainId'][:-1])
+        | (atoms['resSeq'][1:] != atoms['resSeq'][:-1])
+        | (atoms['iCode'][1:] != atoms['iCode'][:-1])
+    )
+    residueStarts = np.flatnonzero(changed)
+    atomResidue = np.cumsum(changed) - 1
+    return residueStarts, atomResidue
+
+
+# 残基ごとの pLDDT を求める (AlphaFold は B-factor 列に pLDDT を出力する)
+def get_residue_plddt(atoms: dict, atomResidue: np.ndarray, residueCount: int) -> np.ndarray:
+    sums = np.bincount(atomResidue, weights=atoms['bFactor'], minlength=residueCount)
+    counts = np.bincount(atomResidue, minlength=residueCount)
+    return sums / np.maximum(counts, 1)
+
+
+# 粗視化モデル用に、各残基の代表原子 (CA、P、なければ先頭の原子) だけを残す
+def select_coarse_atoms(atoms: dict) -> dict:
+    residueStarts, atomResidue = get_residue_index(atoms)
+    residueCount = len(residueStarts)
+
+    isRepresentative = np.isin(atoms['atomName'], COARSE_ATOM_NAMES)
+    representative = residueStarts.copy()
+    candidates = np.flatnonzero(isRepresentative)
+    # 同じ残基に複数の候補があれば先頭の原子を採用する
+    _, first = np.unique(atomResidue[candidates], return_index=True)
+    representative[atomResidue[candidates[first]]] = candidates[first]
+
+    # 粗視化モデルでも残基ごとの pLDDT は全原子から求めた値を保持する
+    plddt = get_residue_plddt(atoms, atomResidue, residueCount)
+    selected = {key: value[representative] for key, value in atoms.items()}
+    selected['bFactor'] = plddt
+    return selected
+
+
+# 原子の配列をバイナリ形式にエンコードする
+def encode_structure(atoms: dict, coarse: bool = False) -> bytes:
+    residueStarts, atomResidue = get_residue_index(atoms)
+    atomCount = len(atomResidue)
+    residueCount = len(residueStarts)
+
+    # 文字列をテーブルにまとめ、各カラムをインデックスに置き換える
+    strings, inverse = np.unique(
+        np.concatenate([
+            atoms['atomName'],
+            atoms['element'],
+            atoms['resName'][residueStarts],
+            atoms['chainId'][residueStarts],
+        ]),
+        return_inverse=True,
+    )
+    if len(strings) > np.iinfo(np.uint16).max:
+        raise ValueError('Too many distinct names in structure')
+    inverse = inverse.astype('<u2')
+    atomName, atomElement, residueName, residueChain = np.split(
+        inverse, np.cumsum([atomCount, atomCount, residueCount])
+    )
+
+    # 座標を量子化し、直前の原子との差分に変換して圧縮率を上げる
+    coords = np.rint(atoms['coords'] * COORD_SCALE).astype('<i4')
+    coords[1:] -= coords[:-1].copy()
+
+    plddt = get_residue_plddt(atoms, atomResidue, residueCount)
+    stringTable = '\0'.join(strings.tolist()).encode('utf-8')
+
+    flags = FLAG_DELTA_CODED | (FLAG_COARSE if coarse else 0)
+    sections = [
+        HEADER.pack(MAGIC, FORMAT_VERSION, flags, atomCount, residueCount, len(strings), len(stringTable), COORD_SCALE, 0),
+        coords.tobytes(),
+        atomResidue.astype('<u4').tobytes(),
+        atoms['resSeq'][residueStarts].astype('<i4').tobytes(),
+        atomName.tobytes(),
+        atomElement.tobytes(),
+        residueName.tobytes(),
+        residueChain.tobytes(),
+        np.clip(np.rint(plddt * 100), 0, 10000).astype('<u2').tobytes(),
+        np.where(atoms['hetero'], ATOM_FLAG_HETERO, 0).astype('u1').tobytes(),
+        stringTable,
+    ]
+
+    # 各セクションを 4 バイト境界に揃えて連結する
+    return gzip.compress(b''.join(
+        section + b'\0' * (-len(section) % 4)
+        for section in sections
+    ))
+
+
+# 解析済みの原子の配列から全原子モデルと粗視化モデルのバイナリを生成する
+def encode_atoms(atoms: dict) -> tuple:
+    return encode_structure(atoms), encode_structure(select_coarse_atoms(atoms), coarse=True)
+
+
+# PDB ファイルから全原子モデルと粗視化モデルのバイナリを生成する
+def encode_pdb(body: bytes) -> tuple:
+    return encode_atoms(parse_pdb(body))
@@ -0,0 +1,488 @@
+import os
+import json
+import time
+import fnmatch
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import threading
+import boto3
+import botocore
+
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+# ワークフローの実行結果を可視化するジョブ (Glue python shell ジョブや Lambda 関数) の共通処理をまとめたライブラリ
+#
+#   InputSelector    実行結果の出力先 (`{outputUri}/{runId}/`) からの相対パスで入力ファイルを宣言的に指定する
+#   read_objects     選択したファイルを順に開く
+#   read_tar_members アーカイブをストリーミングで解凍し、メンバーの内容とチェックサムを順に返す
+#   ParallelWriter   同時に処理中の書き込み数に上限を設けて、ファイルを並列にアップロードする
+#   BatchRegistrar   可視化の登録を 25 件ずつまとめて DynamoDB に書き込む
+#   VisualizerJob    上記をまとめ、1 回の実行結果の可視化を行う
+#
+# 環境変数 VISUALIZER_SDK_LOCAL_ROOT を設定すると、S3 と DynamoDB の代わりにローカルのディレクトリを利用する
+# (`{root}/{bucket}/{key}` をオブジェクト、`{root}/.registrations/{tableName}.json` を登録先として扱う)
+# 同じコードを AWS に接続せずに実行できるため、可視化の処理の検証やベンチマークに利用できる
+
+LOCAL_ROOT_ENV = 'VISUALIZER_SDK_LOCAL_ROOT'
+
+# 並列に書き込むスレッド数の既定値
+DEFAULT_MAX_WORKERS = 8
+
+# メモリに読み込まないメンバーを一時ファイルに書き出す際の読み込み単位 (バイト)
+TAR_COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# DynamoDB の BatchWriteItem で一度に書き込める最大件数
+BATCH_WRITE_MAX_ITEMS = 25
+
+# BatchWriteItem で書き込まれなかった項目を再試行する回数と待ち時間 (秒)
+BATCH_WRITE_MAX_RETRIES = 8
+BATCH_WRITE_BACKOFF_SECONDS = 0.1
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+# S3 の URI をバケット名とキーに分割する
+def parse_s3_uri(uri: str) -> tuple:
+    if not uri.startswith('s3://'):
+        raise ValueError(f'Invalid S3 URI: {uri}')
+    bucket, *keys = uri[len('s3://'):].split('/', 1)
+    return bucket, keys[0] if keys else ''
+
+
+# キーのプレフィックスとパスを `/` で連結する
+def join_key(*parts: str) -> str:
+    return '/'.join(part.strip('/') for part in parts if part and part.strip('/'))
+
+
+# `dict` を DynamoDB の低レベル API で書き込める形式に変換する (浮動小数点数は Decimal に変換する)
+def serialize_item(item: dict) -> dict:
+    def convert(value):
+        if isinstance(value, float):
+            return Decimal(str(round(value, 6)))
+        elif isinstance(value, dict):
+            return {key: convert(child) for key, child in value.items()}
+        elif isinstance(value, list):
+            return [convert(child) for child in value]
+        else:
+            return value
+
+    return {
+        key: _serializer.serialize(convert(value))
+        for key, value in item.items()
+    }
+
+
+# DynamoDB の低レベル API の形式から `dict` に変換する
+def deserialize_item(item: dict) -> dict:
+    return {
+        key: _deserializer.deserialize(value)
+        for key, value in item.items()
+    }
+
+
+# オブジェクトの保存先として S3 を利用する
+class S3Storage:
+    def __init__(self, client=None):
+        self.client = client or boto3.client('s3')
+
+    # オブジェクトのサイズ、ETag、メタデータを返す (存在しなければ None を返す)
+    def head(self, bucket: str, key: str) -> dict:
+        try:
+            response = self.client.head_object(Bucket=bucket, Key=key)
+            return {
+                'key': key,
+                'size': response['ContentLength'],
+                'eTag': response['ETag'],
+                'metadata': response.get('Metadata', {}),
+            }
+
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] in ['404', 'NoSuchKey']:
+                return None
+            raise
+
+    # プレフィックスに一致するオブジェクトの一覧を返す
+    def list(self, bucket: str, prefix: str):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for content in page.get('Contents') or []:
+                yield {
+                    'key': content['Key'],
+                    'size': content['Size'],
+                    'eTag': content['ETag'],
+                }
+
+    # オブジェクトをストリームとして開く (eTag を指定した場合は、内容が変わっていればエラーにする)
+    def open(self, bucket: str, key: str, eTag: str = None):
+        response = self.client.get_object(Bucket=bucket, Key=key, **({'IfMatch': eTag} if eTag else {}))
+        return response['Body']
+
+    # オブジェクトの内容を読み込む (存在しなければ None を返す)
+    def read(self, bucket: str, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    # オブジェクトを書き込む (body にはバイト列か、読み込み可能なファイルを指定する)
+    def put(self, bucket: str, key: str, body: bytes, contentType: str = None, contentEncoding: str = None, metadata: dict = None):
+        self.client.put_object(
+            Body=body,
+            Bucket=bucket,
+            Key=key,
+            **({'ContentType': contentType} if contentType else {}),
+            **({'ContentEncoding': contentEncoding} if contentEncoding else {}),
+            **({'Metadata': metadata} if metadata else {}),
+        )
+
+
+# オブジェクトの保存先としてローカルのディレクトリを利用する (S3 の代わり)
+# メタデータは `{root}/.metadata/{bucket}/{key}.json` に保存する
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def _metadata_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, '.metadata', bucket, *key.split('/')) + '.json'
+
+    def head(self, bucket: str, key: str) -> dict:
+        path = self._path(bucket, key)
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        metadata = {}
+        if os.path.isfile(self._metadata_path(bucket, key)):
+            with open(self._metadata_path(bucket, key)) as file:
+                metadata = json.load(file)
+        return {
+            'key': key,
+            'size': stat.st_size,
+            # 内容を読まずに変更を検知できるように、サイズと更新時刻から ETag を生成する
+            'eTag': f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+            'metadata': metadata,
+        }
+
+    def list(self, bucket: str, prefix: str):
+        bucketRoot = os.path.join(self.root, bucket)
+        for directory, _, fileNames in os.walk(bucketRoot):
+            for fileName in sorted(fileNames):
+                key = os.path.relpath(os.path.join(directory, fileName), bucketRoot).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    yield self.head(bucket, key)
+
+    def open(self, bucket: str, key: str, eTag: str = None):
+        head = self.head(bucket, key)
+        if head is None:
+            raise FileNotFoundError(f'{bucket}/{key}')
+        if eTag and head['eTag'] != eTag:
+            raise ValueError(f'{bucket}/{key} has been modified')
+        return open(self._path(bucket, key), 'rb')
+
+    def read(self, bucket: str, key: str) -> bytes:
+        if self.head(bucket, key) is None:
+            return None
+        with open(self._path(bucket, key), 'rb') as file:
+            return file.read()
+
+    def put(self, bucket: str, key: str, body: bytes, contentType: str = None, contentEncoding: str = None, metadata: dict = None):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書き込み途中のファイルが読まれないように、一時ファイルに書き込んでから置き換える
+        with open(f'{path}.{threading.get_ident()}.tmp', 'wb') as file:
+            if hasattr(body, 'read'):
+                shutil.copyfileobj(body, file)
+            else:
+                file.write(body)
+        os.replace(f'{path}.{threading.get_ident()}.tmp', path)
+
+        metadataPath = self._metadata_path(bucket, key)
+        if metadata:
+            os.makedirs(os.path.dirname(metadataPath), exist_ok=True)
+            with open(metadataPath, 'w') as file:
+                json.dump(metadata, file)
+        elif os.path.isfile(metadataPath):
+            os.remove(metadataPath)
+
+
+# 可視化の登録先として DynamoDB を利用する
+class DynamoDbRegistry:
+    def __init__(self, client=None):
+        self.client = client or boto3.client('dynamodb')
+
+    # 項目をまとめて書き込む (書き込まれなかった項目は待ち時間を増やしながら再試行する)
+    def put_items(self, tableName: str, items: list):
+        requests = [{'PutRequest': {'Item': serialize_item(item)}} for item in items]
+        for attempt in range(BATCH_WRITE_MAX_RETRIES + 1):
+            response = self.client.batch_write_item(RequestItems={tableName: requests})
+            requests = (response.get('UnprocessedItems') or {}).get(tableName) or []
+            if not requests:
+                return
+            time.sleep(BATCH_WRITE_BACKOFF_SECONDS * 2 ** attempt)
+
+        raise RuntimeError(f'Failed to write {len(requests)} items to {tableName}')
+
+
+# 可視化の登録先としてローカルの JSON ファイルを利用する (DynamoDB の代わり)
+# 項目は keys に指定した属性の組み合わせで上書きする
+class LocalRegistry:
+    def __init__(self, root: str, keys: tuple = ('runId', 'visualizationId')):
+        self.root = root
+        self.keys = keys
+        self.lock = threading.Lock()
+
+    def _path(self, tableName: str) -> str:
+        return os.path.join(self.root, '.registrations', f'{tableName}.json')
+
+    # 登録済みの項目の一覧を返す
+    def get_items(self, tableName: str) -> list:
+        path = self._path(tableName)
+        if not os.path.isfile(path):
+            return []
+        with open(path) as file:
+            return json.load(file)
+
+    def put_items(self, tableName: str, items: list):
+        with self.lock:
+            registered = {
+                tuple(item.get(key) for key in self.keys): item
+                for item in self.get_items(tableName)
+            }
+            for item in items:
+                # DynamoDB と同じ値が読み出せるように、一度変換してから保存する
+                item = deserialize_item(serialize_item(item))
+                registered[tuple(item.get(key) for key in self.keys)] = item
+
+            os.makedirs(os.path.dirname(self._path(tableName)), exist_ok=True)
+            with open(self._path(tableName), 'w') as file:
+                json.dump(list(registered.values()), file, default=str, indent=2)
+
+
+# 環境変数の設定に応じて、S3 またはローカルのディレクトリを返す
+def create_storage():
+    localRoot = os.environ.get(LOCAL_ROOT_ENV)
+    return LocalStorage(localRoot) if localRoot else S3Storage()
+
+
+# 環境変数の設定に応じて、DynamoDB またはローカルの JSON ファイルを返す
+def create_registry():
+    localRoot = os.environ.get(LOCAL_ROOT_ENV)
+    return LocalRegistry(localRoot) if localRoot else DynamoDbRegistry()
+
+
+# 実行結果の出力先からの相対パスで、可視化の入力となるファイルを指定する
+# パターンに `*` や `?` を含む場合はプレフィックス配下を一覧してから絞り込み、含まない場合は HEAD で確認する
+class InputSelector:
+    def __init__(self, pattern: str, required: bool = True):
+        self.pattern = pattern.strip('/')
+        self.required = required
+
+    # 指定されたパターンに一致するファイルの一覧を返す (パスは実行結果の出力先からの相対パス)
+    def select(self, storage, bucket: str, rootKey: str) -> list:
+        if not any(char in self.pattern for char in '*?['):
+            head = storage.head(bucket, join_key(rootKey, self.pattern))
+            objects = [head] if head else []
+        else:
+            # ワイルドカードを含まない部分をプレフィックスとして一覧する
+            staticPrefix = self.pattern.split('*')[0].split('?')[0].split('[')[0]
+            objects = [
+                obj for obj in storage.list(bucket, join_key(rootKey, staticPrefix))
+                if fnmatch.fnmatchcase(obj['key'][len(rootKey) + 1:], self.pattern)
+            ]
+
+        if self.required and not objects:
+            raise FileNotFoundError(f's3://{bucket}/{join_key(rootKey, self.pattern)} not found')
+
+        return [
+            {
+                **obj,
+                'path': obj['key'][len(rootKey) + 1:] if rootKey else obj['key'],
+            }
+            for obj in objects
+        ]
+
+
+# 選択したファイルを順に開き、ファイルの情報とストリームの組を返す
+def read_objects(storage, bucket: str, objects: list):
+    for obj in objects:
+        stream = storage.open(bucket, obj['key'], obj.get('eTag'))
+        try:
+            yield obj, stream
+        finally:
+            stream.close()
+
+
+# アーカイブをストリーミングで解凍し、メンバーごとに名前、内容、サイズと SHA-256 のチェックサムを返す
+# maxMemorySize を超えるメンバーはメモリに読み込まずに一時ファイルに書き出し、'body' の代わりに 'file' で返す
+# (一時ファイルは次のメンバーに進むと削除されるため、それまでに読み終える必要がある)
+def read_tar_members(stream, maxMemorySize: int = None):
+    with tarfile.open(fileobj=stream, mode='r|*') as archive:
+        for member in archive:
+            memberName = os.path.normpath(member.name)
+            if memberName == '.' or not member.isfile():
+                continue
+
+            if maxMemorySize is not None and member.size > maxMemorySize:
+                with tempfile.TemporaryFile() as file:
+                    digest = hashlib.sha256()
+                    source = archive.extractfile(member)
+                    for chunk in iter(lambda: source.read(TAR_COPY_CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                        file.write(chunk)
+                    file.seek(0)
+                    yield {
+                        'name': memberName,
+                        'body': None,
+                        'file': file,
+                        'size': member.size,
+                        'sha256': digest.hexdigest(),
+                    }
+                continue
+
+            body = archive.extractfile(member).read()
+            yield {
+                'name': memberName,
+                'body': body,
+                'size': len(body),
+                'sha256': hashlib.sha256(body).hexdigest(),
+            }
+
+
+# 同時に処理中の書き込み数に上限を設けて、ファイルを並列に書き込む
+# 上限に達すると put() は空きができるまで待つため、メモリ上に保持する内容の量も抑えられる
+class ParallelWriter:
+    def __init__(self, storage, maxWorkers: int = DEFAULT_MAX_WORKERS, maxPending: int = None):
+        self.storage = storage
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.slots = threading.BoundedSemaphore(maxPending or maxWorkers * 2)
+        self.futures = []
+        self.count = 0
+
+    # 書き込みを予約する (エラーは flush() で送出する)
+    def put(self, bucket: str, key: str, body: bytes, **options):
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self.storage.put, bucket, key, body, **options)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        self.count += 1
+
+    # 予約済みの書き込みが全て完了するまで待つ
+    def flush(self):
+        futures, self.futures = self.futures, []
+        errors = [future.exception() for future in futures]
+        errors = [error for error in errors if error]
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+# 可視化の登録を BATCH_WRITE_MAX_ITEMS 件ずつまとめて書き込む
+class BatchRegistrar:
+    def __init__(self, registry, tableName: str):
+        self.registry = registry
+        self.tableName = tableName
+        self.pending = {}
+        self.count = 0
+
+    # 登録を予約する (同じ可視化 ID の項目は後から追加したもので上書きする)
+    def add(self, item: dict):
+        self.pending[(item['runId'], item['visualizationId'])] = item
+        self.count += 1
+        if len(self.pending) >= BATCH_WRITE_MAX_ITEMS:
+            self.flush()
+
+    # 予約済みの登録を全て書き込む
+    def flush(self):
+        items = list(self.pending.values())
+        self.pending = {}
+        for start in range(0, len(items), BATCH_WRITE_MAX_ITEMS):
+            self.registry.put_items(self.tableName, items[start:start + BATCH_WRITE_MAX_ITEMS])
+
+
+# 1 回のワークフローの実行結果を可視化するジョブ
+# `with` で利用し、ブロックを抜けると予約済みの書き込みと登録を全て完了させる
+class VisualizerJob:
+    def __init__(self, tableName: str, runId: str, outputUri: str, visualizerId: str, storage=None, registry=None, maxWorkers: int = DEFAULT_MAX_WORKERS):
+        self.runId = runId
+        self.visualizerId = visualizerId
+        self.storage = storage or create_storage()
+        self.writer = ParallelWriter(self.storage, maxWorkers=maxWorkers)
+        self.registrar = BatchRegistrar(registry or create_registry(), tableName)
+
+        # 実行結果は `{outputUri}/{runId}/` 配下に出力される
+        self.bucket, rootPrefix = parse_s3_uri(outputUri)
+        self.rootKey = join_key(rootPrefix, runId)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.checkpoint()
+            self.writer.close()
+        else:
+            # 失敗した場合も書き込み中のファイルは完了させるが、エラーは元の例外を優先する
+            try:
+                self.writer.close()
+            except Exception as err:
+                print(f'Error: failed to complete pending writes: {err}')
+        return False
+
+    # 実行結果の出力先からの相対パスを S3 のキーに変換する
+    def key(self, path: str) -> str:
+        return join_key(self.rootKey, path)
+
+    # 入力ファイルを選択する
+    def select(self, selector: InputSelector) -> list:
+        return selector.select(self.storage, self.bucket, self.rootKey)
+
+    # 選択したファイルを順に開く
+    def read(self, objects: list):
+        return read_objects(self.storage, self.bucket, objects)
+
+    # ファイルの情報を取得する
+    def head(self, path: str) -> dict:
+        return self.storage.head(self.bucket, self.key(path))
+
+    # ファイルの内容を読み込む (存在しなければ None を返す)
+    def read_bytes(self, path: str) -> bytes:
+        return self.storage.read(self.bucket, self.key(path))
+
+    # ファイルの書き込みを予約する
+    def put(self, path: str, body: bytes, **options):
+        self.writer.put(self.bucket, self.key(path), body, **options)
+
+    # ファイルをすぐに書き込む (マニフェストなど、書き込みの順序が重要なファイルに利用する)
+    def put_now(self, path: str, body: bytes, **options):
+        self.storage.put(self.bucket, self.key(path), body, **options)
+
+    # 可視化の登録を予約する
+    def register(self, visualizationId: str, item: dict):
+        self.registrar.add({
+            'runId': self.runId,
+            'visualizationId': visualizationId,
+            **item,
+        })
+
+    # 予約済みの書き込みと登録を全て完了させる (途中経過を記録する前に呼び出す)
+    def checkpoint(self):
+        self.writer.flush()
+        self.registrar.flush()